@@ -1,4 +1,5 @@
-from typing import Optional
+import threading
+from typing import Any, Dict, Optional
 
 from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Engine, make_url
@@ -37,17 +38,31 @@ def ensure_database_exists(db_url: str) -> None:
             engine.dispose()
 
 
+def engine_options(db_url: str, secondary: bool = False) -> Dict[str, Any]:
+    """Pool settings for an engine; SQLite keeps SQLAlchemy's own defaults."""
+
+    options: Dict[str, Any] = {"pool_pre_ping": True, "future": True}
+    if make_url(db_url).get_backend_name() == "sqlite":
+        return options
+    suffix = "2" if secondary else ""
+    options.update(
+        pool_size=getattr(Config, f"DB_POOL_SIZE{suffix}"),
+        max_overflow=getattr(Config, f"DB_MAX_OVERFLOW{suffix}"),
+        pool_recycle=getattr(Config, f"DB_POOL_RECYCLE{suffix}"),
+        pool_timeout=getattr(Config, f"DB_POOL_TIMEOUT{suffix}"),
+    )
+    return options
+
+
 RAW_DB_URL = Config.DATABASE_URL or build_mysql_url()
 RAW_DB_URL_SECONDARY = Config.DATABASE_URL2 or build_mysql_url_secondary()
 
-ensure_database_exists(RAW_DB_URL)
-if RAW_DB_URL_SECONDARY:
-    ensure_database_exists(RAW_DB_URL_SECONDARY)
-
-ENGINE = create_engine(RAW_DB_URL, pool_pre_ping=True, future=True)
+ENGINE = create_engine(RAW_DB_URL, **engine_options(RAW_DB_URL))
 SessionLocal = sessionmaker(bind=ENGINE, autoflush=False, autocommit=False, future=True)
 ENGINE_SECONDARY = (
-    create_engine(RAW_DB_URL_SECONDARY, pool_pre_ping=True, future=True)
+    create_engine(
+        RAW_DB_URL_SECONDARY, **engine_options(RAW_DB_URL_SECONDARY, secondary=True)
+    )
     if RAW_DB_URL_SECONDARY
     else None
 )
@@ -59,12 +74,41 @@ SessionLocalSecondary = (
 HAS_SECONDARY = ENGINE_SECONDARY is not None
 
 
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+
+def schema_ready() -> bool:
+    return _schema_ready
+
+
 def init_db() -> None:
-    """Create database tables if they do not exist."""
+    """Create the databases and tables if they do not exist.
 
-    # Import inside function so models can depend on Base without circular imports.
-    from . import models  # noqa: F401
+    Runs once per process; concurrent callers wait for the first one.
+    Nothing connects to the database until this (or a query) runs.
+    """
 
-    Base.metadata.create_all(bind=ENGINE)
-    if ENGINE_SECONDARY is not None:
-        Base.metadata.create_all(bind=ENGINE_SECONDARY)
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+
+        # Import inside function so models can depend on Base without circular imports.
+        from . import models  # noqa: F401
+
+        ensure_database_exists(RAW_DB_URL)
+        Base.metadata.create_all(bind=ENGINE)
+        if ENGINE_SECONDARY is not None:
+            ensure_database_exists(RAW_DB_URL_SECONDARY)
+            Base.metadata.create_all(bind=ENGINE_SECONDARY)
+
+        if Config.PARTITIONING_ENABLED:
+            from .partitions import manage_partitions
+
+            manage_partitions(ENGINE)
+            if ENGINE_SECONDARY is not None:
+                manage_partitions(ENGINE_SECONDARY)
+        _schema_ready = True
@@ -1,10 +1,22 @@
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
-from sqlalchemy import BigInteger, Column, DateTime, Index, Numeric, String
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    Numeric,
+    String,
+    UniqueConstraint,
+)
 
 from .db import Base
 
+# SQLite only autoincrements INTEGER PRIMARY KEY columns.
+BigIntegerPK = BigInteger().with_variant(Integer(), "sqlite")
+
 
 def _kyiv_now() -> datetime:
     """Return naive datetime representing current time in Kyiv."""
@@ -15,7 +27,7 @@ def _kyiv_now() -> datetime:
 class GasReading(Base):
     __tablename__ = "gas_readings"
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigIntegerPK, primary_key=True, autoincrement=True)
     station_code = Column(String(64), nullable=False)
     city = Column(String(64), nullable=True)
     time = Column(DateTime, nullable=False, default=_kyiv_now)
@@ -41,7 +53,7 @@ class GasReading(Base):
 class MeteoReading(Base):
     __tablename__ = "meteo_readings"
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigIntegerPK, primary_key=True, autoincrement=True)
     station_code = Column(String(64), nullable=False)
     city = Column(String(64), nullable=True)
     time = Column(DateTime, nullable=False, default=_kyiv_now)
@@ -60,7 +72,7 @@ class MeteoReading(Base):
 class StationMapping(Base):
     __tablename__ = "station_mappings"
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigIntegerPK, primary_key=True, autoincrement=True)
     station_code = Column(String(64), nullable=False, unique=True)
     city = Column(String(64), nullable=False)
     created_at = Column(DateTime, nullable=False, default=_kyiv_now)
@@ -70,3 +82,48 @@ class StationMapping(Base):
         Index("ix_station_mapping_code", "station_code"),
         Index("ix_station_mapping_city", "city"),
     )
+
+
+class IngestKey(Base):
+    """Keys of accepted ingest packets, so retransmissions are not stored twice."""
+
+    __tablename__ = "ingest_keys"
+
+    key = Column(String(64), primary_key=True)
+    created_at = Column(DateTime, nullable=False, default=_kyiv_now)
+
+    __table_args__ = (Index("ix_ingest_key_created", "created_at"),)
+
+
+class ReadingRollup(Base):
+    """Hourly/daily per-station aggregates of one reading field."""
+
+    __tablename__ = "reading_rollups"
+
+    id = Column(BigIntegerPK, primary_key=True, autoincrement=True)
+    kind = Column(String(8), nullable=False)
+    period = Column(String(8), nullable=False)
+    station_code = Column(String(64), nullable=False)
+    city = Column(String(64), nullable=True)
+    field = Column(String(16), nullable=False)
+    time = Column(DateTime, nullable=False)
+    samples = Column(BigInteger, nullable=False, default=0)
+    value_count = Column(BigInteger, nullable=False, default=0)
+    value_sum = Column(Numeric(20, 4))
+    value_min = Column(Numeric(10, 4))
+    value_max = Column(Numeric(10, 4))
+
+    __table_args__ = (
+        UniqueConstraint(
+            "kind", "period", "station_code", "field", "time", name="uq_rollup_bucket"
+        ),
+        Index("ix_rollup_period_time", "kind", "period", "time"),
+    )
+
+
+class RollupState(Base):
+    __tablename__ = "rollup_state"
+
+    name = Column(String(32), primary_key=True)
+    last_id = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=_kyiv_now, onupdate=_kyiv_now)
@@ -0,0 +1,202 @@
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from ..config import Config
+from ..log import log
+from .models import _kyiv_now
+
+PARTITIONED_TABLES = ("gas_readings", "meteo_readings")
+CATCH_ALL = "pmax"
+
+
+def _month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def _add_months(value: date, months: int) -> date:
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _partition_name(month: date) -> str:
+    return f"p{month:%Y%m}"
+
+
+def _partition_clause(month: date) -> str:
+    bound = _add_months(month, 1)
+    return (
+        f"PARTITION {_partition_name(month)} "
+        f"VALUES LESS THAN (TO_DAYS('{bound:%Y-%m-%d}'))"
+    )
+
+
+def _existing_partitions(conn: Connection, table: str) -> List[str]:
+    rows = conn.execute(
+        text(
+            "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table "
+            "AND PARTITION_NAME IS NOT NULL ORDER BY PARTITION_ORDINAL_POSITION"
+        ),
+        {"table": table},
+    ).scalars()
+    return list(rows)
+
+
+def _has_rows(conn: Connection, source: str) -> bool:
+    return conn.execute(text(f"SELECT 1 FROM {source} LIMIT 1")).first() is not None
+
+
+def _partition_table(
+    conn: Connection, table: str, last_month: date, today: date
+) -> None:
+    """Convert a plain table into monthly RANGE partitions on ``time``.
+
+    MySQL requires the partitioning column in every unique key, so the
+    primary key becomes (id, time). This rebuilds the table once.
+    """
+
+    oldest: Optional[datetime] = conn.execute(
+        text(f"SELECT MIN(`time`) FROM `{table}`")
+    ).scalar()
+    month = _month_start(oldest.date() if oldest else today)
+    clauses = []
+    while month <= last_month:
+        clauses.append(_partition_clause(month))
+        month = _add_months(month, 1)
+    clauses.append(f"PARTITION {CATCH_ALL} VALUES LESS THAN MAXVALUE")
+
+    log.info("Partitioning %s into %s monthly partitions", table, len(clauses) - 1)
+    conn.execute(
+        text(f"ALTER TABLE `{table}` DROP PRIMARY KEY, ADD PRIMARY KEY (`id`, `time`)")
+    )
+    conn.execute(
+        text(
+            f"ALTER TABLE `{table}` PARTITION BY RANGE (TO_DAYS(`time`)) "
+            f"({', '.join(clauses)})"
+        )
+    )
+
+
+def _add_future_partitions(
+    conn: Connection, table: str, existing: List[str], last_month: date
+) -> int:
+    months = sorted(name for name in existing if name != CATCH_ALL)
+    if not months:
+        return 0
+    newest = datetime.strptime(months[-1], "p%Y%m").date()
+    clauses = []
+    month = _add_months(newest, 1)
+    while month <= last_month:
+        clauses.append(_partition_clause(month))
+        month = _add_months(month, 1)
+    if not clauses:
+        return 0
+    clauses.append(f"PARTITION {CATCH_ALL} VALUES LESS THAN MAXVALUE")
+    conn.execute(
+        text(
+            f"ALTER TABLE `{table}` REORGANIZE PARTITION {CATCH_ALL} "
+            f"INTO ({', '.join(clauses)})"
+        )
+    )
+    return len(clauses) - 1
+
+
+def _expire_partitions(
+    conn: Connection, table: str, existing: List[str], cutoff: date, archive: bool
+) -> List[str]:
+    expired = [
+        name
+        for name in existing
+        if name != CATCH_ALL and datetime.strptime(name, "p%Y%m").date() < cutoff
+    ]
+    for name in expired:
+        if archive:
+            archive_table = f"{table}_archive_{name[1:]}"
+            conn.execute(
+                text(f"CREATE TABLE IF NOT EXISTS `{archive_table}` LIKE `{table}`")
+            )
+            # LIKE copies the partitioning. A run that stopped part-way may
+            # already have removed it, and MySQL rejects removing it twice.
+            if _existing_partitions(conn, archive_table):
+                conn.execute(text(f"ALTER TABLE `{archive_table}` REMOVE PARTITIONING"))
+            partition = f"`{table}` PARTITION ({name})"
+            if _has_rows(conn, partition) and _has_rows(conn, f"`{archive_table}`"):
+                # Archived before: an exchange would swap those rows back
+                # into the partition about to be dropped, so copy instead.
+                conn.execute(
+                    text(f"INSERT INTO `{archive_table}` SELECT * FROM {partition}")
+                )
+            elif _has_rows(conn, partition):
+                conn.execute(
+                    text(
+                        f"ALTER TABLE `{table}` EXCHANGE PARTITION {name} "
+                        f"WITH TABLE `{archive_table}`"
+                    )
+                )
+        conn.execute(text(f"ALTER TABLE `{table}` DROP PARTITION {name}"))
+        log.info(
+            "%s partition %s of %s", "Archived" if archive else "Dropped", name, table
+        )
+    return expired
+
+
+def manage_partitions(
+    engine: Engine,
+    months_ahead: int = Config.PARTITION_MONTHS_AHEAD,
+    retention_months: int = Config.PARTITION_RETENTION_MONTHS,
+    archive: bool = Config.PARTITION_ARCHIVE,
+) -> Dict[str, Dict[str, object]]:
+    """Idempotently partition reading tables by month and apply retention.
+
+    Only MySQL is partitioned; other backends are left untouched.
+    ``retention_months`` of 0 keeps every partition.
+    """
+
+    if engine.dialect.name != "mysql":
+        return {}
+
+    # Partition bounds are Kyiv dates, like the naive times they hold.
+    today = _kyiv_now().date()
+    last_month = _add_months(_month_start(today), months_ahead)
+    report: Dict[str, Dict[str, object]] = {}
+    with engine.connect() as conn:
+        for table in PARTITIONED_TABLES:
+            existing = _existing_partitions(conn, table)
+            created = 0
+            if not existing:
+                _partition_table(conn, table, last_month, today)
+                existing = _existing_partitions(conn, table)
+                created = len(existing) - 1
+            else:
+                created = _add_future_partitions(conn, table, existing, last_month)
+                if created:
+                    existing = _existing_partitions(conn, table)
+
+            expired: List[str] = []
+            if retention_months > 0:
+                cutoff = _add_months(_month_start(today), -retention_months)
+                expired = _expire_partitions(conn, table, existing, cutoff, archive)
+            conn.commit()
+            report[table] = {"created": created, "expired": expired}
+    return report
+
+
+partition_cli = AppGroup(
+    "partitions", help="Manage monthly partitions of reading tables."
+)
+
+
+@partition_cli.command("maintain")
+def maintain_command() -> None:
+    """Pre-create future partitions and apply retention on both databases."""
+
+    from .db import ENGINE, ENGINE_SECONDARY
+
+    for label, engine in (("primary", ENGINE), ("secondary", ENGINE_SECONDARY)):
+        if engine is not None:
+            click.echo(f"{label}: {manage_partitions(engine)}")
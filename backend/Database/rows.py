@@ -0,0 +1,35 @@
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Type
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from .models import _kyiv_now
+
+Row = Tuple[Type[Any], Dict[str, Any]]
+
+
+def build_row(
+    station: str,
+    city: Optional[str],
+    fields: Dict[str, Optional[float]],
+    time: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """Return an insert-ready row; time is captured now, not at flush."""
+
+    return {
+        "station_code": station,
+        "city": city,
+        "time": time or _kyiv_now(),
+        **fields,
+    }
+
+
+def insert_rows(session: Session, batch: Iterable[Row]) -> None:
+    """Issue one executemany INSERT per model for the given rows."""
+
+    grouped: Dict[Type[Any], List[Dict[str, Any]]] = {}
+    for model, row in batch:
+        grouped.setdefault(model, []).append(row)
+    for model, rows in grouped.items():
+        session.execute(insert(model), rows)
@@ -1,29 +1,101 @@
-from flask import Flask
+from typing import Any
 
+from flask import Flask, jsonify, request
+
+from .anomaly import ANOMALY
+from .bootstrap import db_cli, start_warmup
+from .compression import DecompressionMiddleware
 from .config import Config, log_setup
 from .log import log
-from .Database.db import init_db
+from .Database.db import init_db, schema_ready
+from .Database.partitions import partition_cli
+from .dedup import dedup_cli
+from .replication import REPLICATOR
+from .rollups import ROLLUP_WORKER, rollup_cli
+from .spool import SPOOL
+
+# Probes must answer while the database is still being bootstrapped.
+# /latest is served from memory and Flask refuses /stream, so they answer
+# before the database is up too.
+UNGATED_ENDPOINTS = (
+    "ingest.health",
+    "ingest.ready",
+    "metrics.metrics",
+    "latest.latest",
+    "stream.stream",
+)
+
 
+def create_app(warm_up: bool = Config.DB_WARMUP) -> Flask:
+    """Build the Flask app without touching the database.
+
+    The schema is created by ``flask db init``, by the background warm-up,
+    or at the latest by the first request that needs it.
+    """
 
-def create_app() -> Flask:
     app = Flask(__name__)
     app.config.from_object(Config)
+    app.wsgi_app = DecompressionMiddleware(
+        app.wsgi_app, Config.INGEST_MAX_DECOMPRESSED_BYTES
+    )
     log_setup()
     log.info("Flask app initialized")
 
+    from .aggregation import bp as aggregation_bp
+    from .aqi import bp as aqi_bp
+    from .export import bp as export_bp
+    from .export import export_cli
     from .ingestion import bp as ingest_bp
+    from .latest import bp as latest_bp
+    from .metrics import bp as metrics_bp
+    from .readings import bp as readings_bp
+    from .stream import bp as stream_bp
     from .testing import bp as testing_bp
 
     app.register_blueprint(ingest_bp)
+    app.register_blueprint(readings_bp)
+    app.register_blueprint(latest_bp)
+    app.register_blueprint(stream_bp)
+    app.register_blueprint(aggregation_bp)
+    app.register_blueprint(aqi_bp)
+    app.register_blueprint(export_bp)
+    app.register_blueprint(metrics_bp)
     app.register_blueprint(testing_bp)
+    app.cli.add_command(rollup_cli)
+    app.cli.add_command(partition_cli)
+    app.cli.add_command(export_cli)
+    app.cli.add_command(db_cli)
+    app.cli.add_command(dedup_cli)
+
+    @app.before_request
+    def ensure_schema():
+        if schema_ready() or request.endpoint in UNGATED_ENDPOINTS:
+            return None
+        # After a failure, retry once per SPOOL_RETRY_INTERVAL instead of
+        # making every request wait out a connect timeout.
+        if SPOOL.primary_available():
+            try:
+                init_db()
+            except Exception:
+                log.warning("Database bootstrap failed", exc_info=True)
+                SPOOL.mark_unavailable()
+        if schema_ready() or SPOOL.enabled:
+            return None
+        return jsonify({"error": "database_unavailable"}), 503
 
-    try:
-        init_db()
-    except Exception:
-        # Database might be unreachable during startup; fail lazily on first request.
-        log.warning("Database init failed; will retry on demand", exc_info=True)
+    if warm_up:
+        start_warmup()
+    REPLICATOR.start()
+    SPOOL.start()
+    ROLLUP_WORKER.start()
+    ANOMALY.start()
 
     return app
 
 
-app = create_app()
+def __getattr__(name: str) -> Any:
+    # ``backend.app`` is built on first access so importing the package stays cheap.
+    if name == "app":
+        app = globals()["app"] = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,334 @@
+from datetime import datetime, timedelta
+from itertools import chain
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from flask import Blueprint, jsonify, request
+from sqlalchemy import func, literal_column, select
+
+from backend.log import log
+
+from .Database.db import SessionLocal
+from .config import Config
+from .Database.models import ReadingRollup, _kyiv_now
+from .helpers import normalize_station_code, parse_timestamp, require_api_key
+from .rollups import BUCKET_TO_PERIOD, period_start
+from .readings import (
+    READING_TYPES,
+    STREAM_CHUNK,
+    QueryError,
+    keyset_chunks,
+    parse_reading_filters,
+    serialize_value,
+)
+
+bp = Blueprint("aggregation", __name__)
+
+BUCKET_SECONDS = {"1m": 60, "5m": 300, "1h": 3600, "1d": 86400}
+BUCKET_EPOCH = datetime(2000, 1, 1)
+MAX_BUCKETS = 20000
+MAX_LTTB_POINTS = 5000
+# Raw rows LTTB may load for one request; wider ranges must use buckets.
+MAX_LTTB_SOURCE_ROWS = 100_000
+
+
+def bucket_expression(dialect: str, column, seconds: int):
+    """SQL expression numbering fixed-width buckets since BUCKET_EPOCH.
+
+    Works on the naive Kyiv DATETIME directly, so day buckets start at
+    local midnight and no session time zone is involved. Returns None for
+    dialects without a known expression.
+    """
+
+    epoch = BUCKET_EPOCH.strftime("%Y-%m-%d %H:%M:%S")
+    if dialect == "mysql":
+        offset = func.timestampdiff(literal_column("SECOND"), epoch, column)
+        return func.floor(offset / seconds)
+    if dialect == "sqlite":
+        offset = func.strftime("%s", column) - func.strftime("%s", epoch)
+        return func.floor(offset / float(seconds))
+    return None
+
+
+def bucket_start(index: int, seconds: int) -> datetime:
+    return BUCKET_EPOCH + timedelta(seconds=int(index) * seconds)
+
+
+def lttb(points: Sequence[Tuple[float, float]], threshold: int) -> List[int]:
+    """Largest-Triangle-Three-Buckets; returns indexes of the points to keep."""
+
+    size = len(points)
+    if threshold >= size or threshold < 3:
+        return list(range(size))
+
+    selected = [0]
+    every = (size - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, size)
+        span = avg_end - avg_start
+        avg_x = sum(points[j][0] for j in range(avg_start, avg_end)) / span
+        avg_y = sum(points[j][1] for j in range(avg_start, avg_end)) / span
+
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+        ax, ay = points[a]
+        best_area = -1.0
+        best = range_start
+        for j in range(range_start, range_end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                best = j
+        selected.append(best)
+        a = best
+    selected.append(size - 1)
+    return selected
+
+
+def _parse_fields(available: Tuple[str, ...]) -> Tuple[str, ...]:
+    raw = request.args.get("fields")
+    if not raw:
+        return available
+    fields = tuple(field.strip() for field in raw.split(",") if field.strip())
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise QueryError("invalid_field", f"Unknown fields: {', '.join(unknown)}.")
+    return fields
+
+
+def parse_range() -> Tuple[datetime, datetime]:
+    bounds: Dict[str, Optional[datetime]] = {}
+    for key in ("from", "to"):
+        try:
+            bounds[key] = parse_timestamp(request.args.get(key))
+        except (TypeError, ValueError, OverflowError, OSError):
+            raise QueryError(
+                "invalid_time", f"Cannot parse '{key}' as epoch or ISO-8601."
+            )
+    if bounds["from"] is None:
+        raise QueryError("missing_from", "Provide the start of the time range.")
+    return bounds["from"], bounds["to"] or _kyiv_now()
+
+
+@bp.get("/readings/<string:kind>/aggregate")
+@bp.get("/readings/<string:kind>/aggregate/<string:path_token>")
+def aggregate_readings(kind: str, path_token: Optional[str] = None):
+    auth_err = require_api_key(path_token)
+    if auth_err:
+        return auth_err
+    if kind not in READING_TYPES:
+        return jsonify({"error": "unknown_reading_type"}), 404
+
+    model, available = READING_TYPES[kind]
+    try:
+        fields = _parse_fields(available)
+        clauses = parse_reading_filters(model)
+        start, end = parse_range()
+        if request.args.get("mode") == "lttb":
+            return _lttb_response(model, fields, clauses)
+
+        bucket = request.args.get("bucket", "1h")
+        if bucket not in BUCKET_SECONDS:
+            raise QueryError(
+                "invalid_bucket", f"bucket must be one of {', '.join(BUCKET_SECONDS)}."
+            )
+        seconds = BUCKET_SECONDS[bucket]
+        if (end - start).total_seconds() / seconds > MAX_BUCKETS:
+            raise QueryError(
+                "too_many_buckets",
+                f"Range would produce more than {MAX_BUCKETS} buckets; use a wider bucket.",
+            )
+    except QueryError as exc:
+        return exc.response()
+
+    use_rollups = (
+        Config.ROLLUPS_ENABLED
+        and bucket in BUCKET_TO_PERIOD
+        and request.args.get("source") != "raw"
+    )
+    if use_rollups:
+        period = BUCKET_TO_PERIOD[bucket]
+        # Widen the start to the enclosing bucket so it is not dropped as partial.
+        rollup_clauses = parse_reading_filters(ReadingRollup, include_time=False)
+        rollup_clauses.append(ReadingRollup.time >= period_start(start, period))
+        if request.args.get("to"):
+            rollup_clauses.append(ReadingRollup.time < end)
+
+    with SessionLocal() as session:
+        dialect = session.get_bind().dialect.name
+        expression = bucket_expression(dialect, model.time, seconds)
+        if use_rollups:
+            buckets = _aggregate_from_rollups(
+                session, kind, fields, rollup_clauses, period
+            )
+        elif expression is None:
+            buckets = _aggregate_in_python(model, fields, clauses, seconds)
+        else:
+            buckets = _aggregate_in_sql(
+                session, model, fields, clauses, expression, seconds
+            )
+    log.debug("Aggregated %s %s buckets of %s", len(buckets), kind, bucket)
+    return jsonify(
+        {
+            "bucket": bucket,
+            "bucket_seconds": seconds,
+            "source": "rollup" if use_rollups else "raw",
+            "fields": list(fields),
+            "buckets": buckets,
+        }
+    )
+
+
+def _aggregate_in_sql(session, model, fields, clauses, expression, seconds):
+    bucket_col = expression.label("bucket")
+    columns = [bucket_col, func.count().label("count")]
+    for field in fields:
+        column = getattr(model, field)
+        columns.extend(
+            [
+                func.min(column).label(f"{field}__min"),
+                func.max(column).label(f"{field}__max"),
+                func.avg(column).label(f"{field}__avg"),
+                func.count(column).label(f"{field}__count"),
+            ]
+        )
+    stmt = select(*columns).where(*clauses).group_by(bucket_col).order_by(bucket_col)
+    buckets = []
+    for row in session.execute(stmt).mappings():
+        item: Dict[str, Any] = {
+            "time": bucket_start(row["bucket"], seconds).isoformat(),
+            "count": row["count"],
+        }
+        for field in fields:
+            item[field] = {
+                stat: serialize_value(row[f"{field}__{stat}"])
+                for stat in ("min", "max", "avg", "count")
+            }
+        buckets.append(item)
+    return buckets
+
+
+def _aggregate_from_rollups(session, kind, fields, clauses, period):
+    stmt = (
+        select(
+            ReadingRollup.time,
+            ReadingRollup.field,
+            func.sum(ReadingRollup.samples),
+            func.sum(ReadingRollup.value_count),
+            func.sum(ReadingRollup.value_sum),
+            func.min(ReadingRollup.value_min),
+            func.max(ReadingRollup.value_max),
+        )
+        .where(
+            ReadingRollup.kind == kind,
+            ReadingRollup.period == period,
+            ReadingRollup.field.in_(fields),
+            *clauses,
+        )
+        .group_by(ReadingRollup.time, ReadingRollup.field)
+        .order_by(ReadingRollup.time)
+    )
+    buckets: Dict[datetime, Dict[str, Any]] = {}
+    for time, field, samples, count, total, low, high in session.execute(stmt):
+        item = buckets.get(time)
+        if item is None:
+            item = buckets[time] = {"time": time.isoformat(), "count": int(samples)}
+        item[field] = {
+            "min": serialize_value(low),
+            "max": serialize_value(high),
+            "avg": float(total) / count if count else None,
+            "count": int(count),
+        }
+    return list(buckets.values())
+
+
+def _aggregate_in_python(model, fields, clauses, seconds):
+    columns = [model.id, model.time, *(getattr(model, field) for field in fields)]
+    stats: Dict[int, Dict[str, Any]] = {}
+    chunks = keyset_chunks(model, columns, clauses, STREAM_CHUNK)
+    for row in chain.from_iterable(chunks):
+        index = int((row.time - BUCKET_EPOCH).total_seconds() // seconds)
+        entry = stats.get(index)
+        if entry is None:
+            entry = stats[index] = {
+                "count": 0,
+                **{f: [None, None, 0.0, 0] for f in fields},
+            }
+        entry["count"] += 1
+        for field, value in zip(fields, row[2:]):
+            if value is None:
+                continue
+            value = float(value)
+            acc = entry[field]
+            acc[0] = value if acc[0] is None else min(acc[0], value)
+            acc[1] = value if acc[1] is None else max(acc[1], value)
+            acc[2] += value
+            acc[3] += 1
+
+    buckets = []
+    for index in sorted(stats):
+        entry = stats[index]
+        item: Dict[str, Any] = {
+            "time": bucket_start(index, seconds).isoformat(),
+            "count": entry["count"],
+        }
+        for field in fields:
+            low, high, total, count = entry[field]
+            item[field] = {
+                "min": low,
+                "max": high,
+                "avg": total / count if count else None,
+                "count": count,
+            }
+        buckets.append(item)
+    return buckets
+
+
+def _lttb_response(model, fields, clauses):
+    if len(fields) != 1:
+        raise QueryError("invalid_field", "LTTB mode needs exactly one field.")
+    # One station's series; several would interleave into a zig-zag.
+    if not normalize_station_code(request.args.get("station_code")):
+        raise QueryError(
+            "missing_station_code", "LTTB mode needs a station_code filter."
+        )
+    field = fields[0]
+    try:
+        threshold = int(request.args.get("points", "1000"))
+    except ValueError:
+        raise QueryError("invalid_points", "points must be an integer.")
+    threshold = max(3, min(threshold, MAX_LTTB_POINTS))
+
+    column = getattr(model, field)
+    chunks = keyset_chunks(
+        model,
+        [model.id, model.time, column],
+        [*clauses, column.isnot(None)],
+        STREAM_CHUNK,
+        limit=MAX_LTTB_SOURCE_ROWS + 1,
+    )
+    times: List[datetime] = []
+    points: List[Tuple[float, float]] = []
+    for _, time, value in chain.from_iterable(chunks):
+        if len(points) == MAX_LTTB_SOURCE_ROWS:
+            raise QueryError(
+                "too_many_points",
+                f"Range holds more than {MAX_LTTB_SOURCE_ROWS} readings; "
+                "narrow it or use buckets.",
+            )
+        times.append(time)
+        points.append(((time - BUCKET_EPOCH).total_seconds(), float(value)))
+
+    keep = lttb(points, threshold)
+    return jsonify(
+        {
+            "mode": "lttb",
+            "field": field,
+            "source_points": len(points),
+            "points": [
+                {"time": times[i].isoformat(), field: points[i][1]} for i in keep
+            ],
+        }
+    )
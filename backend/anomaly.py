@@ -0,0 +1,241 @@
+import atexit
+import json
+import math
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from backend.log import log
+
+from .config import Config
+from .log_handlers import SAMPLED
+from .metrics import INGEST_ANOMALIES
+
+ACTIONS = ("flag", "quarantine")
+CHECKPOINT_VERSION = 1
+# Smallest spread per column, in its stored unit (mg/m3, µSv, hPa, °C, %):
+# about one step of sensor noise. Without it a field idling at zero has a
+# spread of zero and its first non-zero value, and many after, are spikes.
+FIELD_MIN_SPREAD: Dict[str, float] = {
+    "CO": 0.1,
+    "SO2": 0.005,
+    "NO2": 0.005,
+    "NO": 0.005,
+    "H2S": 0.005,
+    "O3": 0.005,
+    "NH3": 0.005,
+    "PM2_5": 0.002,
+    "PM10": 0.002,
+    "R": 0.01,
+    "P": 0.5,
+    "TEMP": 0.5,
+    "RH": 2.0,
+}
+
+# [samples seen (capped at the warm-up), EWMA mean, EWMA variance]
+State = List[float]
+
+
+class AnomalyDetector:
+    """Online spike detection per station and field at ingest time.
+
+    Each (station_code, field) keeps an exponentially weighted mean and
+    variance, so state and per-value cost are O(1). After ``warmup``
+    samples a value further than ``threshold`` spreads from the mean is
+    flagged, or with action "quarantine" also dropped from the row. The
+    spread is floored at ``min_spread`` times the mean and at the field's
+    FIELD_MIN_SPREAD, so a quiet sensor does not flag every small change.
+
+    Flagged values still move the averages, clipped to the threshold, so a
+    sensor that really shifts level is followed instead of flagged forever.
+    The state is checkpointed to a JSON file and reloaded on start, so a
+    restart does not begin with an empty warm-up. With several workers each
+    keeps its own state and the last checkpoint written wins.
+    """
+
+    def __init__(
+        self,
+        enabled: bool,
+        action: str,
+        threshold: float,
+        alpha: float,
+        warmup: int,
+        min_spread: float,
+        checkpoint_path: str = "",
+        checkpoint_interval: float = 60.0,
+        field_min_spread: Optional[Dict[str, float]] = None,
+    ) -> None:
+        if action not in ACTIONS:
+            raise ValueError(f"ANOMALY_ACTION must be one of {', '.join(ACTIONS)}.")
+        self.enabled = enabled
+        self.quarantine = action == "quarantine"
+        self.threshold = threshold
+        self.alpha = alpha
+        self.warmup = max(1, warmup)
+        self.min_spread = min_spread
+        self.field_min_spread = (
+            FIELD_MIN_SPREAD if field_min_spread is None else field_min_spread
+        )
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        self._lock = threading.Lock()
+        self._state: Dict[Tuple[str, str], State] = {}
+        self._dirty = False
+        self._loaded = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def __len__(self) -> int:
+        return len(self._state)
+
+    def inspect(
+        self, kind: str, station: str, fields: Dict[str, Optional[float]]
+    ) -> List[str]:
+        """Score and learn one reading; return the names of flagged fields.
+
+        In quarantine mode the flagged fields are set to None in ``fields``.
+        """
+
+        flagged: List[str] = []
+        with self._lock:
+            for field, value in fields.items():
+                if value is None:
+                    continue
+                key = (station, field)
+                state = self._state.get(key)
+                if state is None:
+                    self._state[key] = [1, value, 0.0]
+                    continue
+                count, mean, variance = state
+                deviation = value - mean
+                limit = self.threshold * max(
+                    math.sqrt(variance),
+                    self.min_spread * abs(mean),
+                    self.field_min_spread.get(field, 0.0),
+                    1e-9,
+                )
+                if count >= self.warmup and abs(deviation) > limit:
+                    flagged.append(field)
+                    deviation = math.copysign(limit, deviation)
+                # Plain running mean until warmed up, then exponential decay.
+                alpha = max(self.alpha, 1.0 / (count + 1))
+                step = alpha * deviation
+                state[0] = min(count + 1, self.warmup)
+                state[1] = mean + step
+                state[2] = (1.0 - alpha) * (variance + deviation * step)
+            self._dirty = True
+
+        if flagged:
+            action = "quarantine" if self.quarantine else "flag"
+            for field in flagged:
+                INGEST_ANOMALIES.labels(kind, field, action).inc()
+                log.warning(
+                    "Anomalous %s %s=%s for station=%s (%s)",
+                    kind,
+                    field,
+                    fields[field],
+                    station,
+                    action,
+                    extra=SAMPLED,
+                )
+                if self.quarantine:
+                    fields[field] = None
+        return flagged
+
+    def save(self) -> bool:
+        """Write the state to the checkpoint file if it changed; True if written."""
+
+        if not self.checkpoint_path:
+            return False
+        with self._lock:
+            if not self._dirty:
+                return False
+            entries = [
+                [station, field, *state]
+                for (station, field), state in self._state.items()
+            ]
+            self._dirty = False
+        directory = os.path.dirname(self.checkpoint_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.checkpoint_path}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as handle:
+            json.dump({"version": CHECKPOINT_VERSION, "state": entries}, handle)
+        os.replace(temporary, self.checkpoint_path)
+        return True
+
+    def load(self) -> int:
+        """Replace the state with the checkpoint file's; return the entry count."""
+
+        self._loaded = True
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return 0
+        try:
+            with open(self.checkpoint_path, encoding="utf-8") as handle:
+                data = json.load(handle)
+            if data.get("version") != CHECKPOINT_VERSION:
+                raise ValueError(f"unsupported version {data.get('version')}")
+            state = {
+                (station, field): [count, mean, variance]
+                for station, field, count, mean, variance in data["state"]
+            }
+        except (OSError, ValueError, TypeError, KeyError):
+            log.warning(
+                "Ignoring unreadable anomaly checkpoint %s",
+                self.checkpoint_path,
+                exc_info=True,
+            )
+            return 0
+        with self._lock:
+            self._state = state
+            self._dirty = False
+        log.info("Anomaly detector state loaded for %s station fields", len(state))
+        return len(state)
+
+    def start(self) -> None:
+        """Load the checkpoint once, then checkpoint periodically in this process."""
+
+        if not self.enabled:
+            return
+        if not self._loaded:
+            self.load()
+        if not self.checkpoint_path:
+            return
+        pid = os.getpid()
+        if self._thread is not None and self._thread.is_alive() and self._pid == pid:
+            return
+        self._stop.clear()
+        self._pid = pid
+        self._thread = threading.Thread(
+            target=self._run, name="anomaly-checkpoint", daemon=True
+        )
+        self._thread.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self.enabled:
+            try:
+                self.save()
+            except OSError:
+                log.warning("Final anomaly checkpoint failed", exc_info=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.checkpoint_interval):
+            try:
+                self.save()
+            except OSError:
+                log.warning("Anomaly checkpoint failed; retrying later", exc_info=True)
+
+
+ANOMALY = AnomalyDetector(
+    Config.ANOMALY_ENABLED,
+    Config.ANOMALY_ACTION,
+    Config.ANOMALY_THRESHOLD,
+    Config.ANOMALY_ALPHA,
+    Config.ANOMALY_WARMUP,
+    Config.ANOMALY_MIN_SPREAD,
+    Config.ANOMALY_CHECKPOINT_PATH,
+    Config.ANOMALY_CHECKPOINT_INTERVAL,
+)
+atexit.register(ANOMALY.close)
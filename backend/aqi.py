@@ -0,0 +1,333 @@
+import math
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from flask import Blueprint, jsonify, request
+from sqlalchemy import Float, case, cast, func, select
+
+from backend.log import log
+
+from .aggregation import BUCKET_EPOCH, bucket_expression, parse_range
+from .config import CITY_BY_ID, Config
+from .Database.db import SessionLocal
+from .Database.models import GasReading, ReadingRollup
+from .helpers import extract_city_from_payload, require_api_key
+from .readings import QueryError, parse_reading_filters
+
+bp = Blueprint("aqi", __name__)
+
+HOUR = 3600
+MAX_AQI_HOURS = 24 * 93
+# A rolling average needs 75% of its hours, as in the EPA data-completeness rule.
+MIN_COVERAGE = 0.75
+
+
+class Pollutant(NamedTuple):
+    """US EPA AQI breakpoints for one gas_readings column (stored in mg/m3).
+
+    ``scale`` converts mg/m3 to the breakpoint unit: µg/m3 for PM, and
+    ppm/ppb for gases at 25 °C (24.45 / molar mass). Concentrations are
+    truncated to ``decimals`` before the band lookup, as the EPA specifies.
+    """
+
+    field: str
+    window: int
+    scale: float
+    decimals: int
+    # (C_low, C_high, I_low, I_high) per band, ascending.
+    bands: Tuple[Tuple[float, float, int, int], ...]
+
+
+POLLUTANTS: Tuple[Pollutant, ...] = (
+    Pollutant(
+        "O3",
+        8,
+        24.45 / 48.00,
+        3,
+        (
+            (0.0, 0.054, 0, 50),
+            (0.055, 0.070, 51, 100),
+            (0.071, 0.085, 101, 150),
+            (0.086, 0.105, 151, 200),
+            (0.106, 0.200, 201, 300),
+        ),
+    ),
+    Pollutant(
+        "PM2_5",
+        24,
+        1000.0,
+        1,
+        (
+            (0.0, 9.0, 0, 50),
+            (9.1, 35.4, 51, 100),
+            (35.5, 55.4, 101, 150),
+            (55.5, 125.4, 151, 200),
+            (125.5, 225.4, 201, 300),
+            (225.5, 325.4, 301, 500),
+        ),
+    ),
+    Pollutant(
+        "PM10",
+        24,
+        1000.0,
+        0,
+        (
+            (0.0, 54.0, 0, 50),
+            (55.0, 154.0, 51, 100),
+            (155.0, 254.0, 101, 150),
+            (255.0, 354.0, 151, 200),
+            (355.0, 424.0, 201, 300),
+            (425.0, 604.0, 301, 500),
+        ),
+    ),
+    Pollutant(
+        "CO",
+        8,
+        24.45 / 28.01,
+        1,
+        (
+            (0.0, 4.4, 0, 50),
+            (4.5, 9.4, 51, 100),
+            (9.5, 12.4, 101, 150),
+            (12.5, 15.4, 151, 200),
+            (15.5, 30.4, 201, 300),
+            (30.5, 50.4, 301, 500),
+        ),
+    ),
+    Pollutant(
+        "SO2",
+        1,
+        24.45 / 64.07 * 1000,
+        0,
+        (
+            (0.0, 35.0, 0, 50),
+            (36.0, 75.0, 51, 100),
+            (76.0, 185.0, 101, 150),
+            (186.0, 304.0, 151, 200),
+            (305.0, 604.0, 201, 300),
+            (605.0, 1004.0, 301, 500),
+        ),
+    ),
+    Pollutant(
+        "NO2",
+        1,
+        24.45 / 46.01 * 1000,
+        0,
+        (
+            (0.0, 53.0, 0, 50),
+            (54.0, 100.0, 51, 100),
+            (101.0, 360.0, 101, 150),
+            (361.0, 649.0, 151, 200),
+            (650.0, 1249.0, 201, 300),
+            (1250.0, 2049.0, 301, 500),
+        ),
+    ),
+)
+AQI_FIELDS = tuple(pollutant.field for pollutant in POLLUTANTS)
+# Hours fetched before the range so its first rolling windows are complete.
+LEAD_HOURS = max(pollutant.window for pollutant in POLLUTANTS) - 1
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Trailing mean over the last ``window`` hours along the last axis.
+
+    Missing hours (NaN) are skipped; windows with fewer than MIN_COVERAGE
+    of their hours present are NaN.
+    """
+
+    if window == 1:
+        return values
+    present = ~np.isnan(values)
+    pad = np.zeros(values.shape[:-1] + (1,))
+    sums = np.concatenate([pad, np.cumsum(np.where(present, values, 0.0), axis=-1)], -1)
+    counts = np.concatenate([pad, np.cumsum(present, axis=-1)], -1)
+    end = np.arange(1, values.shape[-1] + 1)
+    start = np.maximum(end - window, 0)
+    count = counts[..., end] - counts[..., start]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (sums[..., end] - sums[..., start]) / count
+    mean[count < math.ceil(window * MIN_COVERAGE)] = np.nan
+    return mean
+
+
+def sub_index(pollutant: Pollutant, concentration: np.ndarray) -> np.ndarray:
+    """Sub-index of every concentration (mg/m3) at once; NaN stays NaN.
+
+    Values above the top band are reported as 500.
+    """
+
+    bands = np.array(pollutant.bands, dtype=float)
+    c_low, c_high, i_low, i_high = bands.T
+    factor = 10.0**pollutant.decimals
+    # The epsilon keeps e.g. 0.07 * 1000 = 69.999... from truncating a band lower.
+    value = np.floor(np.maximum(concentration, 0.0) * pollutant.scale * factor + 1e-6)
+    value /= factor
+    band = np.searchsorted(c_high, value, side="left")
+    top = band >= len(bands)
+    band = np.minimum(band, len(bands) - 1)
+    index = (i_high[band] - i_low[band]) / (c_high[band] - c_low[band]) * (
+        value - c_low[band]
+    ) + i_low[band]
+    index = np.floor(index + 0.5)
+    index[top] = 500.0
+    index[np.isnan(concentration)] = np.nan
+    return index
+
+
+def compute_aqi(
+    hourly: Dict[str, np.ndarray],
+) -> Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+    """AQI from hourly mean concentrations, one array per AQI_FIELDS column.
+
+    Every array has hours on its last axis. Returns (aqi, dominant, sub
+    indices); ``dominant`` indexes AQI_FIELDS and is -1 where no pollutant
+    has enough data, in which case ``aqi`` is NaN.
+    """
+
+    subs = {
+        pollutant.field: sub_index(
+            pollutant, rolling_mean(hourly[pollutant.field], pollutant.window)
+        )
+        for pollutant in POLLUTANTS
+    }
+    stacked = np.stack([subs[field] for field in AQI_FIELDS])
+    filled = np.where(np.isnan(stacked), -1.0, stacked)
+    dominant = filled.argmax(axis=0)
+    aqi = np.take_along_axis(filled, dominant[np.newaxis], axis=0)[0]
+    dominant[aqi < 0] = -1
+    aqi[aqi < 0] = np.nan
+    return aqi, dominant, subs
+
+
+def _rollup_statement(dialect: str, clauses, first: datetime, end: datetime):
+    bucket = bucket_expression(dialect, ReadingRollup.time, HOUR).label("bucket")
+    means = []
+    for field in AQI_FIELDS:
+        is_field = ReadingRollup.field == field
+        # Weighted by sample count, so a city's stations combine correctly.
+        means.append(
+            cast(
+                func.sum(case((is_field, ReadingRollup.value_sum)))
+                * 1.0
+                / func.sum(case((is_field, ReadingRollup.value_count))),
+                Float,
+            )
+        )
+    return (
+        select(ReadingRollup.city, bucket, *means)
+        .where(
+            ReadingRollup.kind == "gas",
+            ReadingRollup.period == "hour",
+            ReadingRollup.field.in_(AQI_FIELDS),
+            ReadingRollup.time >= first,
+            ReadingRollup.time < end,
+            *clauses,
+        )
+        .group_by(ReadingRollup.city, bucket)
+    )
+
+
+def _readings_statement(dialect: str, clauses, first: datetime, end: datetime):
+    bucket = bucket_expression(dialect, GasReading.time, HOUR).label("bucket")
+    means = [cast(func.avg(getattr(GasReading, field)), Float) for field in AQI_FIELDS]
+    return (
+        select(GasReading.city, bucket, *means)
+        .where(*clauses, GasReading.time >= first, GasReading.time < end)
+        .group_by(GasReading.city, bucket)
+    )
+
+
+def hourly_means(
+    cities: List[str], first: datetime, hours: int, use_rollups: bool, clauses
+) -> Dict[str, np.ndarray]:
+    """{field: array[city, hour]} of hourly mean concentrations from ``first``.
+
+    The database returns one row per city and hour with every field's mean,
+    which is copied into the arrays in a single vectorized assignment.
+    """
+
+    end = first + timedelta(hours=hours)
+    with SessionLocal() as session:
+        dialect = session.get_bind().dialect.name
+        statement = _rollup_statement if use_rollups else _readings_statement
+        rows = session.connection().execute(statement(dialect, clauses, first, end))
+        rows = rows.all()
+
+    grid = np.full((len(AQI_FIELDS), len(cities), hours), np.nan)
+    position = {city: row for row, city in enumerate(cities)}
+    offset = int((first - BUCKET_EPOCH).total_seconds()) // HOUR
+    kept = [row for row in rows if row[0] in position]
+    if kept:
+        city_rows = np.array([position[row[0]] for row in kept])
+        hour_cols = np.array([int(row[1]) for row in kept]) - offset
+        means = np.array([row[2:] for row in kept], dtype=float).T
+        inside = (hour_cols >= 0) & (hour_cols < hours)
+        grid[:, city_rows[inside], hour_cols[inside]] = means[:, inside]
+    return {field: grid[index] for index, field in enumerate(AQI_FIELDS)}
+
+
+def _json_ints(values: np.ndarray) -> List[Optional[int]]:
+    return [None if value != value else int(value) for value in values.tolist()]
+
+
+@bp.get("/aqi")
+@bp.get("/aqi/<string:path_token>")
+def air_quality_index(path_token: Optional[str] = None):
+    """Hourly US EPA AQI per city, with sub-indices and the dominant pollutant."""
+
+    auth_err = require_api_key(path_token)
+    if auth_err:
+        return auth_err
+
+    use_rollups = Config.ROLLUPS_ENABLED and request.args.get("source") != "raw"
+    model = ReadingRollup if use_rollups else GasReading
+    try:
+        clauses = parse_reading_filters(model, include_time=False)
+        start, end = parse_range()
+        start = start.replace(minute=0, second=0, microsecond=0)
+        hours = math.ceil((end - start).total_seconds() / HOUR)
+        if hours <= 0:
+            raise QueryError("invalid_time", "'to' must be after 'from'.")
+        if hours > MAX_AQI_HOURS:
+            raise QueryError(
+                "too_many_hours",
+                f"Range covers more than {MAX_AQI_HOURS} hours; request less.",
+            )
+    except QueryError as exc:
+        return exc.response()
+
+    city = extract_city_from_payload(request.args)
+    cities = [city] if city else [CITY_BY_ID[key] for key in sorted(CITY_BY_ID)]
+    first = start - timedelta(hours=LEAD_HOURS)
+    hourly = hourly_means(cities, first, hours + LEAD_HOURS, use_rollups, clauses)
+    aqi, dominant, subs = compute_aqi(hourly)
+
+    aqi, dominant = aqi[:, LEAD_HOURS:], dominant[:, LEAD_HOURS:]
+    names = np.array(AQI_FIELDS + (None,), dtype=object)
+    result: List[Dict[str, Any]] = []
+    for row, name in enumerate(cities):
+        result.append(
+            {
+                "city": name,
+                "aqi": _json_ints(aqi[row]),
+                "dominant": names[dominant[row]].tolist(),
+                "sub_indices": {
+                    field: _json_ints(subs[field][row, LEAD_HOURS:])
+                    for field in AQI_FIELDS
+                },
+            }
+        )
+    log.debug("AQI computed for %s cities x %s hours", len(cities), hours)
+    return jsonify(
+        {
+            "standard": "us-epa",
+            "source": "rollup" if use_rollups else "raw",
+            "from": start.isoformat(),
+            "hours": [
+                (start + timedelta(hours=hour)).isoformat() for hour in range(hours)
+            ],
+            "windows": {pollutant.field: pollutant.window for pollutant in POLLUTANTS},
+            "cities": result,
+        }
+    )
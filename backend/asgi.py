@@ -0,0 +1,654 @@
+import asyncio
+import json
+import queue
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qsl
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from backend.log import log
+
+from .config import CITY_BY_ID, Config
+from .anomaly import ANOMALY
+from .bootstrap import start_warmup
+from .Database.db import RAW_DB_URL, RAW_DB_URL_SECONDARY
+from .Database.rows import Row, insert_rows
+from .compact import COMPACT_MIMETYPE, CompactError, decode, decode_single
+from .compression import BodyDecodeError, decompress_body
+from .dedup import DEDUP
+from .helpers import (
+    api_key_error,
+    extract_station,
+    normalize_station_code,
+    parse_batch_body,
+)
+from .ingestion import (
+    IngestRejected,
+    apply_station_mapping,
+    batch_body,
+    batch_stations,
+    finish_duplicate,
+    finish_ingest,
+    finish_station_mapping,
+    health_status,
+    parse_station_mapping,
+    prepare_compact,
+    prepare_ingest,
+    readiness,
+    screen_rows,
+)
+from .latest import latest_body, location_filter
+from .log_handlers import SAMPLED
+from .metrics import (
+    INGEST_OUTCOMES,
+    INGEST_REQUEST_SECONDS,
+    INGEST_STAGE_SECONDS,
+    render,
+    stage,
+)
+from .ratelimit import RATE_LIMITED, RATE_LIMITER
+from .readings import QueryError
+from .replication import REPLICATOR, SecondaryWriteError
+from .spool import SPOOL, is_unavailable_error
+from .stream import DROPPED, KEEPALIVE, SSE_HEADERS, STREAM_HUB
+from .write_buffer import WRITE_BUFFER
+
+# Shared with Flask's cap on inflated bodies, so a full INGEST_BATCH_MAX_ITEMS
+# batch fits on both stacks.
+MAX_BODY_BYTES = Config.INGEST_MAX_DECOMPRESSED_BYTES
+
+# (status, JSON body), optionally followed by extra response headers.
+Response = Union[Tuple[int, Dict[str, Any]], Tuple[int, Dict[str, Any], Dict[str, str]]]
+
+
+def async_database_url(url: str) -> str:
+    """Swap the configured sync driver for its asyncio counterpart."""
+
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "mysql":
+        return parsed.set(
+            drivername=f"mysql+{Config.ASYNC_MYSQL_DRIVER}"
+        ).render_as_string(hide_password=False)
+    if backend == "sqlite":
+        return parsed.set(drivername="sqlite+aiosqlite").render_as_string(
+            hide_password=False
+        )
+    return url
+
+
+ASYNC_ENGINE = create_async_engine(
+    async_database_url(RAW_DB_URL),
+    pool_pre_ping=True,
+    pool_size=Config.ASYNC_POOL_SIZE,
+    max_overflow=Config.ASYNC_MAX_OVERFLOW,
+)
+AsyncSessionLocal = async_sessionmaker(
+    ASYNC_ENGINE, autoflush=False, expire_on_commit=False
+)
+# The secondary is written inline only in sync replication mode; in async
+# mode the replicator thread forwards rows from its durable queue instead.
+ASYNC_ENGINE_SECONDARY = (
+    create_async_engine(
+        async_database_url(RAW_DB_URL_SECONDARY),
+        pool_pre_ping=True,
+        pool_size=Config.ASYNC_POOL_SIZE,
+        max_overflow=Config.ASYNC_MAX_OVERFLOW,
+    )
+    if RAW_DB_URL_SECONDARY and not REPLICATOR.enabled
+    else None
+)
+AsyncSessionSecondary = (
+    async_sessionmaker(ASYNC_ENGINE_SECONDARY, autoflush=False, expire_on_commit=False)
+    if ASYNC_ENGINE_SECONDARY
+    else None
+)
+
+
+class Request:
+    """The parts of an HTTP request the ingest contract needs."""
+
+    def __init__(self, scope: Dict[str, Any], body: bytes) -> None:
+        self.method: str = scope["method"]
+        self.path: str = scope["path"]
+        self.headers = {
+            key.decode("latin-1").lower(): value.decode("latin-1")
+            for key, value in scope.get("headers", [])
+        }
+        self.args = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+        self.body = body
+
+    @property
+    def host(self) -> str:
+        return self.headers.get("host", "")
+
+    @property
+    def mimetype(self) -> str:
+        return self.headers.get("content-type", "").split(";")[0].strip().lower()
+
+    def payload(self) -> Dict[str, Any]:
+        """Mirror of helpers.get_payload: JSON object, then form, then query."""
+
+        content_type = self.mimetype
+        if content_type == "application/json" or content_type.endswith("+json"):
+            try:
+                data = json.loads(self.body)
+            except ValueError:
+                data = None
+            if isinstance(data, dict):
+                return data
+        if content_type == "application/x-www-form-urlencoded" and self.body:
+            form = dict(parse_qsl(self.body.decode("utf-8", "replace")))
+            if form:
+                return form
+        return dict(self.args)
+
+    def api_key(self, path_token: Optional[str]) -> Optional[str]:
+        return (
+            self.headers.get("x-api-key")
+            or self.args.get("api_key")
+            or self.args.get("x-api-key")
+            or path_token
+        )
+
+    def api_key_error(self, path_token: Optional[str]) -> Optional[Response]:
+        error = api_key_error(self.api_key(path_token))
+        return (401, error) if error else None
+
+
+async def _commit_or_spool(session: AsyncSession, rows: List[Row]) -> bool:
+    """Async counterpart of SPOOL.commit_or_spool; True when rows were spooled."""
+
+    if SPOOL.enabled and not SPOOL.primary_available():
+        await asyncio.to_thread(SPOOL.spool, rows)
+        return True
+
+    secondary = AsyncSessionSecondary() if AsyncSessionSecondary else None
+    try:
+        started = time.perf_counter()
+        await session.run_sync(insert_rows, rows)
+        primary_seconds = time.perf_counter() - started
+        if secondary is not None:
+            with stage("secondary_commit"):
+                try:
+                    await secondary.run_sync(insert_rows, rows)
+                    await secondary.commit()
+                except Exception as exc:
+                    raise SecondaryWriteError(
+                        f"Secondary write of {len(rows)} rows failed: {exc}"
+                    ) from exc
+        started = time.perf_counter()
+        await session.commit()
+        primary_seconds += time.perf_counter() - started
+        INGEST_STAGE_SECONDS.labels("primary_commit").observe(primary_seconds)
+    except Exception as exc:
+        await session.rollback()
+        if secondary is not None:
+            await secondary.rollback()
+        if not (SPOOL.enabled and is_unavailable_error(exc)):
+            raise
+        log.warning("Primary database unavailable; spooling %s rows", len(rows))
+        SPOOL.mark_unavailable()
+        await asyncio.to_thread(SPOOL.spool, rows)
+        return True
+    finally:
+        if secondary is not None:
+            await secondary.close()
+    if REPLICATOR.enabled:
+        await asyncio.to_thread(REPLICATOR.enqueue_rows, rows)
+    return False
+
+
+async def health(request: Request) -> Response:
+    return 200, await asyncio.to_thread(health_status)
+
+
+async def ready(request: Request) -> Response:
+    body, is_ready = await asyncio.to_thread(readiness)
+    return 200 if is_ready else 503, body
+
+
+async def ingest(
+    request: Request, path_token: Optional[str] = None, city: Optional[str] = None
+) -> Response:
+    log.info("Start ingest from %s", request.host, extra=SAMPLED)
+    with stage("require_api_key"):
+        auth_err = request.api_key_error(path_token)
+    if auth_err:
+        log.warning("Unauthorized ingest attempt from %s", request.host)
+        INGEST_OUTCOMES.labels("ingest", "unauthorized").inc()
+        return auth_err
+
+    with stage("get_payload"):
+        if request.mimetype == COMPACT_MIMETYPE:
+            try:
+                packet = decode_single(request.body)
+            except CompactError as exc:
+                INGEST_OUTCOMES.labels("ingest", "invalid_payload").inc()
+                return 400, {"error": "invalid_payload", "message": str(exc)}
+        else:
+            packet, data = None, request.payload()
+
+    if RATE_LIMITER.enabled:
+        with stage("rate_limit"):
+            station = packet.station if packet is not None else extract_station(data)
+            retry_after = RATE_LIMITER.retry_after(
+                request.api_key(path_token), normalize_station_code(station)
+            )
+        if retry_after:
+            log.info("Rate limited ingest station=%s", station, extra=SAMPLED)
+            INGEST_OUTCOMES.labels("ingest", "rate_limited").inc()
+            return 429, RATE_LIMITED, {"Retry-After": str(retry_after)}
+
+    key = None
+    async with AsyncSessionLocal() as session:
+        try:
+            # The shared sync pipeline runs on the async connection via greenlets.
+            if packet is not None:
+                rows, city, device_time = await session.run_sync(
+                    prepare_compact, packet, city
+                )
+            else:
+                rows, city, device_time = await session.run_sync(
+                    prepare_ingest, data, city
+                )
+            if DEDUP.enabled:
+                key = DEDUP.key_for(
+                    request.headers.get("idempotency-key"), rows, device_time
+                )
+            if key:
+                with stage("dedup"):
+                    if WRITE_BUFFER.enabled:
+                        # The flusher claims the key with the rows it inserts.
+                        duplicate = await session.run_sync(DEDUP.seen, [key])
+                    else:
+                        duplicate = await session.run_sync(DEDUP.check, [key])
+                if duplicate:
+                    await session.rollback()
+                    return 200, finish_duplicate("ingest", city)
+            rows = screen_rows(rows)
+            if WRITE_BUFFER.enabled and (rows or key):
+                if not WRITE_BUFFER.submit(rows, key):
+                    await session.rollback()
+                    log.warning("Write buffer full; rejecting ingest city=%s", city)
+                    INGEST_OUTCOMES.labels("ingest", "buffer_full").inc()
+                    return (
+                        503,
+                        {
+                            "error": "buffer_full",
+                            "message": "Ingest write buffer is full; retry later.",
+                        },
+                        {
+                            "Retry-After": str(
+                                max(1, round(WRITE_BUFFER.flush_interval))
+                            )
+                        },
+                    )
+                spooled = False
+            elif rows:
+                spooled = await _commit_or_spool(session, rows)
+            else:
+                # Every value was quarantined; keep the claim, if any, all the same.
+                await session.commit()
+                spooled = False
+        except IngestRejected as exc:
+            await session.rollback()
+            INGEST_OUTCOMES.labels("ingest", exc.error).inc()
+            return exc.status, exc.body()
+        except Exception:
+            await session.rollback()
+            log.exception("Failed to write ingest data to databases")
+            INGEST_OUTCOMES.labels("ingest", "db_write_failed").inc()
+            return 500, {"error": "db_write_failed"}
+
+    if key:
+        DEDUP.remember([key])
+    # Logging and the shared /latest file are blocking I/O.
+    body = await asyncio.to_thread(
+        finish_ingest, "ingest", rows, city, spooled, WRITE_BUFFER.enabled
+    )
+    return 200, body
+
+
+async def ingest_batch(request: Request, path_token: Optional[str] = None) -> Response:
+    with stage("require_api_key"):
+        auth_err = request.api_key_error(path_token)
+    if auth_err:
+        log.warning("Unauthorized batch ingest attempt from %s", request.host)
+        INGEST_OUTCOMES.labels("ingest_batch", "unauthorized").inc()
+        return auth_err
+
+    with stage("get_payload"):
+        if request.mimetype == COMPACT_MIMETYPE:
+            try:
+                items = decode(request.body)
+            except CompactError:
+                items = None
+        else:
+            content_type = request.mimetype
+            items = parse_batch_body(
+                request.body.decode("utf-8", "replace"),
+                content_type == "application/json" or content_type.endswith("+json"),
+            )
+    if items is None:
+        log.info("Batch ingest with unreadable body from %s", request.host)
+
+    if RATE_LIMITER.enabled:
+        with stage("rate_limit"):
+            retry_after = RATE_LIMITER.retry_after_batch(
+                request.api_key(path_token), batch_stations(items)
+            )
+        if retry_after:
+            INGEST_OUTCOMES.labels("ingest_batch", "rate_limited").inc()
+            return 429, RATE_LIMITED, {"Retry-After": str(retry_after)}
+    # Batches are chunked through the sync engine, so they run off the loop.
+    return await asyncio.to_thread(
+        batch_body, items, request.headers.get("idempotency-key")
+    )
+
+
+async def station_mappings(
+    request: Request, path_token: Optional[str] = None
+) -> Response:
+    auth_err = request.api_key_error(path_token)
+    if auth_err:
+        log.warning("Unauthorized station-mapping attempt from %s", request.host)
+        return auth_err
+
+    try:
+        new_code, city, previous_code = parse_station_mapping(request.payload())
+    except IngestRejected as exc:
+        return exc.status, exc.body()
+
+    async with AsyncSessionLocal() as session:
+        secondary = AsyncSessionSecondary() if AsyncSessionSecondary else None
+        secondary_sync = secondary.sync_session if secondary is not None else None
+        try:
+            operation, city, prior_code = await session.run_sync(
+                lambda sync_session: apply_station_mapping(
+                    sync_session, secondary_sync, new_code, city, previous_code
+                )
+            )
+            if secondary is not None:
+                await secondary.commit()
+            await session.commit()
+        except IngestRejected as exc:
+            await session.rollback()
+            if secondary is not None:
+                await secondary.rollback()
+            return exc.status, exc.body()
+        except Exception:
+            await session.rollback()
+            if secondary is not None:
+                await secondary.rollback()
+            log.exception("Failed to write station mapping to databases")
+            return 500, {"error": "db_write_failed"}
+        finally:
+            if secondary is not None:
+                await secondary.close()
+
+    body = await asyncio.to_thread(
+        finish_station_mapping, operation, new_code, city, prior_code
+    )
+    return 200, body
+
+
+async def cities(request: Request, path_token: Optional[str] = None) -> Response:
+    auth_err = request.api_key_error(path_token)
+    if auth_err:
+        return auth_err
+    return 200, {
+        "cities": [
+            {"id": city_id, "name": name}
+            for city_id, name in sorted(CITY_BY_ID.items())
+        ]
+    }
+
+
+async def latest(request: Request, path_token: Optional[str] = None) -> Response:
+    auth_err = request.api_key_error(path_token)
+    if auth_err:
+        return auth_err
+    return latest_body(request.args)
+
+
+async def stream(
+    request: Request, receive, send, path_token: Optional[str] = None
+) -> None:
+    """SSE on the event loop: one task per subscriber, no thread blocked on it."""
+
+    auth_err = request.api_key_error(path_token)
+    if auth_err:
+        await _send_json(send, *auth_err)
+        return
+    try:
+        city, station = location_filter(request.args)
+    except QueryError as exc:
+        await _send_json(send, 400, {"error": exc.error, "message": exc.message})
+        return
+
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+
+    def notify() -> None:
+        try:
+            loop.call_soon_threadsafe(wake.set)
+        except RuntimeError:  # Loop already closed at shutdown.
+            pass
+
+    subscriber = STREAM_HUB.subscribe(city, station, notify)
+    if subscriber is None:
+        await _send_json(send, 503, {"error": "too_many_subscribers"})
+        return
+    disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        headers = [(b"content-type", b"text/event-stream")]
+        headers.extend(
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in SSE_HEADERS.items()
+        )
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send(
+            {
+                "type": "http.response.body",
+                "body": b"retry: 3000\n\n",
+                "more_body": True,
+            }
+        )
+        while not disconnected.done():
+            woken = asyncio.ensure_future(wake.wait())
+            await asyncio.wait(
+                {woken, disconnected},
+                timeout=Config.STREAM_HEARTBEAT,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            woken.cancel()
+            wake.clear()
+            chunks: List[bytes] = []
+            while True:
+                try:
+                    chunks.append(subscriber.events.get_nowait())
+                except queue.Empty:
+                    break
+            if subscriber.dropped:
+                await send({"type": "http.response.body", "body": DROPPED})
+                return
+            if not disconnected.done():
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": b"".join(chunks) or KEEPALIVE,
+                        "more_body": True,
+                    }
+                )
+    finally:
+        STREAM_HUB.unsubscribe(subscriber)
+        disconnected.cancel()
+
+
+async def metrics(
+    request: Request, receive, send, path_token: Optional[str] = None
+) -> None:
+    auth_err = request.api_key_error(path_token)
+    if auth_err:
+        await _send_json(send, *auth_err)
+        return
+    data = render().encode()
+    headers = [
+        (b"content-type", b"text/plain; version=0.0.4"),
+        (b"content-length", str(len(data)).encode()),
+    ]
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+    await send({"type": "http.response.body", "body": data})
+
+
+async def _wait_disconnect(receive) -> None:
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+Handler = Callable[..., Awaitable[Response]]
+
+ROUTES: List[Tuple[str, "re.Pattern[str]", Handler]] = [
+    ("GET", re.compile(r"/health"), health),
+    ("GET", re.compile(r"/ready"), ready),
+    # Before /ingest, whose path_token would otherwise swallow "batch".
+    ("POST", re.compile(r"/ingest/batch(?:/(?P<path_token>[^/]+))?"), ingest_batch),
+    (
+        "POST",
+        re.compile(r"/ingest(?:/(?P<path_token>[^/]+)(?:/(?P<city>[^/]+))?)?"),
+        ingest,
+    ),
+    (
+        "POST",
+        re.compile(r"/station-mappings(?:/(?P<path_token>[^/]+))?"),
+        station_mappings,
+    ),
+    ("GET", re.compile(r"/cities(?:/(?P<path_token>[^/]+))?"), cities),
+    ("GET", re.compile(r"/latest(?:/(?P<path_token>[^/]+))?"), latest),
+    ("GET", re.compile(r"/stream(?:/(?P<path_token>[^/]+))?"), stream),
+    ("GET", re.compile(r"/metrics(?:/(?P<path_token>[^/]+))?"), metrics),
+]
+
+
+class _Disconnected(Exception):
+    pass
+
+
+async def _read_body(receive) -> Optional[bytes]:
+    """Return the request body, or None once it exceeds MAX_BODY_BYTES."""
+
+    chunks: List[bytes] = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise _Disconnected()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+async def _send_json(
+    send, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None
+) -> None:
+    data = json.dumps(body, sort_keys=True).encode()
+    raw_headers = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(data)).encode()),
+    ]
+    for name, value in (headers or {}).items():
+        raw_headers.append((name.lower().encode("latin-1"), value.encode("latin-1")))
+    await send(
+        {"type": "http.response.start", "status": status, "headers": raw_headers}
+    )
+    await send({"type": "http.response.body", "body": data})
+
+
+async def _lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # Schema bootstrap runs in the background; /ready reports when it is done.
+            start_warmup()
+            REPLICATOR.start()
+            SPOOL.start()
+            ANOMALY.start()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await ASYNC_ENGINE.dispose()
+            if ASYNC_ENGINE_SECONDARY is not None:
+                await ASYNC_ENGINE_SECONDARY.dispose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send) -> None:
+    """ASGI app serving ingest, batch ingest, station mappings, cities,
+    /latest, /stream and /metrics.
+
+    Run with ``uvicorn backend.asgi:app``. The Flask app keeps serving the
+    full API; this entry point trades it for one event loop holding many
+    concurrent sensor connections on the async engine. The read API
+    (/readings, /export, /aggregates, /aqi), /test, the CLI commands, the
+    rollup worker and the per-request schema bootstrap are Flask only.
+    Batch ingest and the write buffer's flusher use the sync engine from
+    worker threads. /stream is served here only, and only carries readings
+    this process ingests, so run a single process when dashboards use it.
+    """
+
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    path = scope["path"].rstrip("/") or "/"
+    allowed = False
+    for method, pattern, handler in ROUTES:
+        match = pattern.fullmatch(path)
+        if match is None:
+            continue
+        allowed = True
+        if method != scope["method"]:
+            continue
+        try:
+            body = await _read_body(receive)
+        except _Disconnected:
+            return
+        if body is None:
+            await _send_json(send, 413, {"error": "payload_too_large"})
+            return
+        request = Request(scope, body)
+        try:
+            request.body = decompress_body(
+                body,
+                request.headers.get("content-encoding", ""),
+                Config.INGEST_MAX_DECOMPRESSED_BYTES,
+            )
+        except BodyDecodeError as exc:
+            await _send_json(send, exc.status, exc.body())
+            return
+        params = {k: v for k, v in match.groupdict().items() if v is not None}
+        if handler is stream or handler is metrics:
+            await handler(request, receive, send, **params)
+            return
+        if handler is ingest or handler is ingest_batch:
+            with INGEST_REQUEST_SECONDS.labels(handler.__name__).time():
+                response = await handler(request, **params)
+        else:
+            response = await handler(request, **params)
+        await _send_json(send, *response)
+        return
+
+    if allowed:
+        await _send_json(send, 405, {"error": "method_not_allowed"})
+    else:
+        await _send_json(send, 404, {"error": "not_found"})
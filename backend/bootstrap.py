@@ -0,0 +1,57 @@
+import threading
+
+import click
+from flask.cli import AppGroup
+
+from backend.log import log
+
+from .config import Config
+from .Database.db import init_db
+from .latest import LATEST
+from .station_cache import STATION_CACHE
+
+
+def bootstrap_database() -> None:
+    """Create the schema, prime the station cache and the latest readings."""
+
+    init_db()
+    STATION_CACHE.load()
+    LATEST.load()
+
+
+def _warm_up(max_backoff: float) -> None:
+    delay = 1.0
+    stop = threading.Event()
+    while True:
+        try:
+            bootstrap_database()
+        except Exception:
+            log.warning(
+                "Database warm-up failed; retrying in %.0fs", delay, exc_info=True
+            )
+            stop.wait(delay)
+            delay = min(delay * 2, max_backoff)
+            continue
+        log.info("Database warm-up complete")
+        return
+
+
+def start_warmup(max_backoff: float = Config.DB_WARMUP_MAX_BACKOFF) -> threading.Thread:
+    """Bootstrap the database in the background, retrying until it succeeds."""
+
+    thread = threading.Thread(
+        target=_warm_up, args=(max_backoff,), name="db-warmup", daemon=True
+    )
+    thread.start()
+    return thread
+
+
+db_cli = AppGroup("db", help="Database bootstrap commands.")
+
+
+@db_cli.command("init")
+def init_command() -> None:
+    """Create missing databases and tables (and partitions, if enabled)."""
+
+    init_db()
+    click.echo("Database schema is up to date.")
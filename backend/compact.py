@@ -0,0 +1,122 @@
+import math
+import struct
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .helpers import GAS_FIELDS, METEO_FIELDS, parse_timestamp, to_float
+
+# Binary alternative to JSON/form bodies for boxes on metered links.
+#
+# A body is one or more records, all little-endian:
+#
+#   u8   version (1)
+#   u8   station code length N, then N bytes of ASCII station code
+#   u32  device time as epoch seconds, 0 to use the server clock
+#   u16  presence bitmap; bit i set means FIELDS[i] follows
+#   f32  value of each present field, in FIELDS order
+#
+# Meteo values are final units (P in hPa, TEMP in °C, RH in %), so a record
+# with all thirteen fields and a 12-byte MAC is 73 bytes.
+COMPACT_MIMETYPE = "application/x-ssb-reading"
+VERSION = 1
+FIELDS = GAS_FIELDS + METEO_FIELDS
+
+_HEAD = struct.Struct("<BB")
+_TAIL = struct.Struct("<IH")
+_VALUES = {count: struct.Struct(f"<{count}f") for count in range(len(FIELDS) + 1)}
+_ALL_FIELDS = (1 << len(FIELDS)) - 1
+
+
+def _celsius(value: float) -> Optional[float]:
+    return value if math.isfinite(value) else None
+
+
+# The JSON/form rules (-1 is missing, negatives are 0, NaN and Infinity are
+# missing) for every field but TEMP, which is already °C and may be negative.
+_CONVERT = tuple(_celsius if name == "TEMP" else to_float for name in FIELDS)
+
+
+class CompactError(ValueError):
+    """Body is not a valid sequence of compact records."""
+
+
+@lru_cache(maxsize=None)
+def _present(bitmap: int) -> Tuple[int, ...]:
+    return tuple(index for index in range(len(FIELDS)) if bitmap >> index & 1)
+
+
+class CompactReading(NamedTuple):
+    station: str
+    time: Optional[datetime]
+    gas: Dict[str, Optional[float]]
+    meteo: Dict[str, Optional[float]]
+
+
+def decode(body: bytes) -> List[CompactReading]:
+    """Decode every record in ``body`` straight into gas/meteo field dicts."""
+
+    readings: List[CompactReading] = []
+    view = memoryview(body)
+    offset = 0
+    try:
+        while offset < len(view):
+            version, length = _HEAD.unpack_from(view, offset)
+            if version != VERSION:
+                raise CompactError(f"Unsupported record version {version}.")
+            offset += _HEAD.size
+            station = bytes(view[offset : offset + length]).decode("ascii")
+            offset += length
+            epoch, bitmap = _TAIL.unpack_from(view, offset)
+            offset += _TAIL.size
+            if bitmap & ~_ALL_FIELDS:
+                raise CompactError(f"Unknown fields in bitmap {bitmap:#06x}.")
+            present = _present(bitmap)
+            values = _VALUES[len(present)].unpack_from(view, offset)
+            offset += _VALUES[len(present)].size
+
+            fields: Dict[str, Optional[float]] = dict.fromkeys(FIELDS)
+            for index, value in zip(present, values):
+                fields[FIELDS[index]] = _CONVERT[index](value)
+            readings.append(
+                CompactReading(
+                    station,
+                    parse_timestamp(epoch) if epoch else None,
+                    {name: fields[name] for name in GAS_FIELDS},
+                    {name: fields[name] for name in METEO_FIELDS},
+                )
+            )
+    except (struct.error, UnicodeDecodeError) as exc:
+        raise CompactError(f"Truncated or malformed record at byte {offset}.") from exc
+    if not readings:
+        raise CompactError("Body contains no records.")
+    return readings
+
+
+def decode_single(body: bytes) -> CompactReading:
+    """Decode a body that must hold exactly one record."""
+
+    readings = decode(body)
+    if len(readings) != 1:
+        raise CompactError("Send one record per request; use /ingest/batch for more.")
+    return readings[0]
+
+
+def encode(
+    station: str,
+    fields: Dict[str, Optional[float]],
+    epoch: Optional[int] = None,
+) -> bytes:
+    """Encode one record; ``fields`` uses GAS_FIELDS/METEO_FIELDS names."""
+
+    code = station.encode("ascii")
+    present = [
+        index for index, name in enumerate(FIELDS) if fields.get(name) is not None
+    ]
+    bitmap = sum(1 << index for index in present)
+    return (
+        _HEAD.pack(VERSION, len(code))
+        + code
+        + _TAIL.pack(epoch or 0, bitmap)
+        + _VALUES[len(present)].pack(*(fields[FIELDS[index]] for index in present))
+    )
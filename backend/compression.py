@@ -0,0 +1,106 @@
+import io
+import json
+import zlib
+from typing import Dict
+
+from werkzeug.wsgi import get_input_stream
+
+from backend.log import log
+
+
+class BodyDecodeError(Exception):
+    """Request body could not be decoded; carries the HTTP status and error code."""
+
+    def __init__(self, status: int, error: str, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+        self.error = error
+        self.message = message
+
+    def body(self) -> Dict[str, str]:
+        return {"error": self.error, "message": self.message}
+
+
+def _deflate_wbits(body: bytes) -> int:
+    # HTTP "deflate" is meant to be zlib-wrapped, but some clients send raw deflate.
+    if len(body) >= 2 and body[0] & 0x0F == 8 and (body[0] << 8 | body[1]) % 31 == 0:
+        return zlib.MAX_WBITS
+    return -zlib.MAX_WBITS
+
+
+def decompress_body(body: bytes, encoding: str, max_bytes: int) -> bytes:
+    """Undo a gzip/deflate Content-Encoding, refusing output over ``max_bytes``."""
+
+    encoding = encoding.strip().lower()
+    if encoding in ("", "identity"):
+        return body
+    if encoding in ("gzip", "x-gzip"):
+        wbits = 16 + zlib.MAX_WBITS
+    elif encoding == "deflate":
+        wbits = _deflate_wbits(body)
+    else:
+        raise BodyDecodeError(
+            415,
+            "unsupported_encoding",
+            "Content-Encoding must be gzip, deflate or identity.",
+        )
+
+    decompressor = zlib.decompressobj(wbits)
+    try:
+        # max_length stops inflating at the cap, so a tiny bomb cannot
+        # allocate more than max_bytes.
+        data = decompressor.decompress(body, max_bytes + 1)
+    except zlib.error:
+        raise BodyDecodeError(400, "invalid_body", f"Body is not valid {encoding}.")
+    if len(data) > max_bytes or decompressor.unconsumed_tail:
+        raise BodyDecodeError(
+            413,
+            "payload_too_large",
+            f"Decompressed body exceeds {max_bytes} bytes.",
+        )
+    if not decompressor.eof:
+        raise BodyDecodeError(400, "invalid_body", f"Body is truncated {encoding}.")
+    return data
+
+
+class DecompressionMiddleware:
+    """WSGI middleware that inflates compressed request bodies before Flask sees them.
+
+    get_json, form parsing and NDJSON batches then work unchanged.
+    """
+
+    def __init__(self, app, max_bytes: int) -> None:
+        self.app = app
+        self.max_bytes = max_bytes
+
+    def __call__(self, environ, start_response):
+        encoding = environ.get("HTTP_CONTENT_ENCODING", "")
+        if encoding.strip().lower() in ("", "identity"):
+            return self.app(environ, start_response)
+
+        compressed = get_input_stream(environ).read(self.max_bytes + 1)
+        try:
+            if len(compressed) > self.max_bytes:
+                raise BodyDecodeError(
+                    413,
+                    "payload_too_large",
+                    f"Body exceeds {self.max_bytes} bytes.",
+                )
+            body = decompress_body(compressed, encoding, self.max_bytes)
+        except BodyDecodeError as exc:
+            log.info("Rejected %s request body: %s", encoding, exc.error)
+            data = json.dumps(exc.body()).encode()
+            start_response(
+                f"{exc.status} {exc.error.replace('_', ' ').title()}",
+                [
+                    ("Content-Type", "application/json"),
+                    ("Content-Length", str(len(data))),
+                ],
+            )
+            return [data]
+
+        del environ["HTTP_CONTENT_ENCODING"]
+        environ["CONTENT_LENGTH"] = str(len(body))
+        environ["wsgi.input"] = io.BytesIO(body)
+        environ.pop("wsgi.input_terminated", None)
+        return self.app(environ, start_response)
@@ -1,11 +1,15 @@
+import atexit
 import logging
 import os
-from logging.handlers import TimedRotatingFileHandler
+import queue
+from logging.handlers import QueueListener, TimedRotatingFileHandler
 from pathlib import Path
 from typing import Dict, Optional
 
 from dotenv import load_dotenv
 
+from .log_handlers import DeferredQueueHandler, JsonFormatter, SamplingFilter
+
 LOG_DIR = "logs"
 LOG_FILE = os.path.join(LOG_DIR, "app.log")
 
@@ -35,6 +39,10 @@ CITY_BY_ID: Dict[int, str] = {
 load_dotenv(Path(__file__).resolve().parent.parent / ".env")
 
 
+def _env_flag(name: str, default: str = "0") -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
 class Config:
     """Application configuration sourced from environment variables."""
 
@@ -50,8 +58,115 @@ class Config:
     DB_USER2: str = os.getenv("DB_USER2", "")
     DB_PASSWORD2: str = os.getenv("DB_PASSWORD2", "")
     DB_NAME2: str = os.getenv("DB_NAME2", "")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+    DB_POOL_SIZE2: int = int(os.getenv("DB_POOL_SIZE2", str(DB_POOL_SIZE)))
+    DB_MAX_OVERFLOW2: int = int(os.getenv("DB_MAX_OVERFLOW2", str(DB_MAX_OVERFLOW)))
+    DB_POOL_RECYCLE2: int = int(os.getenv("DB_POOL_RECYCLE2", str(DB_POOL_RECYCLE)))
+    DB_POOL_TIMEOUT2: float = float(os.getenv("DB_POOL_TIMEOUT2", str(DB_POOL_TIMEOUT)))
     API_KEY: Optional[str] = os.getenv("INGEST_API_KEY")
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_ASYNC: bool = _env_flag("LOG_ASYNC")
+    LOG_JSON: bool = _env_flag("LOG_JSON")
+    LOG_SAMPLE_RATE: float = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+    LOG_SAMPLED_PER_SECOND: int = int(os.getenv("LOG_SAMPLED_PER_SECOND", "0"))
+    STATION_CACHE_TTL: float = float(os.getenv("STATION_CACHE_TTL", "60"))
+    STATION_CACHE_MISS_TTL: float = float(os.getenv("STATION_CACHE_MISS_TTL", "5"))
+    INGEST_BATCH_MAX_ITEMS: int = int(os.getenv("INGEST_BATCH_MAX_ITEMS", "10000"))
+    INGEST_BATCH_CHUNK_SIZE: int = int(os.getenv("INGEST_BATCH_CHUNK_SIZE", "500"))
+    SECONDARY_REPLICATION: str = os.getenv("SECONDARY_REPLICATION", "sync").lower()
+    REPLICATION_QUEUE_PATH: str = os.getenv(
+        "REPLICATION_QUEUE_PATH", os.path.join("data", "secondary_queue.sqlite3")
+    )
+    REPLICATION_BATCH_SIZE: int = int(os.getenv("REPLICATION_BATCH_SIZE", "500"))
+    REPLICATION_MAX_BACKOFF: float = float(os.getenv("REPLICATION_MAX_BACKOFF", "60"))
+    SPOOL_ENABLED: bool = _env_flag("SPOOL_ENABLED")
+    SPOOL_PATH: str = os.getenv(
+        "SPOOL_PATH", os.path.join("data", "ingest_spool.sqlite3")
+    )
+    SPOOL_BATCH_SIZE: int = int(os.getenv("SPOOL_BATCH_SIZE", "1000"))
+    SPOOL_RETRY_INTERVAL: float = float(os.getenv("SPOOL_RETRY_INTERVAL", "5"))
+    ROLLUPS_ENABLED: bool = _env_flag("ROLLUPS_ENABLED")
+    ROLLUP_INTERVAL: float = float(os.getenv("ROLLUP_INTERVAL", "60"))
+    ROLLUP_BATCH_SIZE: int = int(os.getenv("ROLLUP_BATCH_SIZE", "5000"))
+    # Longer than any ingest transaction stays open; see rollups.update_rollups.
+    ROLLUP_SAFETY_LAG: float = float(os.getenv("ROLLUP_SAFETY_LAG", "30"))
+    PARTITIONING_ENABLED: bool = _env_flag("PARTITIONING_ENABLED")
+    PARTITION_MONTHS_AHEAD: int = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+    PARTITION_RETENTION_MONTHS: int = int(os.getenv("PARTITION_RETENTION_MONTHS", "0"))
+    PARTITION_ARCHIVE: bool = _env_flag("PARTITION_ARCHIVE")
+    EXPORT_CHUNK_SIZE: int = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+    ASYNC_MYSQL_DRIVER: str = os.getenv("ASYNC_MYSQL_DRIVER", "aiomysql")
+    ASYNC_POOL_SIZE: int = int(os.getenv("ASYNC_POOL_SIZE", "20"))
+    ASYNC_MAX_OVERFLOW: int = int(os.getenv("ASYNC_MAX_OVERFLOW", "20"))
+    DB_WARMUP: bool = _env_flag("DB_WARMUP", "1")
+    DB_WARMUP_MAX_BACKOFF: float = float(os.getenv("DB_WARMUP_MAX_BACKOFF", "30"))
+    SERVER_BIND: str = os.getenv("SERVER_BIND", "0.0.0.0:4000")
+    SERVER_WORKERS: int = int(
+        os.getenv("SERVER_WORKERS", str(2 * (os.cpu_count() or 1) + 1))
+    )
+    SERVER_THREADS: int = int(os.getenv("SERVER_THREADS", "4"))
+    SERVER_TIMEOUT: int = int(os.getenv("SERVER_TIMEOUT", "30"))
+    SERVER_MAX_REQUESTS: int = int(os.getenv("SERVER_MAX_REQUESTS", "0"))
+    RATE_LIMIT_ENABLED: bool = _env_flag("RATE_LIMIT_ENABLED")
+    # Sustained requests per second and burst size; a rate of 0 disables that limit.
+    # Every box shares INGEST_API_KEY, so the key bucket is one ceiling on all
+    # ingest (per worker, or per host with RATE_LIMIT_SHARED_PATH) and is off
+    # by default; the station bucket, charged once per station in a batch,
+    # is what stops a single looping box.
+    RATE_LIMIT_KEY_RATE: float = float(os.getenv("RATE_LIMIT_KEY_RATE", "0"))
+    RATE_LIMIT_KEY_BURST: float = float(os.getenv("RATE_LIMIT_KEY_BURST", "200"))
+    RATE_LIMIT_STATION_RATE: float = float(os.getenv("RATE_LIMIT_STATION_RATE", "1"))
+    RATE_LIMIT_STATION_BURST: float = float(os.getenv("RATE_LIMIT_STATION_BURST", "10"))
+    # Set to a file path to share buckets between the workers on this host.
+    RATE_LIMIT_SHARED_PATH: str = os.getenv("RATE_LIMIT_SHARED_PATH", "")
+    RATE_LIMIT_MAX_KEYS: int = int(os.getenv("RATE_LIMIT_MAX_KEYS", "4096"))
+    # Set to a file path to share the /latest store between the workers on this
+    # host; the preforked server uses data/latest.sqlite3 with several workers.
+    LATEST_SHARED_PATH: str = os.getenv("LATEST_SHARED_PATH", "")
+    # /stream: open connections per process, queued events per connection
+    # before a slow consumer is dropped, and seconds between keepalives.
+    STREAM_MAX_SUBSCRIBERS: int = int(os.getenv("STREAM_MAX_SUBSCRIBERS", "1000"))
+    STREAM_QUEUE_SIZE: int = int(os.getenv("STREAM_QUEUE_SIZE", "256"))
+    STREAM_HEARTBEAT: float = float(os.getenv("STREAM_HEARTBEAT", "15"))
+    INGEST_MAX_DECOMPRESSED_BYTES: int = int(
+        os.getenv("INGEST_MAX_DECOMPRESSED_BYTES", str(16 << 20))
+    )
+    # Device timestamps further off the server clock than this are refused,
+    # or replaced by the server time with INGEST_CLOCK_SKEW_POLICY=server_time.
+    # An Ecowitt dateutc sent without any other time is always replaced.
+    INGEST_MAX_FUTURE_SKEW: float = float(os.getenv("INGEST_MAX_FUTURE_SKEW", "300"))
+    INGEST_MAX_PAST_SKEW: float = float(os.getenv("INGEST_MAX_PAST_SKEW", "604800"))
+    INGEST_CLOCK_SKEW_POLICY: str = os.getenv(
+        "INGEST_CLOCK_SKEW_POLICY", "reject"
+    ).lower()
+    IDEMPOTENCY_ENABLED: bool = _env_flag("IDEMPOTENCY_ENABLED")
+    IDEMPOTENCY_CACHE_SIZE: int = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "100000"))
+    IDEMPOTENCY_CACHE_TTL: float = float(os.getenv("IDEMPOTENCY_CACHE_TTL", "3600"))
+    IDEMPOTENCY_RETENTION_HOURS: int = int(
+        os.getenv("IDEMPOTENCY_RETENTION_HOURS", "48")
+    )
+    ANOMALY_ENABLED: bool = _env_flag("ANOMALY_ENABLED")
+    # "flag" counts and logs spikes; "quarantine" also drops them from the row.
+    ANOMALY_ACTION: str = os.getenv("ANOMALY_ACTION", "flag").lower()
+    ANOMALY_THRESHOLD: float = float(os.getenv("ANOMALY_THRESHOLD", "6"))
+    ANOMALY_ALPHA: float = float(os.getenv("ANOMALY_ALPHA", "0.05"))
+    ANOMALY_WARMUP: int = int(os.getenv("ANOMALY_WARMUP", "30"))
+    ANOMALY_MIN_SPREAD: float = float(os.getenv("ANOMALY_MIN_SPREAD", "0.05"))
+    ANOMALY_CHECKPOINT_PATH: str = os.getenv(
+        "ANOMALY_CHECKPOINT_PATH", os.path.join("data", "anomaly_state.json")
+    )
+    ANOMALY_CHECKPOINT_INTERVAL: float = float(
+        os.getenv("ANOMALY_CHECKPOINT_INTERVAL", "60")
+    )
+    WRITE_BUFFER_ENABLED: bool = _env_flag("WRITE_BUFFER_ENABLED")
+    WRITE_BUFFER_MAX_ROWS: int = int(os.getenv("WRITE_BUFFER_MAX_ROWS", "10000"))
+    WRITE_BUFFER_BATCH_SIZE: int = int(os.getenv("WRITE_BUFFER_BATCH_SIZE", "500"))
+    WRITE_BUFFER_FLUSH_INTERVAL: float = float(
+        os.getenv("WRITE_BUFFER_FLUSH_INTERVAL", "1.0")
+    )
 
 
 def build_mysql_url_from_parts(
@@ -96,26 +211,65 @@ def log_setup(config: Config = Config):
     LOG_DIR = "logs"
     LOG_FILE = os.path.join(LOG_DIR, "app.log")
 
+    logger = logging.getLogger("APP")
+    if logger.handlers:
+        return logger
+
     if not os.path.exists(LOG_DIR):
         os.makedirs(LOG_DIR)
 
     LOG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+    formatter = JsonFormatter() if config.LOG_JSON else logging.Formatter(LOG_FORMAT)
 
     file_handler = TimedRotatingFileHandler(
         LOG_FILE, when="midnight", interval=1, backupCount=7, encoding="utf-8"
     )
-    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    file_handler.setFormatter(formatter)
     file_handler.setLevel(logging.DEBUG)
 
     console_handler = logging.StreamHandler()
-    console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    console_handler.setFormatter(formatter)
     console_handler.setLevel(logging.INFO)
 
-    logger = logging.getLogger("APP")
-    if logger.handlers:
+    logger.setLevel(logging.DEBUG)  # Мінімальний рівень логування
+    logger.addFilter(
+        SamplingFilter(config.LOG_SAMPLE_RATE, config.LOG_SAMPLED_PER_SECOND)
+    )
+    if config.LOG_ASYNC:
+        # Request threads only enqueue; rotation and disk writes happen here.
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        _start_log_listener(log_queue, file_handler, console_handler)
+        logger.addHandler(DeferredQueueHandler(log_queue))
         return logger
 
-    logger.setLevel(logging.DEBUG)  # Мінімальний рівень логування
     logger.addHandler(file_handler)
     logger.addHandler(console_handler)
     return logger
+
+
+_log_listener: Optional[QueueListener] = None
+
+
+def _start_log_listener(log_queue: queue.SimpleQueue, *handlers) -> None:
+    global _log_listener
+
+    if _log_listener is None:
+        atexit.register(_stop_log_listener)
+    _log_listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+
+
+def _stop_log_listener() -> None:
+    if _log_listener is not None and _log_listener._thread is not None:
+        _log_listener.stop()
+
+
+def restart_log_listener() -> None:
+    """Start a fresh background log writer in a forked child process.
+
+    The listener thread does not survive fork, so without this a worker
+    would keep queueing records that are never written.
+    """
+
+    if _log_listener is not None:
+        _start_log_listener(_log_listener.queue, *_log_listener.handlers)
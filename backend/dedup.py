@@ -0,0 +1,213 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Set
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from backend.log import log
+
+from .config import Config
+from .Database.db import SessionLocal
+from .Database.models import IngestKey, _kyiv_now
+from .Database.rows import Row
+from .spool import SPOOL, is_unavailable_error
+
+# Row fields left out of the content hash: ``time`` is the server clock
+# unless the device sent one, and ``city`` follows the current mapping.
+_UNHASHED_FIELDS = ("time", "city")
+
+
+class RecentKeys:
+    """Bounded LRU of recently accepted keys, each remembered for ``ttl`` seconds."""
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._expires: "OrderedDict[str, float]" = OrderedDict()
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            expires = self._expires.get(key)
+            if expires is None:
+                return False
+            if expires <= time.monotonic():
+                del self._expires[key]
+                return False
+            self._expires.move_to_end(key)
+            return True
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+    def add(self, keys: Iterable[str]) -> None:
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for key in keys:
+                self._expires[key] = expires
+                self._expires.move_to_end(key)
+            while len(self._expires) > self.max_size:
+                self._expires.popitem(last=False)
+
+
+class IngestDeduplicator:
+    """Acknowledge retransmitted packets without inserting them again.
+
+    Recent keys are answered from memory. The ingest_keys primary key
+    catches the rest, including retries that reach another worker process:
+    the key is inserted in the same transaction as the readings, so both
+    are stored or neither is. With the write buffer on, the request only
+    looks the key up and the flusher claims it with the rows it inserts.
+    """
+
+    def __init__(self, enabled: bool, max_size: int, ttl: float) -> None:
+        self.enabled = enabled
+        self.recent = RecentKeys(max_size, ttl)
+
+    @staticmethod
+    def key_for(
+        idempotency_key: Optional[str],
+        rows: List[Row],
+        device_time: Optional[datetime],
+    ) -> Optional[str]:
+        """Hash the client's Idempotency-Key, else station + device time + values.
+
+        Without either there is nothing that identifies a retransmission, so
+        None is returned and the packet is stored as usual.
+        """
+
+        if not rows:
+            return None
+        if idempotency_key:
+            source = "key\x1f" + idempotency_key
+        elif device_time is not None:
+            parts = [device_time.isoformat()]
+            for model, fields in rows:
+                parts.append(model.__tablename__)
+                parts.extend(
+                    f"{name}={fields[name]!r}"
+                    for name in sorted(fields)
+                    if name not in _UNHASHED_FIELDS
+                )
+            source = "\x1f".join(parts)
+        else:
+            return None
+        return hashlib.sha256(source.encode()).hexdigest()
+
+    def check(self, session: Session, keys: List[str]) -> Set[str]:
+        """Return the keys already accepted; stage claims for the others.
+
+        The claims become durable when the caller commits ``session``.
+        """
+
+        duplicates = {key for key in keys if key in self.recent}
+        fresh = [key for key in keys if key not in duplicates]
+        if fresh:
+            stored = self.claim(session, fresh)
+            if stored:
+                self.recent.add(stored)
+                duplicates |= stored
+        return duplicates
+
+    def seen(self, session: Session, keys: List[str]) -> Set[str]:
+        """Return the keys already accepted, without staging any claims."""
+
+        duplicates = {key for key in keys if key in self.recent}
+        fresh = [key for key in keys if key not in duplicates]
+        if not fresh or (SPOOL.enabled and not SPOOL.primary_available()):
+            return duplicates
+        try:
+            stored = set(
+                session.scalars(select(IngestKey.key).where(IngestKey.key.in_(fresh)))
+            )
+        except Exception as exc:
+            if not (SPOOL.enabled and is_unavailable_error(exc)):
+                raise
+            session.rollback()
+            SPOOL.mark_unavailable()
+            return duplicates
+        if stored:
+            self.recent.add(stored)
+        return duplicates | stored
+
+    def remember(self, keys: Iterable[str]) -> None:
+        """Record keys whose readings were committed, spooled or buffered."""
+
+        self.recent.add(keys)
+
+    def claim(self, session: Session, keys: List[str]) -> Set[str]:
+        """Stage claims for ``keys``; return those another packet already holds.
+
+        Unlike check() the in-memory keys are not consulted.
+        """
+
+        if SPOOL.enabled and not SPOOL.primary_available():
+            # The readings go to the spool; memory alone dedups meanwhile.
+            return set()
+        stored: Set[str] = set()
+        now = _kyiv_now()
+        for attempt in range(2):
+            try:
+                session.execute(
+                    insert(IngestKey), [{"key": key, "created_at": now} for key in keys]
+                )
+                return stored
+            except IntegrityError:
+                session.rollback()
+                if attempt:
+                    raise
+            except Exception as exc:
+                if not (SPOOL.enabled and is_unavailable_error(exc)):
+                    raise
+                session.rollback()
+                SPOOL.mark_unavailable()
+                return stored
+            stored = set(
+                session.scalars(select(IngestKey.key).where(IngestKey.key.in_(keys)))
+            )
+            keys = [key for key in keys if key not in stored]
+            if not keys:
+                return stored
+        return stored
+
+
+def prune_keys(retention_hours: int = Config.IDEMPOTENCY_RETENTION_HOURS) -> int:
+    """Delete stored keys older than the retention window; return the count."""
+
+    cutoff = _kyiv_now() - timedelta(hours=retention_hours)
+    with SessionLocal() as session:
+        deleted = session.execute(
+            delete(IngestKey).where(IngestKey.created_at < cutoff)
+        ).rowcount
+        session.commit()
+    log.info("Pruned %s ingest keys older than %s", deleted, cutoff)
+    return deleted
+
+
+DEDUP = IngestDeduplicator(
+    Config.IDEMPOTENCY_ENABLED,
+    Config.IDEMPOTENCY_CACHE_SIZE,
+    Config.IDEMPOTENCY_CACHE_TTL,
+)
+
+
+dedup_cli = AppGroup("dedup", help="Maintain stored ingest idempotency keys.")
+
+
+@dedup_cli.command("prune")
+@click.option(
+    "--retention-hours",
+    default=Config.IDEMPOTENCY_RETENTION_HOURS,
+    show_default=True,
+)
+def prune_command(retention_hours: int) -> None:
+    """Delete idempotency keys older than the retention window."""
+
+    click.echo(f"Ingest keys pruned: {prune_keys(retention_hours)}")
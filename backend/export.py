@@ -0,0 +1,323 @@
+import csv
+import io
+import json
+import struct
+import sys
+import zlib
+from array import array
+from datetime import datetime, timedelta
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import click
+from flask import Blueprint, Response, jsonify, request
+from flask.cli import AppGroup
+
+from backend.log import log
+
+from .config import Config
+from .helpers import require_api_key
+from .readings import (
+    READING_TYPES,
+    QueryError,
+    keyset_chunks,
+    parse_reading_filters,
+    reading_columns,
+    serialize_value,
+)
+
+bp = Blueprint("export", __name__)
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "columnar": ("application/octet-stream", "ssbc"),
+}
+
+COLUMNAR_MAGIC = b"SSBCOL1\n"
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def _column_types(fields: Tuple[str, ...]) -> List[Tuple[str, str]]:
+    return [
+        ("id", "int64"),
+        ("station_code", "string"),
+        ("city", "string"),
+        ("time", "timestamp"),
+        *((field, "float64") for field in fields),
+    ]
+
+
+def iter_chunks(kind: str, clauses: List[Any], chunk_size: int) -> Iterator[List[Any]]:
+    """Yield rows in (time, id) order as lists of at most ``chunk_size``.
+
+    Each chunk is its own keyset query, so only one chunk is held in memory
+    regardless of how many rows match.
+    """
+
+    model, fields = READING_TYPES[kind]
+    return keyset_chunks(model, reading_columns(model, fields), clauses, chunk_size)
+
+
+def _csv_chunks(
+    columns: List[Tuple[str, str]], chunks: Iterable[List[Any]]
+) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow([name for name, _ in columns])
+    for chunk in chunks:
+        for row in chunk:
+            writer.writerow(
+                ["" if value is None else serialize_value(value) for value in row]
+            )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    tail = buffer.getvalue()
+    if tail:
+        yield tail.encode()
+
+
+def _ndjson_chunks(
+    columns: List[Tuple[str, str]], chunks: Iterable[List[Any]]
+) -> Iterator[bytes]:
+    names = [name for name, _ in columns]
+    for chunk in chunks:
+        lines = [
+            json.dumps(
+                {name: serialize_value(value) for name, value in zip(names, row)}
+            )
+            for row in chunk
+        ]
+        if lines:
+            yield ("\n".join(lines) + "\n").encode()
+
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+def _encode_column(kind: str, values: List[Any]) -> bytes:
+    bitmap = bytearray((len(values) + 7) // 8)
+    for index, value in enumerate(values):
+        if value is not None:
+            bitmap[index >> 3] |= 1 << (index & 7)
+
+    if kind == "string":
+        encoded = [b"" if value is None else value.encode() for value in values]
+        lengths = array("I", (len(item) for item in encoded))
+        return bytes(bitmap) + _little_endian(lengths) + b"".join(encoded)
+    if kind == "float64":
+        data = array("d", (0.0 if value is None else float(value) for value in values))
+    elif kind == "timestamp":
+        data = array(
+            "q",
+            (
+                0 if value is None else (value - EPOCH) // MICROSECOND
+                for value in values
+            ),
+        )
+    else:
+        data = array("q", (0 if value is None else int(value) for value in values))
+    return bytes(bitmap) + _little_endian(data)
+
+
+def _columnar_chunks(
+    kind: str, columns: List[Tuple[str, str]], chunks: Iterable[List[Any]]
+) -> Iterator[bytes]:
+    """Encode rows as a simple column-oriented binary file.
+
+    Layout: magic, u32 header length, JSON header with column names/types,
+    then row groups of ``u32 row_count`` followed by every column as a null
+    bitmap and little-endian values (int64, float64, int64 microseconds since
+    1970 for naive Kyiv timestamps, or u32 lengths plus UTF-8 bytes for
+    strings). A row count of 0 ends the file.
+    """
+
+    header = json.dumps(
+        {"kind": kind, "columns": [{"name": n, "type": t} for n, t in columns]}
+    ).encode()
+    yield COLUMNAR_MAGIC + struct.pack("<I", len(header)) + header
+    for chunk in chunks:
+        if not chunk:
+            continue
+        parts = [struct.pack("<I", len(chunk))]
+        for index, (_, column_type) in enumerate(columns):
+            parts.append(_encode_column(column_type, [row[index] for row in chunk]))
+        yield b"".join(parts)
+    yield struct.pack("<I", 0)
+
+
+def _read_exact(stream: BinaryIO, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError("Truncated columnar export")
+    return data
+
+
+def _decode_values(column_type: str, raw: bytes) -> List[Any]:
+    values = array("d" if column_type == "float64" else "q")
+    values.frombytes(raw)
+    if sys.byteorder == "big":
+        values.byteswap()
+    if column_type == "timestamp":
+        return [EPOCH + value * MICROSECOND for value in values]
+    return list(values)
+
+
+def read_columnar(stream: BinaryIO) -> Iterator[Dict[str, Any]]:
+    """Yield rows from a file written by the columnar export format."""
+
+    if _read_exact(stream, len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        raise ValueError("Not a columnar export file")
+    (size,) = struct.unpack("<I", _read_exact(stream, 4))
+    columns = json.loads(_read_exact(stream, size))["columns"]
+    while True:
+        (count,) = struct.unpack("<I", _read_exact(stream, 4))
+        if count == 0:
+            return
+        decoded = []
+        for column in columns:
+            bitmap = _read_exact(stream, (count + 7) // 8)
+            present = [bool(bitmap[i >> 3] & (1 << (i & 7))) for i in range(count)]
+            if column["type"] == "string":
+                lengths = array("I")
+                lengths.frombytes(_read_exact(stream, 4 * count))
+                if sys.byteorder == "big":
+                    lengths.byteswap()
+                values = [_read_exact(stream, n).decode() for n in lengths]
+            else:
+                values = _decode_values(column["type"], _read_exact(stream, 8 * count))
+            decoded.append(
+                [value if ok else None for value, ok in zip(values, present)]
+            )
+        for index in range(count):
+            yield {
+                column["name"]: decoded[pos][index]
+                for pos, column in enumerate(columns)
+            }
+
+
+def _gzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(
+    kind: str,
+    clauses: List[Any],
+    fmt: str,
+    compress: bool = False,
+    chunk_size: int = Config.EXPORT_CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """Encode matching readings chunk by chunk in ``fmt``, optionally gzipped."""
+
+    _, fields = READING_TYPES[kind]
+    columns = _column_types(fields)
+    chunks = iter_chunks(kind, clauses, chunk_size)
+    if fmt == "csv":
+        stream = _csv_chunks(columns, chunks)
+    elif fmt == "ndjson":
+        stream = _ndjson_chunks(columns, chunks)
+    else:
+        stream = _columnar_chunks(kind, columns, chunks)
+    return _gzip(stream) if compress else stream
+
+
+def _parse_format(value: Optional[str]) -> str:
+    fmt = (value or "csv").lower()
+    if fmt not in EXPORT_FORMATS:
+        raise QueryError(
+            "invalid_format", f"format must be one of {', '.join(EXPORT_FORMATS)}."
+        )
+    return fmt
+
+
+@bp.get("/readings/<string:kind>/export")
+@bp.get("/readings/<string:kind>/export/<string:path_token>")
+def export_readings(kind: str, path_token: Optional[str] = None):
+    auth_err = require_api_key(path_token)
+    if auth_err:
+        return auth_err
+    if kind not in READING_TYPES:
+        return jsonify({"error": "unknown_reading_type"}), 404
+
+    model, _ = READING_TYPES[kind]
+    try:
+        fmt = _parse_format(request.args.get("format"))
+        clauses = parse_reading_filters(model)
+    except QueryError as exc:
+        return exc.response()
+
+    compress = request.args.get("gzip", "").lower() in ("1", "true", "yes")
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    filename = f"{kind}_readings.{extension}"
+    if compress:
+        mimetype, filename = "application/gzip", filename + ".gz"
+    log.info("Exporting %s readings as %s (gzip=%s)", kind, fmt, compress)
+    return Response(
+        export_stream(kind, clauses, fmt, compress),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+export_cli = AppGroup("export", help="Export readings to files.")
+
+
+@export_cli.command("readings")
+@click.argument("kind", type=click.Choice(sorted(READING_TYPES)))
+@click.option(
+    "--format", "fmt", type=click.Choice(sorted(EXPORT_FORMATS)), default="csv"
+)
+@click.option("--from", "start", help="Start of the range (epoch or ISO-8601).")
+@click.option("--to", "end", help="End of the range, exclusive.")
+@click.option("--station-code")
+@click.option("--city")
+@click.option("--gzip", "compress", is_flag=True, help="Gzip the output.")
+@click.option(
+    "--chunk-size", default=Config.EXPORT_CHUNK_SIZE, show_default=True, type=int
+)
+@click.option("-o", "--output", default="-", help="Output file, '-' for stdout.")
+def export_command(
+    kind: str,
+    fmt: str,
+    start: Optional[str],
+    end: Optional[str],
+    station_code: Optional[str],
+    city: Optional[str],
+    compress: bool,
+    chunk_size: int,
+    output: str,
+) -> None:
+    """Stream KIND readings to a CSV, NDJSON or columnar file."""
+
+    args = {
+        key: value
+        for key, value in (
+            ("from", start),
+            ("to", end),
+            ("station_code", station_code),
+            ("city", city),
+        )
+        if value
+    }
+    model, _ = READING_TYPES[kind]
+    try:
+        clauses = parse_reading_filters(model, args=args)
+    except QueryError as exc:
+        raise click.UsageError(exc.message)
+
+    written = 0
+    with click.open_file(output, "wb") as handle:
+        for data in export_stream(kind, clauses, fmt, compress, chunk_size):
+            handle.write(data)
+            written += len(data)
+    if output != "-":
+        click.echo(f"Wrote {written} bytes to {output}")
@@ -1,62 +1,66 @@
-from typing import Any, Dict, Optional, Tuple
+import json
+import math
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
 
 from flask import current_app, jsonify, request
-from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from .config import Config, CITY_BY_CODE, CITY_BY_ID
-from .Database.models import StationMapping
+from .station_cache import STATION_CACHE
 
 
 CITY_NAME_LOOKUP = {name.lower(): name for name in CITY_BY_ID.values()}
+KYIV_TZ = ZoneInfo("Europe/Kyiv")
+GAS_FIELDS = ("CO", "SO2", "NO2", "NO", "H2S", "O3", "NH3", "PM2_5", "PM10", "R")
+METEO_FIELDS = ("P", "TEMP", "RH")
+TIME_KEYS = ("time", "timestamp", "ts")
 
 
-def require_api_key(path_token: Optional[str] = None) -> Optional[Tuple[Any, int]]:
-    provided = (
-        request.headers.get("X-API-Key") or request.args.get("api_key") or request.args.get("x-api-key") or path_token
-    )
+def api_key_error(provided: Optional[str]) -> Optional[Dict[str, str]]:
+    """Return the error body for a missing or wrong API key, None if accepted."""
+
     if Config.API_KEY is None:
         return None
 
     if not provided:
-        current_app.logger.warning(
-            "Unauthorized ingest request: missing API key",
-            extra={
-                "remote_addr": request.remote_addr,
-                "path": request.path,
-            },
-        )
-        return (
-            jsonify(
-                {
-                    "error": "missing_api_key",
-                    "message": "Provide the API key via X-API-Key header, api_key query parameter, or /ingest/<api_key> URL.",
-                }
-            ),
-            401,
-        )
+        return {
+            "error": "missing_api_key",
+            "message": "Provide the API key via X-API-Key header, api_key query parameter, or /ingest/<api_key> URL.",
+        }
 
     if provided != Config.API_KEY:
-        current_app.logger.warning(
-            "Unauthorized ingest request: invalid API key",
-            extra={
-                "remote_addr": request.remote_addr,
-                "path": request.path,
-            },
-        )
-        return (
-            jsonify(
-                {
-                    "error": "invalid_api_key",
-                    "message": "The supplied API key does not match the INGEST_API_KEY configured on the server.",
-                }
-            ),
-            401,
-        )
+        return {
+            "error": "invalid_api_key",
+            "message": "The supplied API key does not match the INGEST_API_KEY configured on the server.",
+        }
 
     return None
 
 
+def provided_api_key(path_token: Optional[str] = None) -> Optional[str]:
+    return (
+        request.headers.get("X-API-Key") or request.args.get("api_key") or request.args.get("x-api-key") or path_token
+    )
+
+
+def require_api_key(path_token: Optional[str] = None) -> Optional[Tuple[Any, int]]:
+    error = api_key_error(provided_api_key(path_token))
+    if error is None:
+        return None
+
+    reason = "missing" if error["error"] == "missing_api_key" else "invalid"
+    current_app.logger.warning(
+        f"Unauthorized ingest request: {reason} API key",
+        extra={
+            "remote_addr": request.remote_addr,
+            "path": request.path,
+        },
+    )
+    return jsonify(error), 401
+
+
 def get_payload() -> Dict[str, Any]:
     data: Dict[str, Any] = {}
     json_body = request.get_json(silent=True)
@@ -69,6 +73,96 @@ def get_payload() -> Dict[str, Any]:
     return data
 
 
+def get_batch_payload() -> Optional[List[Any]]:
+    """Return readings from a JSON array, {"readings": [...]} or NDJSON body."""
+
+    return parse_batch_body(request.get_data(as_text=True), request.is_json)
+
+
+def parse_batch_body(text: str, is_json: bool) -> Optional[List[Any]]:
+    """Shared by the Flask and ASGI batch ingest; None for an unusable body."""
+
+    if is_json:
+        try:
+            json_body = json.loads(text)
+        except ValueError:
+            json_body = None
+        if isinstance(json_body, list):
+            return json_body
+        if isinstance(json_body, dict):
+            readings = json_body.get("readings")
+            return readings if isinstance(readings, list) else None
+
+    items: List[Any] = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            items.append(json.loads(line))
+        except ValueError:
+            items.append(None)
+    return items or None
+
+
+def parse_timestamp(value: Any) -> Optional[datetime]:
+    """Parse epoch seconds/milliseconds or ISO-8601 into naive Kyiv time.
+
+    Naive ISO strings are taken to already be Kyiv local time. Raises
+    ValueError for values that cannot be interpreted.
+    """
+
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        text = value.strip()
+        try:
+            value = float(text)
+        except ValueError:
+            if text.endswith(("Z", "z")):
+                text = text[:-1] + "+00:00"
+            parsed = datetime.fromisoformat(text)
+            if parsed.tzinfo is None:
+                return parsed
+            return parsed.astimezone(KYIV_TZ).replace(tzinfo=None)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"Unsupported timestamp: {value!r}")
+    seconds = float(value)
+    if seconds > 1e11:
+        seconds /= 1000.0
+    parsed = datetime.fromtimestamp(seconds, tz=timezone.utc)
+    return parsed.astimezone(KYIV_TZ).replace(tzinfo=None)
+
+
+def parse_dateutc(value: Any) -> Optional[datetime]:
+    """Parse an Ecowitt ``dateutc`` field ("YYYY-MM-DD HH:MM:SS" in UTC, or "now")."""
+
+    if value is None:
+        return None
+    text = str(value).strip()
+    if not text or text.lower() == "now":
+        return None
+    parsed = datetime.fromisoformat(text.replace("+", " "))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(KYIV_TZ).replace(tzinfo=None)
+
+
+def pop_timestamp(data: Dict[str, Any]) -> Optional[datetime]:
+    """Remove the reading time from the payload and return it parsed."""
+
+    value = None
+    for key in TIME_KEYS:
+        if key in data:
+            raw = data.pop(key)
+            if value is None:
+                value = raw
+    dateutc = data.pop("dateutc", None)
+    if value is None or value == "":
+        return parse_dateutc(dateutc)
+    return parse_timestamp(value)
+
+
 def to_float(val: Any) -> Optional[float]:
     if val is None or val == "":
         return None
@@ -76,6 +170,9 @@ def to_float(val: Any) -> Optional[float]:
         num = float(val)
     except (TypeError, ValueError):
         return None
+    if not math.isfinite(num):
+        # NaN and Infinity are not storable in a Numeric column.
+        return None
     if num == -1.0:
         return None
     elif num < 0:
@@ -136,9 +233,7 @@ def _lookup_city_by_station(
     if not code:
         return None
 
-    db_city = session.execute(
-        select(StationMapping.city).where(StationMapping.station_code == code)
-    ).scalar_one_or_none()
+    db_city = STATION_CACHE.city_for_code(code, session)
     if db_city:
         return db_city
 
@@ -169,32 +264,55 @@ def resolve_city(
     return None
 
 
-def transformation_data(data: Dict[str, Any]):
-    for key in data.keys():
-        if key == "tempinf":
-            data[key] = (to_float(data[key]) - 32) * 5 / 9
+def fahrenheit_to_celsius(val: Any) -> Optional[float]:
+    num = to_float(val)
+    if num is None:
+        return None
+    return (num - 32) * 5 / 9
+
+
+# Accepted payload key -> (reading kind, column, converter). Aliases of one
+# column are listed in priority order; the first usable value wins.
+FIELD_SCHEMA: Tuple[Tuple[str, str, str, Callable[[Any], Optional[float]]], ...] = (
+    ("CO", "gas", "CO", to_float),
+    ("SO2", "gas", "SO2", to_float),
+    ("NO2", "gas", "NO2", to_float),
+    ("NO", "gas", "NO", to_float),
+    ("H2S", "gas", "H2S", to_float),
+    ("O3", "gas", "O3", to_float),
+    ("NH3", "gas", "NH3", to_float),
+    ("PM2.5", "gas", "PM2_5", to_float),
+    ("PM10", "gas", "PM10", to_float),
+    ("R", "gas", "R", to_float),
+    ("WD", "meteo", "P", to_float),
+    ("wd_deg", "meteo", "P", to_float),
+    ("tempinf", "meteo", "TEMP", fahrenheit_to_celsius),
+    ("humidityin", "meteo", "RH", to_float),
+)
+_FIELD_PLAN = tuple(
+    (key, kind == "meteo", column, convert)
+    for key, kind, column, convert in FIELD_SCHEMA
+)
+_GAS_TEMPLATE: Dict[str, Optional[float]] = dict.fromkeys(GAS_FIELDS)
+_METEO_TEMPLATE: Dict[str, Optional[float]] = dict.fromkeys(METEO_FIELDS)
+
+
+def normalize_fields(
+    data: Dict[str, Any],
+) -> Tuple[Dict[str, Optional[float]], Dict[str, Optional[float]]]:
+    """Convert a payload's measurements into (gas, meteo) column dicts.
+
+    One pass over FIELD_SCHEMA; other keys (station_code, city, ...) are
+    neither read nor modified.
+    """
+
+    gas = _GAS_TEMPLATE.copy()
+    meteo = _METEO_TEMPLATE.copy()
+    for key, is_meteo, column, convert in _FIELD_PLAN:
+        value = data.get(key)
+        if value is None:
             continue
-        data[key] = to_float(data[key])
-
-
-def collect_gas_fields(data: Dict[str, Any]) -> Dict[str, Optional[float]]:
-    return {
-        "CO": data.get("CO"),
-        "SO2": data.get("SO2"),
-        "NO2": data.get("NO2"),
-        "NO": data.get("NO"),
-        "H2S": data.get("H2S"),
-        "O3": data.get("O3"),
-        "NH3": data.get("NH3"),
-        "PM2_5": data.get("PM2.5"),
-        "PM10": data.get("PM10"),
-        "R": data.get("R"),
-    }
-
-
-def collect_meteo_fields(data: Dict[str, Any]) -> Dict[str, Optional[float]]:
-    return {
-        "P": data.get("WD") or data.get("wd_deg"),
-        "TEMP": data.get("tempinf"),
-        "RH": data.get("humidityin"),
-    }
+        target = meteo if is_meteo else gas
+        if target[column] is None:
+            target[column] = convert(value)
+    return gas, meteo
@@ -1,293 +1,717 @@
-from typing import Dict, Optional
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 from flask import Blueprint, jsonify, request
-from sqlalchemy import select
+from sqlalchemy import select, text
 from backend.log import log
 
-from .config import CITY_BY_ID
-from .Database.db import HAS_SECONDARY, SessionLocal, SessionLocalSecondary
+from .anomaly import ANOMALY
+from .compact import (
+    COMPACT_MIMETYPE,
+    CompactError,
+    CompactReading,
+    decode,
+    decode_single,
+)
+from .config import CITY_BY_ID, Config
+from .Database.db import ENGINE, SessionLocal, schema_ready
+from .dedup import DEDUP
 from .helpers import (
-    collect_gas_fields,
-    collect_meteo_fields,
     extract_city_from_payload,
     extract_station,
+    get_batch_payload,
     get_payload,
+    normalize_fields,
     normalize_station_code,
+    pop_timestamp,
+    provided_api_key,
     require_api_key,
     resolve_city,
-    transformation_data,
+    TIME_KEYS,
 )
-from .Database.models import GasReading, MeteoReading, StationMapping
+from .latest import LATEST, to_reading
+from .Database.models import GasReading, MeteoReading, StationMapping, _kyiv_now
+from .Database.rows import Row, build_row
+from .local_queue import KIND_BY_MODEL
+from .log_handlers import SAMPLED
+from .metrics import INGEST_OUTCOMES, INGEST_READINGS, observe_request, stage
+from .ratelimit import RATE_LIMITED, RATE_LIMITER
+from .readings import READING_TYPES
+from .replication import REPLICATOR, open_secondary_session, sync_station_mapping
+from .spool import SPOOL
+from .station_cache import STATION_CACHE
+from .stream import STREAM_HUB
+from .write_buffer import WRITE_BUFFER
 
 bp = Blueprint("ingest", __name__)
 
 
-@bp.get("/health")
-def health() -> Dict[str, str]:
-    return {"status": "ok"}
+def _record_rows(rows: List[Row]) -> None:
+    for model, fields in rows:
+        INGEST_READINGS.labels(
+            KIND_BY_MODEL[model], fields.get("city") or "", fields["station_code"]
+        ).inc()
+    readings = [to_reading(KIND_BY_MODEL[model], fields) for model, fields in rows]
+    LATEST.record(readings)
+    STREAM_HUB.publish(readings)
 
 
-@bp.post("/ingest")
-@bp.post("/ingest/<string:path_token>")
-@bp.post("/ingest/<string:path_token>/<string:city>")
-def ingest(path_token: Optional[str] = None, city: Optional[str] = None):
-    log.info("Start ingest from %s", request.host)
-    auth_err = require_api_key(path_token)
-    if auth_err:
-        log.warning("Unauthorized ingest attempt from %s", request.host)
-        return auth_err
+# Buffered rows reach /latest and /stream once the flusher has written them.
+WRITE_BUFFER.on_commit = _record_rows
+
+
+class IngestRejected(Exception):
+    """Payload refused by the ingest contract; carries the JSON error body."""
+
+    def __init__(self, error: str, status: int, message: Optional[str] = None):
+        super().__init__(message or error)
+        self.error = error
+        self.status = status
+        self.message = message
+
+    def body(self) -> Dict[str, str]:
+        body = {"error": self.error}
+        if self.message:
+            body["message"] = self.message
+        return body
+
+
+def health_status() -> Dict[str, Any]:
+    status: Dict[str, Any] = {"status": "ok"}
+    if REPLICATOR.enabled:
+        status["secondary_replication"] = REPLICATOR.stats()
+    if SPOOL.enabled:
+        status["spool"] = SPOOL.stats()
+    return status
+
+
+def take_reading_time(data: Dict[str, Any]) -> Optional[datetime]:
+    """Pop the device timestamp from the payload and check it against the skew window.
+
+    Returns None when the server clock should be used instead. Ecowitt
+    boxes send ``dateutc`` on their own, so when it is the only time given
+    a bad or skewed value falls back to the server clock, whatever the
+    policy, instead of losing the reading.
+    """
+
+    only_dateutc = "dateutc" in data and all(
+        data.get(key) in (None, "") for key in TIME_KEYS
+    )
+    try:
+        reading_time = pop_timestamp(data)
+    except (TypeError, ValueError, OverflowError, OSError):
+        if only_dateutc:
+            return None
+        raise IngestRejected(
+            "invalid_time",
+            400,
+            "Send time as epoch seconds/milliseconds or ISO-8601.",
+        )
+    return check_reading_time(reading_time, server_time_on_skew=only_dateutc)
+
+
+def check_reading_time(
+    reading_time: Optional[datetime], server_time_on_skew: bool = False
+) -> Optional[datetime]:
+    """Apply the clock-skew window to a parsed device time."""
+
+    if reading_time is None:
+        return None
+
+    skew = (reading_time - _kyiv_now()).total_seconds()
+    if -Config.INGEST_MAX_PAST_SKEW <= skew <= Config.INGEST_MAX_FUTURE_SKEW:
+        return reading_time
+    if server_time_on_skew or Config.INGEST_CLOCK_SKEW_POLICY == "server_time":
+        log.info("Device time %s is %+.0fs off; using server time", reading_time, skew)
+        return None
+    raise IngestRejected(
+        "time_out_of_range",
+        400,
+        f"Reading time is {skew:+.0f}s from server time; allowed window is "
+        f"-{Config.INGEST_MAX_PAST_SKEW:.0f}s..+{Config.INGEST_MAX_FUTURE_SKEW:.0f}s.",
+    )
+
+
+def prepare_ingest(
+    session, data: Dict[str, Any], city_from_path: Optional[str] = None
+) -> Tuple[List[Row], Optional[str], Optional[datetime]]:
+    """Turn a single-packet payload into reading rows.
+
+    Returns (rows, city, device time or None). Raises IngestRejected for
+    payloads the contract refuses.
+    """
 
-    data = get_payload()
-    city_from_path = city
     if city_from_path and "city" not in data and "city_name" not in data:
         data["city"] = city_from_path
-    log.debug("Ingest payload: %s", data)
+    log.debug("Ingest payload: %s", data, extra=SAMPLED)
     station = extract_station(data)
     if station:
         station = normalize_station_code(station)
         if not station:
             log.info("Station code normalized to empty")
-            return jsonify({"error": "missing_station_code"}), 400
+            raise IngestRejected("missing_station_code", 400)
+
+    reading_time = take_reading_time(data)
+    with stage("normalize_fields"):
+        gas_fields, meteo_fields = normalize_fields(data)
+
+    with stage("resolve_city"):
+        city = city_from_path or resolve_city(session, data, station)
+
+    rows = _build_rows(session, station, city, gas_fields, meteo_fields, reading_time)
+    return rows, city, reading_time
+
+
+def prepare_compact(
+    session, reading: CompactReading, city_from_path: Optional[str] = None
+) -> Tuple[List[Row], Optional[str], Optional[datetime]]:
+    """prepare_ingest for a decoded compact record; the fields are already final."""
+
+    station = normalize_station_code(reading.station)
+    reading_time = check_reading_time(reading.time)
+    with stage("resolve_city"):
+        city = city_from_path or resolve_city(session, {}, station)
+    rows = _build_rows(session, station, city, reading.gas, reading.meteo, reading_time)
+    return rows, city, reading_time
+
+
+def screen_rows(rows: List[Row]) -> List[Row]:
+    """Run the spike detector over rows about to be stored.
+
+    Called once the packet's dedup claim succeeded, so a retransmission
+    does not move the averages twice. Rows whose every value was
+    quarantined are dropped.
+    """
+
+    if not ANOMALY.enabled:
+        return rows
+    kept: List[Row] = []
+    with stage("anomaly"):
+        for model, row in rows:
+            kind = KIND_BY_MODEL[model]
+            fields = {name: row.get(name) for name in READING_TYPES[kind][1]}
+            if ANOMALY.inspect(kind, row["station_code"], fields):
+                row.update(fields)
+            if any(value is not None for value in fields.values()):
+                kept.append((model, row))
+    return kept
+
+
+def _build_rows(
+    session,
+    station: Optional[str],
+    city: Optional[str],
+    gas_fields: Dict[str, Optional[float]],
+    meteo_fields: Dict[str, Optional[float]],
+    reading_time: Optional[datetime],
+) -> List[Row]:
+    has_gas = any(v is not None for v in gas_fields.values())
+    has_meteo = any(v is not None for v in meteo_fields.values())
 
-    transformation_data(data)
+    rows: List[Row] = []
+    if has_gas:
+        if not station:
+            log.info("Missing station code for gas payload")
+            raise IngestRejected("missing_station_code", 400)
+        with stage("mapping_lookup"):
+            mapping_city = STATION_CACHE.city_for_code(station, session)
+        if mapping_city is None:
+            log.info("Station mapping not found for station=%s", station)
+            raise IngestRejected(
+                "station_not_registered",
+                404,
+                "Station code is absent from station_mappings; payload was ignored.",
+            )
+        log.debug(
+            "Inserting gas readings for station=%s city=%s",
+            station,
+            city,
+            extra=SAMPLED,
+        )
+        rows.append((GasReading, build_row(station, city, gas_fields, reading_time)))
+
+    if has_meteo:
+        if not city:
+            log.info("Missing city for meteo payload")
+            raise IngestRejected("missing_city", 400)
+        with stage("mapping_lookup"):
+            meteo_station = STATION_CACHE.code_for_city(city, session)
+        if meteo_station is None:
+            log.info("Station mapping not found for city=%s", city)
+            raise IngestRejected(
+                "station_not_registered",
+                404,
+                "City is absent from station_mappings; payload was ignored.",
+            )
+        rows.append(
+            (MeteoReading, build_row(meteo_station, city, meteo_fields, reading_time))
+        )
 
-    gas_fields = collect_gas_fields(data)
-    meteo_fields = collect_meteo_fields(data)
+    return rows
+
+
+def finish_ingest(
+    endpoint: str,
+    rows: List[Row],
+    city: Optional[str],
+    spooled: bool = False,
+    buffered: bool = False,
+) -> Dict[str, Any]:
+    """Log and count an accepted packet; return the response body."""
+
+    gas_inserted = sum(1 for model, _ in rows if model is GasReading)
+    meteo_inserted = len(rows) - gas_inserted
+    log.info(
+        "Ingest processed station=%s city=%s gas=%s meteo=%s",
+        rows[0][1]["station_code"] if rows else None,
+        city,
+        gas_inserted,
+        meteo_inserted,
+        extra=SAMPLED,
+    )
+    if not rows:
+        outcome = "empty"
+    elif spooled:
+        outcome = "spooled"
+    elif buffered:
+        outcome = "buffered"
+    else:
+        outcome = "ok"
+    INGEST_OUTCOMES.labels(endpoint, outcome).inc()
+    if not buffered:
+        _record_rows(rows)
 
-    has_gas = any(v is not None for v in gas_fields.values())
-    has_meteo = any(v is not None for v in meteo_fields.values())
+    response: Dict[str, Any] = {
+        "status": "ok",
+        "gas_upserted": gas_inserted,
+        "meteo_upserted": meteo_inserted,
+    }
+    if spooled:
+        response["spooled"] = True
+    return response
+
+
+def finish_duplicate(endpoint: str, city: Optional[str]) -> Dict[str, Any]:
+    """Count a retransmitted packet; return the acknowledgement body."""
+
+    log.info("Duplicate ingest acknowledged city=%s", city, extra=SAMPLED)
+    INGEST_OUTCOMES.labels(endpoint, "duplicate").inc()
+    return {"status": "ok", "duplicate": True, "gas_upserted": 0, "meteo_upserted": 0}
+
+
+@bp.get("/health")
+def health() -> Dict[str, Any]:
+    return health_status()
+
+
+def readiness() -> Tuple[Dict[str, Any], bool]:
+    """Schema bootstrapped and the primary reachable.
 
+    With the spool enabled the app can accept readings while the primary
+    is down, so only the schema check gates readiness then.
+    """
+
+    checks = {"schema": schema_ready(), "primary": False}
+    if checks["schema"]:
+        try:
+            with ENGINE.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            checks["primary"] = True
+        except Exception:
+            log.warning("Readiness check could not reach the primary database")
+    is_ready = checks["schema"] and (checks["primary"] or SPOOL.enabled)
+    body = {"status": "ready" if is_ready else "not_ready", "checks": checks}
+    return body, is_ready
+
+
+@bp.get("/ready")
+def ready():
+    body, is_ready = readiness()
+    return jsonify(body), 200 if is_ready else 503
+
+
+@bp.post("/ingest")
+@bp.post("/ingest/<string:path_token>")
+@bp.post("/ingest/<string:path_token>/<string:city>")
+@observe_request("ingest")
+def ingest(path_token: Optional[str] = None, city: Optional[str] = None):
+    log.info("Start ingest from %s", request.host, extra=SAMPLED)
+    with stage("require_api_key"):
+        auth_err = require_api_key(path_token)
+    if auth_err:
+        log.warning("Unauthorized ingest attempt from %s", request.host)
+        INGEST_OUTCOMES.labels("ingest", "unauthorized").inc()
+        return auth_err
+
+    with stage("get_payload"):
+        if request.mimetype == COMPACT_MIMETYPE:
+            try:
+                packet = decode_single(request.get_data())
+            except CompactError as exc:
+                INGEST_OUTCOMES.labels("ingest", "invalid_payload").inc()
+                return jsonify({"error": "invalid_payload", "message": str(exc)}), 400
+        else:
+            packet, data = None, get_payload()
+
+    if RATE_LIMITER.enabled:
+        with stage("rate_limit"):
+            station = packet.station if packet is not None else extract_station(data)
+            retry_after = RATE_LIMITER.retry_after(
+                provided_api_key(path_token), normalize_station_code(station)
+            )
+        if retry_after:
+            log.info("Rate limited ingest station=%s", station, extra=SAMPLED)
+            INGEST_OUTCOMES.labels("ingest", "rate_limited").inc()
+            return jsonify(RATE_LIMITED), 429, {"Retry-After": str(retry_after)}
+
+    spooled = False
+    key = None
     with SessionLocal() as session:
-        secondary_session = SessionLocalSecondary() if HAS_SECONDARY else None
         try:
-            city = city_from_path or resolve_city(session, data, station)
-
-            gas_inserted = 0
-            meteo_inserted = 0
-            meteo_station = None
-
-            if has_gas:
-                if not station:
-                    log.info("Missing station code for gas payload")
-                    return jsonify({"error": "missing_station_code"}), 400
-                mapping_exists = session.execute(
-                    select(StationMapping.id).where(
-                        StationMapping.station_code == station
-                    )
-                ).scalar_one_or_none()
-                if mapping_exists is None:
-                    session.rollback()
-                    log.info("Station mapping not found for station=%s", station)
-                    return (
-                        jsonify(
-                            {
-                                "error": "station_not_registered",
-                                "message": "Station code is absent from station_mappings; payload was ignored.",
-                            }
-                        ),
-                        404,
-                    )
-                log.debug(
-                    "Inserting gas readings for station=%s city=%s", station, city
+            if packet is not None:
+                rows, city, device_time = prepare_compact(session, packet, city)
+            else:
+                rows, city, device_time = prepare_ingest(session, data, city)
+            if DEDUP.enabled:
+                key = DEDUP.key_for(
+                    request.headers.get("Idempotency-Key"), rows, device_time
                 )
-                _insert_gas(session, station, city, gas_fields)
-                if secondary_session:
-                    _insert_gas(secondary_session, station, city, gas_fields)
-                gas_inserted = 1
-
-            if has_meteo:
-                if not city:
-                    log.info("Missing city for meteo payload")
-                    return jsonify({"error": "missing_city"}), 400
-                meteo_station = session.execute(
-                    select(StationMapping.station_code).where(
-                        StationMapping.city == city
-                    )
-                ).scalar_one_or_none()
-                if meteo_station is None:
+            if key:
+                with stage("dedup"):
+                    if WRITE_BUFFER.enabled:
+                        # The flusher claims the key with the rows it inserts.
+                        duplicate = DEDUP.seen(session, [key])
+                    else:
+                        duplicate = DEDUP.check(session, [key])
+                if duplicate:
+                    session.rollback()
+                    return jsonify(finish_duplicate("ingest", city))
+            rows = screen_rows(rows)
+            if WRITE_BUFFER.enabled and (rows or key):
+                if not WRITE_BUFFER.submit(rows, key):
                     session.rollback()
-                    log.info("Station mapping not found for city=%s", city)
+                    log.warning("Write buffer full; rejecting ingest city=%s", city)
+                    INGEST_OUTCOMES.labels("ingest", "buffer_full").inc()
                     return (
                         jsonify(
                             {
-                                "error": "station_not_registered",
-                                "message": "City is absent from station_mappings; payload was ignored.",
+                                "error": "buffer_full",
+                                "message": "Ingest write buffer is full; retry later.",
                             }
                         ),
-                        404,
+                        503,
+                        {
+                            "Retry-After": str(
+                                max(1, round(WRITE_BUFFER.flush_interval))
+                            )
+                        },
                     )
-                _insert_meteo(session, meteo_station, city, meteo_fields)
-                if secondary_session:
-                    _insert_meteo(secondary_session, meteo_station, city, meteo_fields)
-                meteo_inserted = 1
-
-            if secondary_session:
-                secondary_session.commit()
-            session.commit()
-            station_for_log = station or meteo_station
-            log.info(
-                "Ingest processed station=%s city=%s gas=%s meteo=%s",
-                station_for_log,
-                city,
-                gas_inserted,
-                meteo_inserted,
-            )
+            elif rows:
+                spooled = SPOOL.commit_or_spool(session, rows)
+            elif key:
+                # Every value was quarantined; keep the claim all the same.
+                session.commit()
+        except IngestRejected as exc:
+            session.rollback()
+            INGEST_OUTCOMES.labels("ingest", exc.error).inc()
+            return jsonify(exc.body()), exc.status
         except Exception:
             session.rollback()
-            if secondary_session:
-                secondary_session.rollback()
             log.exception("Failed to write ingest data to databases")
+            INGEST_OUTCOMES.labels("ingest", "db_write_failed").inc()
             return jsonify({"error": "db_write_failed"}), 500
-        finally:
-            if secondary_session:
-                secondary_session.close()
 
+    if key:
+        DEDUP.remember([key])
     return jsonify(
-        {
-            "status": "ok",
-            "gas_upserted": gas_inserted,
-            "meteo_upserted": meteo_inserted,
-        }
+        finish_ingest("ingest", rows, city, spooled, buffered=WRITE_BUFFER.enabled)
     )
 
 
-@bp.post("/station-mappings")
-@bp.post("/station-mappings/<string:path_token>")
-def upsert_station_mapping(path_token: Optional[str] = None):
-    auth_err = require_api_key(path_token)
+@bp.post("/ingest/batch")
+@bp.post("/ingest/batch/<string:path_token>")
+@observe_request("ingest_batch")
+def ingest_batch(path_token: Optional[str] = None):
+    with stage("require_api_key"):
+        auth_err = require_api_key(path_token)
     if auth_err:
-        log.warning("Unauthorized station-mapping attempt from %s", request.host)
+        log.warning("Unauthorized batch ingest attempt from %s", request.host)
+        INGEST_OUTCOMES.labels("ingest_batch", "unauthorized").inc()
         return auth_err
 
-    data = get_payload()
+    with stage("get_payload"):
+        if request.mimetype == COMPACT_MIMETYPE:
+            try:
+                items = decode(request.get_data())
+            except CompactError:
+                items = None
+        else:
+            items = get_batch_payload()
+    if items is None:
+        log.info("Batch ingest with unreadable body from %s", request.host)
+
+    if RATE_LIMITER.enabled:
+        with stage("rate_limit"):
+            retry_after = RATE_LIMITER.retry_after_batch(
+                provided_api_key(path_token), batch_stations(items)
+            )
+        if retry_after:
+            INGEST_OUTCOMES.labels("ingest_batch", "rate_limited").inc()
+            return jsonify(RATE_LIMITED), 429, {"Retry-After": str(retry_after)}
+    status, body = batch_body(items, request.headers.get("Idempotency-Key"))
+    return jsonify(body), status
+
+
+def batch_stations(items: Optional[List[Any]]) -> Set[str]:
+    """Station codes named by a batch's items, for the rate limiter."""
+
+    stations: Set[str] = set()
+    for item in items or ():
+        if isinstance(item, CompactReading):
+            station = normalize_station_code(item.station)
+        elif isinstance(item, dict):
+            station = normalize_station_code(extract_station(item))
+        else:
+            continue
+        if station:
+            stations.add(station)
+    return stations
+
+
+def batch_body(
+    items: Optional[List[Any]], idempotency_key: Optional[str]
+) -> Tuple[int, Dict[str, Any]]:
+    """Shared by the Flask and ASGI batch ingest: (status, JSON body)."""
+
+    if items is None:
+        INGEST_OUTCOMES.labels("ingest_batch", "invalid_batch").inc()
+        return 400, {
+            "error": "invalid_batch",
+            "message": 'Provide a JSON array, {"readings": [...]}, NDJSON or compact records.',
+        }
+    if len(items) > Config.INGEST_BATCH_MAX_ITEMS:
+        INGEST_OUTCOMES.labels("ingest_batch", "batch_too_large").inc()
+        return 413, {
+            "error": "batch_too_large",
+            "message": f"At most {Config.INGEST_BATCH_MAX_ITEMS} readings per request.",
+        }
+
+    results: List[Dict[str, Any]] = []
+    pending: List[Tuple[int, List[Row], Optional[str]]] = []
+    batch_keys: Set[str] = set()
+    with SessionLocal() as session:
+        city_memo: Dict[Tuple[Any, ...], Optional[str]] = {}
+        try:
+            for index, item in enumerate(items):
+                item_key = f"{idempotency_key}#{index}" if idempotency_key else None
+                result, rows, key = _prepare_batch_item(
+                    session, item, city_memo, item_key
+                )
+                if key in batch_keys:
+                    result = _duplicate_result()
+                    rows = []
+                elif key:
+                    batch_keys.add(key)
+                results.append({"index": index, **result})
+                if rows:
+                    pending.append((index, rows, key))
+        except Exception:
+            # City and station lookups need the database when the cache is cold.
+            session.rollback()
+            log.exception("Failed to prepare batch of %s items", len(items))
+            INGEST_OUTCOMES.labels("ingest_batch", "db_write_failed").inc()
+            return 500, {"error": "db_write_failed"}
+        session.rollback()
+
+    chunk_size = max(1, Config.INGEST_BATCH_CHUNK_SIZE)
+    for start in range(0, len(pending), chunk_size):
+        _write_batch_chunk(pending[start : start + chunk_size], results)
+
+    accepted = 0
+    for result in results:
+        if result.get("duplicate"):
+            accepted += 1
+            outcome = "duplicate"
+        elif result["status"] == "ok":
+            accepted += 1
+            outcome = "spooled" if result.get("spooled") else "ok"
+        else:
+            outcome = result["error"]
+        INGEST_OUTCOMES.labels("ingest_batch", outcome).inc()
+    log.info(
+        "Batch ingest processed items=%s accepted=%s rejected=%s",
+        len(results),
+        accepted,
+        len(results) - accepted,
+    )
+    return 200, {
+        "status": "ok",
+        "accepted": accepted,
+        "rejected": len(results) - accepted,
+        "results": results,
+    }
+
+
+def parse_station_mapping(
+    data: Dict[str, Any],
+) -> Tuple[str, Optional[str], Optional[str]]:
+    """Validate a station-mapping payload; returns (code, city, previous_code)."""
 
     new_code = normalize_station_code(data.get("station_code"))
     if not new_code:
         log.info("Missing station_code in station-mapping payload")
-        return (
-            jsonify(
-                {
-                    "error": "missing_station_code",
-                    "message": "Provide station_code (MAC) in the request payload.",
-                }
-            ),
+        raise IngestRejected(
+            "missing_station_code",
             400,
+            "Provide station_code (MAC) in the request payload.",
         )
 
     city = extract_city_from_payload(data)
     city_was_provided = any(key in data for key in ("city", "city_name", "city_id"))
     if city is None and city_was_provided:
         log.info("Invalid city provided for station-mapping station=%s", new_code)
-        return (
-            jsonify(
-                {
-                    "error": "invalid_city",
-                    "message": "Provided city value is not present in CITY_BY_ID.",
-                }
-            ),
-            400,
+        raise IngestRejected(
+            "invalid_city", 400, "Provided city value is not present in CITY_BY_ID."
         )
 
     previous_code = normalize_station_code(data.get("previous_station_code"))
+    return new_code, city, previous_code
+
+
+def apply_station_mapping(
+    session,
+    secondary_session,
+    new_code: str,
+    city: Optional[str],
+    previous_code: Optional[str],
+) -> Tuple[str, str, Optional[str]]:
+    """Stage a mapping create/update/rename; returns (operation, city, prior_code).
+
+    The caller commits both sessions. Raises IngestRejected on conflicts.
+    """
+
+    operation = "created"
+    prior_code = None
+
+    existing = None
+    if previous_code and previous_code != new_code:
+        existing = session.execute(
+            select(StationMapping).where(StationMapping.station_code == previous_code)
+        ).scalar_one_or_none()
+        if existing is None:
+            log.info(
+                "Attempt to rename missing station mapping previous=%s",
+                previous_code,
+            )
+            raise IngestRejected(
+                "station_not_found",
+                404,
+                f"No station mapping found for {previous_code}.",
+            )
+        operation = "renamed"
+    elif city:
+        existing = session.execute(
+            select(StationMapping).where(StationMapping.city == city)
+        ).scalar_one_or_none()
+
+    if existing is None:
+        existing = session.execute(
+            select(StationMapping).where(StationMapping.station_code == new_code)
+        ).scalar_one_or_none()
+
+    duplicate = session.execute(
+        select(StationMapping).where(StationMapping.station_code == new_code)
+    ).scalar_one_or_none()
+    if duplicate and (existing is None or duplicate.id != existing.id):
+        log.info(
+            "Duplicate station code detected new=%s",
+            new_code,
+        )
+        raise IngestRejected(
+            "duplicate_station_code",
+            409,
+            f"Station mapping for {new_code} already exists.",
+        )
 
-    with SessionLocal() as session:
-        secondary_session = SessionLocalSecondary() if HAS_SECONDARY else None
-        try:
-            operation = "created"
+    if existing:
+        if city is None:
+            city = existing.city
+        existing.city = city
+        old_code = existing.station_code
+        existing.station_code = new_code
+        if operation != "renamed":
+            operation = "updated"
+        prior_code = previous_code if operation == "renamed" else None
+        if prior_code is None and old_code != new_code:
+            prior_code = old_code
+        if secondary_session:
+            sync_station_mapping(secondary_session, new_code, city, prior_code)
+    else:
+        if city is None:
+            raise IngestRejected(
+                "missing_city",
+                400,
+                "Provide city/city_name or city_id when creating a new mapping.",
+            )
+        mapping = StationMapping(city=city, station_code=new_code)
+        session.add(mapping)
+        if secondary_session:
+            secondary_session.add(StationMapping(city=city, station_code=new_code))
+        operation = "created"
+
+    return operation, city, prior_code
+
+
+def finish_station_mapping(
+    operation: str, new_code: str, city: str, prior_code: Optional[str]
+) -> Dict[str, Any]:
+    """Propagate a committed mapping change; return the response body."""
+
+    STATION_CACHE.invalidate()
+    if REPLICATOR.enabled:
+        REPLICATOR.enqueue_mapping(new_code, city, prior_code)
+    log.info(
+        "Station mapping %s station=%s city=%s",
+        operation,
+        new_code,
+        city,
+    )
+    return {
+        "status": "ok",
+        "station_code": new_code,
+        "city": city,
+        "operation": operation,
+    }
 
-            existing = None
-            if previous_code and previous_code != new_code:
-                existing = session.execute(
-                    select(StationMapping).where(
-                        StationMapping.station_code == previous_code
-                    )
-                ).scalar_one_or_none()
-                if existing is None:
-                    log.info(
-                        "Attempt to rename missing station mapping previous=%s",
-                        previous_code,
-                    )
-                    return (
-                        jsonify(
-                            {
-                                "error": "station_not_found",
-                                "message": f"No station mapping found for {previous_code}.",
-                            }
-                        ),
-                        404,
-                    )
-                operation = "renamed"
-            elif city:
-                existing = session.execute(
-                    select(StationMapping).where(StationMapping.city == city)
-                ).scalar_one_or_none()
-
-            if existing is None:
-                existing = session.execute(
-                    select(StationMapping).where(
-                        StationMapping.station_code == new_code
-                    )
-                ).scalar_one_or_none()
-
-            duplicate = session.execute(
-                select(StationMapping).where(StationMapping.station_code == new_code)
-            ).scalar_one_or_none()
-            if duplicate and (existing is None or duplicate.id != existing.id):
-                log.info(
-                    "Duplicate station code detected new=%s",
-                    new_code,
-                )
-                return (
-                    jsonify(
-                        {
-                            "error": "duplicate_station_code",
-                            "message": f"Station mapping for {new_code} already exists.",
-                        }
-                    ),
-                    409,
-                )
 
-            if existing:
-                if city is None:
-                    city = existing.city
-                existing.city = city
-                old_code = existing.station_code
-                existing.station_code = new_code
-                if operation != "renamed":
-                    operation = "updated"
-                if secondary_session:
-                    prior_code = previous_code if operation == "renamed" else None
-                    if prior_code is None and old_code != new_code:
-                        prior_code = old_code
-                    _sync_station_mapping(secondary_session, existing, prior_code)
-            else:
-                if city is None:
-                    return (
-                        jsonify(
-                            {
-                                "error": "missing_city",
-                                "message": "Provide city/city_name or city_id when creating a new mapping.",
-                            }
-                        ),
-                        400,
-                    )
-                mapping = StationMapping(city=city, station_code=new_code)
-                session.add(mapping)
-                if secondary_session:
-                    secondary_session.add(
-                        StationMapping(city=city, station_code=new_code)
-                    )
-                operation = "created"
+@bp.post("/station-mappings")
+@bp.post("/station-mappings/<string:path_token>")
+def upsert_station_mapping(path_token: Optional[str] = None):
+    auth_err = require_api_key(path_token)
+    if auth_err:
+        log.warning("Unauthorized station-mapping attempt from %s", request.host)
+        return auth_err
 
+    data = get_payload()
+    try:
+        new_code, city, previous_code = parse_station_mapping(data)
+    except IngestRejected as exc:
+        return jsonify(exc.body()), exc.status
+
+    with SessionLocal() as session:
+        secondary_session = open_secondary_session()
+        try:
+            operation, city, prior_code = apply_station_mapping(
+                session, secondary_session, new_code, city, previous_code
+            )
             if secondary_session:
                 secondary_session.commit()
             session.commit()
-            log.info(
-                "Station mapping %s station=%s city=%s",
-                operation,
-                new_code,
-                city,
-            )
+        except IngestRejected as exc:
+            session.rollback()
+            if secondary_session:
+                secondary_session.rollback()
+            return jsonify(exc.body()), exc.status
         except Exception:
             session.rollback()
             if secondary_session:
@@ -298,14 +722,7 @@ def upsert_station_mapping(path_token: Optional[str] = None):
             if secondary_session:
                 secondary_session.close()
 
-    return jsonify(
-        {
-            "status": "ok",
-            "station_code": new_code,
-            "city": city,
-            "operation": operation,
-        }
-    )
+    return jsonify(finish_station_mapping(operation, new_code, city, prior_code))
 
 
 @bp.get("/cities")
@@ -321,31 +738,124 @@ def list_cities(path_token: Optional[str] = None):
     return jsonify({"cities": cities})
 
 
-def _insert_gas(
-    session, station: str, city: Optional[str], fields: Dict[str, Optional[float]]
-) -> None:
-    payload = {k: v for k, v in fields.items() if v is not None}
-    rec = GasReading(station_code=station, city=city, **payload)
-    session.add(rec)
+def _duplicate_result() -> Dict[str, Any]:
+    return {"status": "ok", "duplicate": True, "gas": 0, "meteo": 0}
 
 
-def _insert_meteo(
-    session, station: str, city: Optional[str], fields: Dict[str, Optional[float]]
-) -> None:
-    payload = {k: v for k, v in fields.items() if v is not None}
-    rec = MeteoReading(station_code=station, city=city, **payload)
-    session.add(rec)
+def _prepare_batch_item(
+    session,
+    item: Any,
+    city_memo: Dict[Tuple[Any, ...], Optional[str]],
+    idempotency_key: Optional[str] = None,
+) -> Tuple[Dict[str, Any], List[Row], Optional[str]]:
+    """Build one batch item's rows; also returns its dedup key, if any."""
 
+    result, rows, reading_time = _build_batch_item(session, item, city_memo)
+    key = None
+    if rows and DEDUP.enabled:
+        key = DEDUP.key_for(idempotency_key, rows, reading_time)
+    return result, rows, key
 
-def _sync_station_mapping(
-    session, source: StationMapping, previous_code: Optional[str] = None
-) -> None:
-    lookup_code = previous_code or source.station_code
-    existing = session.execute(
-        select(StationMapping).where(StationMapping.station_code == lookup_code)
-    ).scalar_one_or_none()
-    if existing:
-        existing.city = source.city
-        existing.station_code = source.station_code
+
+def _build_batch_item(
+    session, item: Any, city_memo: Dict[Tuple[Any, ...], Optional[str]]
+) -> Tuple[Dict[str, Any], List[Row], Optional[datetime]]:
+    if isinstance(item, CompactReading):
+        data: Dict[str, Any] = {}
+        station = normalize_station_code(item.station)
+        try:
+            reading_time = check_reading_time(item.time)
+        except IngestRejected as exc:
+            return {"status": "error", "error": exc.error}, [], None
+    elif isinstance(item, dict):
+        data = dict(item)
+        try:
+            reading_time = take_reading_time(data)
+        except IngestRejected as exc:
+            return {"status": "error", "error": exc.error}, [], None
+        station = normalize_station_code(extract_station(data))
+    else:
+        return {"status": "error", "error": "invalid_item"}, [], None
+
+    memo_key = (station,) + tuple(
+        str(data.get(key)) for key in ("city", "city_name", "city_id", "station_id")
+    )
+    if memo_key not in city_memo:
+        with stage("resolve_city"):
+            city_memo[memo_key] = resolve_city(session, data, station)
+    city = city_memo[memo_key]
+
+    if isinstance(item, CompactReading):
+        gas_fields, meteo_fields = item.gas, item.meteo
     else:
-        session.add(StationMapping(city=source.city, station_code=source.station_code))
+        with stage("normalize_fields"):
+            gas_fields, meteo_fields = normalize_fields(data)
+
+    rows: List[Row] = []
+    if any(v is not None for v in gas_fields.values()):
+        if not station:
+            return {"status": "error", "error": "missing_station_code"}, [], None
+        with stage("mapping_lookup"):
+            mapping_city = STATION_CACHE.city_for_code(station, session)
+        if mapping_city is None:
+            return {"status": "error", "error": "station_not_registered"}, [], None
+        rows.append((GasReading, build_row(station, city, gas_fields, reading_time)))
+
+    if any(v is not None for v in meteo_fields.values()):
+        if not city:
+            return {"status": "error", "error": "missing_city"}, [], None
+        with stage("mapping_lookup"):
+            meteo_station = STATION_CACHE.code_for_city(city, session)
+        if meteo_station is None:
+            return {"status": "error", "error": "station_not_registered"}, [], None
+        rows.append(
+            (MeteoReading, build_row(meteo_station, city, meteo_fields, reading_time))
+        )
+
+    gas_count = sum(1 for model, _ in rows if model is GasReading)
+    result = {"status": "ok", "gas": gas_count, "meteo": len(rows) - gas_count}
+    return result, rows, reading_time
+
+
+def _write_batch_chunk(
+    chunk: List[Tuple[int, List[Row], Optional[str]]], results: List[Dict[str, Any]]
+) -> None:
+    keys = [key for _, _, key in chunk if key]
+    with SessionLocal() as session:
+        try:
+            if keys:
+                with stage("dedup"):
+                    duplicates = DEDUP.check(session, keys)
+                for index, _, key in chunk:
+                    if key in duplicates:
+                        results[index] = {"index": index, **_duplicate_result()}
+                chunk = [entry for entry in chunk if entry[2] not in duplicates]
+            if ANOMALY.enabled:
+                chunk = [
+                    (index, screen_rows(item_rows), key)
+                    for index, item_rows, key in chunk
+                ]
+                for index, item_rows, _ in chunk:
+                    gas = sum(1 for model, _ in item_rows if model is GasReading)
+                    results[index].update(gas=gas, meteo=len(item_rows) - gas)
+            rows = [row for _, item_rows, _ in chunk for row in item_rows]
+            if rows:
+                spooled = SPOOL.commit_or_spool(session, rows)
+            else:
+                # Only claims of fully quarantined items can be pending.
+                spooled = False
+                session.commit()
+        except Exception:
+            log.exception("Failed to write batch chunk of %s items", len(chunk))
+            for index, _, _ in chunk:
+                results[index] = {
+                    "index": index,
+                    "status": "error",
+                    "error": "db_write_failed",
+                }
+            return
+    DEDUP.remember(key for _, _, key in chunk if key)
+    _record_rows(rows)
+    if spooled:
+        for index, _, _ in chunk:
+            results[index]["spooled"] = True
@@ -0,0 +1,221 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from flask import Blueprint, jsonify, request
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from backend.log import log
+
+from .config import CITY_BY_ID, Config
+from .Database.db import SessionLocal
+from .Database.models import StationMapping
+from .helpers import extract_city_from_payload, normalize_station_code, require_api_key
+from .readings import QueryError, READING_TYPES, reading_columns, serialize_value
+
+bp = Blueprint("latest", __name__)
+
+Reading = Dict[str, Any]
+
+
+class SharedLatestFile:
+    """Latest readings in a local SQLite file, so every worker sees every update."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    def store(self, readings: Iterable[Reading]) -> None:
+        params = [
+            (
+                reading["kind"],
+                reading["station_code"],
+                reading["time"],
+                json.dumps(reading),
+            )
+            for reading in readings
+        ]
+        with self._lock:
+            conn = self._connection()
+            # Readings may arrive out of order; only a newer time replaces a row.
+            conn.executemany(
+                "INSERT INTO latest (kind, station_code, time, reading) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT (kind, station_code) DO UPDATE "
+                "SET time = excluded.time, reading = excluded.reading "
+                "WHERE excluded.time >= latest.time",
+                params,
+            )
+            conn.commit()
+
+    def load(self) -> List[Reading]:
+        with self._lock:
+            rows = self._connection().execute("SELECT reading FROM latest").fetchall()
+        return [json.loads(reading) for (reading,) in rows]
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS latest ("
+                "kind TEXT NOT NULL, station_code TEXT NOT NULL, time TEXT NOT NULL, "
+                "reading TEXT NOT NULL, PRIMARY KEY (kind, station_code))"
+            )
+            conn.commit()
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+
+class LatestReadings:
+    """Newest gas and meteo reading per station, served to /latest from memory.
+
+    Updated from accepted ingest rows and warmed from the database at
+    bootstrap with one index seek per station on (station_code, time).
+    """
+
+    def __init__(self, shared_path: str = "") -> None:
+        self._lock = threading.Lock()
+        self._latest: Dict[str, Dict[str, Reading]] = {
+            kind: {} for kind in READING_TYPES
+        }
+        self.shared = SharedLatestFile(shared_path) if shared_path else None
+
+    def record(self, readings: List[Reading]) -> None:
+        """Keep readings that are not older than what their station has."""
+
+        if self.shared is not None:
+            self.shared.store(readings)
+            return
+        with self._lock:
+            for reading in readings:
+                stations = self._latest[reading["kind"]]
+                current = stations.get(reading["station_code"])
+                if current is None or reading["time"] >= current["time"]:
+                    stations[reading["station_code"]] = reading
+
+    def load(self, session: Optional[Session] = None) -> None:
+        """Warm the store with each mapped station's newest readings."""
+
+        if session is None:
+            with SessionLocal() as own_session:
+                readings = self._fetch(own_session)
+        else:
+            readings = self._fetch(session)
+        self.record(readings)
+        log.debug("Latest-reading store warmed with %s readings", len(readings))
+
+    def snapshot(self) -> Dict[str, Dict[str, Reading]]:
+        """Return {kind: {station_code: reading}}."""
+
+        if self.shared is not None:
+            latest: Dict[str, Dict[str, Reading]] = {kind: {} for kind in READING_TYPES}
+            for reading in self.shared.load():
+                latest[reading["kind"]][reading["station_code"]] = reading
+            return latest
+        with self._lock:
+            return {kind: dict(stations) for kind, stations in self._latest.items()}
+
+    def by_city(
+        self, city: Optional[str] = None, station: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Latest gas and meteo reading of each city, from its freshest station."""
+
+        latest = self.snapshot()
+        cities = [city] if city else [CITY_BY_ID[key] for key in sorted(CITY_BY_ID)]
+        result: Dict[str, Dict[str, Any]] = {
+            name: {"city": name, "gas": None, "meteo": None} for name in cities
+        }
+        for kind, stations in latest.items():
+            for code, reading in stations.items():
+                entry = result.get(reading.get("city"))
+                if entry is None or (station and code != station):
+                    continue
+                current = entry[kind]
+                if current is None or reading["time"] > current["time"]:
+                    entry[kind] = _public(reading)
+        return list(result.values())
+
+    @staticmethod
+    def _fetch(session: Session) -> List[Reading]:
+        codes = session.scalars(select(StationMapping.station_code)).all()
+        readings: List[Reading] = []
+        for kind, (model, fields) in READING_TYPES.items():
+            query = select(*reading_columns(model, fields)).order_by(model.time.desc())
+            for code in codes:
+                row = session.execute(
+                    query.where(model.station_code == code).limit(1)
+                ).first()
+                if row is not None:
+                    readings.append(to_reading(kind, row._mapping))
+        return readings
+
+
+def to_reading(kind: str, fields: Any) -> Reading:
+    """JSON-ready reading from an insert row or a selected DB row."""
+
+    _, names = READING_TYPES[kind]
+    time = fields["time"]
+    return {
+        "kind": kind,
+        "station_code": fields["station_code"],
+        "city": fields.get("city"),
+        # Fixed-width ISO so string comparison orders by time.
+        "time": (
+            time.isoformat(timespec="microseconds")
+            if isinstance(time, datetime)
+            else time
+        ),
+        **{name: serialize_value(fields.get(name)) for name in names},
+    }
+
+
+def _public(reading: Reading) -> Dict[str, Any]:
+    return {key: value for key, value in reading.items() if key != "kind"}
+
+
+def location_filter(args: Mapping[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    """Optional (city, station_code) filter; QueryError for an unknown city."""
+
+    city = None
+    if any(key in args for key in ("city", "city_name", "city_id")):
+        city = extract_city_from_payload(args)
+        if city is None:
+            raise QueryError(
+                "invalid_city", "Provided city value is not present in CITY_BY_ID."
+            )
+    return city, normalize_station_code(args.get("station_code"))
+
+
+def latest_body(args: Mapping[str, Any]) -> Tuple[int, Dict[str, Any]]:
+    """Shared by the Flask and ASGI /latest: (status, JSON body)."""
+
+    try:
+        city, station = location_filter(args)
+    except QueryError as exc:
+        return 400, {"error": exc.error, "message": exc.message}
+    return 200, {"cities": LATEST.by_city(city, station)}
+
+
+@bp.get("/latest")
+@bp.get("/latest/<string:path_token>")
+def latest(path_token: Optional[str] = None):
+    auth_err = require_api_key(path_token)
+    if auth_err:
+        return auth_err
+
+    status, body = latest_body(request.args.to_dict())
+    return jsonify(body), status
+
+
+LATEST = LatestReadings(Config.LATEST_SHARED_PATH)
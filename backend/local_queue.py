@@ -0,0 +1,104 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .Database.models import GasReading, MeteoReading
+from .Database.rows import Row
+
+MODELS_BY_KIND = {"gas": GasReading, "meteo": MeteoReading}
+KIND_BY_MODEL = {model: kind for kind, model in MODELS_BY_KIND.items()}
+
+Entry = Tuple[str, str, Dict[str, Any]]
+
+
+class LocalQueue:
+    """Durable FIFO of JSON operations kept in a local SQLite file."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    def append(self, entries: Iterable[Entry]) -> int:
+        now = time.time()
+        params = [(op, kind, json.dumps(payload), now) for op, kind, payload in entries]
+        if not params:
+            return 0
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                "INSERT INTO queue (op, kind, payload, enqueued_at) VALUES (?, ?, ?, ?)",
+                params,
+            )
+            conn.commit()
+        return len(params)
+
+    def peek(self, limit: int) -> List[Tuple[int, str, str, Dict[str, Any]]]:
+        """Return up to ``limit`` oldest entries without removing them."""
+
+        with self._lock:
+            entries = (
+                self._connection()
+                .execute(
+                    "SELECT id, op, kind, payload FROM queue ORDER BY id LIMIT ?",
+                    (limit,),
+                )
+                .fetchall()
+            )
+        return [
+            (entry_id, op, kind, json.loads(payload))
+            for entry_id, op, kind, payload in entries
+        ]
+
+    def delete_through(self, entry_id: int) -> None:
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM queue WHERE id <= ?", (entry_id,))
+            conn.commit()
+
+    def stats(self) -> Tuple[int, Optional[float]]:
+        """Return the number of queued entries and the oldest enqueue time."""
+
+        with self._lock:
+            count, oldest = (
+                self._connection()
+                .execute("SELECT COUNT(*), MIN(enqueued_at) FROM queue")
+                .fetchone()
+            )
+        return count, oldest
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS queue ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, op TEXT NOT NULL, "
+                "kind TEXT NOT NULL, payload TEXT NOT NULL, enqueued_at REAL NOT NULL)"
+            )
+            conn.commit()
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+
+def row_entries(rows: Iterable[Row]) -> Iterator[Entry]:
+    for model, row in rows:
+        encoded = dict(row)
+        if isinstance(encoded.get("time"), datetime):
+            encoded["time"] = encoded["time"].isoformat()
+        yield "rows", KIND_BY_MODEL[model], encoded
+
+
+def decode_row(kind: str, payload: Dict[str, Any]) -> Row:
+    if isinstance(payload.get("time"), str):
+        payload["time"] = datetime.fromisoformat(payload["time"])
+    return MODELS_BY_KIND[kind], payload
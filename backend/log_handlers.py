@@ -0,0 +1,86 @@
+import copy
+import json
+import logging
+import random
+import threading
+import time
+from datetime import datetime
+from logging.handlers import QueueHandler
+
+# Pass as ``extra=SAMPLED`` for per-request logs that may be sampled away.
+SAMPLED = {"sampled": True}
+
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "sampled"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; ``extra`` fields become top-level keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of records marked ``sampled``, at most ``per_second`` each second.
+
+    Unmarked records (warnings, errors, lifecycle messages) always pass.
+    """
+
+    def __init__(self, rate: float = 1.0, per_second: int = 0) -> None:
+        super().__init__()
+        self.rate = rate
+        self.per_second = per_second
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._window = 0
+        self._count = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False):
+            return True
+        if self.rate < 1.0 and random.random() >= self.rate:
+            self.dropped += 1
+            return False
+        if self.per_second > 0:
+            window = int(time.monotonic())
+            with self._lock:
+                if window != self._window:
+                    self._window, self._count = window, 0
+                if self._count >= self.per_second:
+                    self.dropped += 1
+                    return False
+                self._count += 1
+        return True
+
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread.
+
+    Only the message arguments are rendered on the caller's thread, because
+    payload dicts may be mutated after the log call; timestamps, JSON
+    encoding and file I/O all happen in the background.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
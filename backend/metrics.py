@@ -0,0 +1,278 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from flask import Blueprint, Response
+
+from .helpers import require_api_key
+
+bp = Blueprint("metrics", __name__)
+
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+
+Labels = Tuple[str, ...]
+Sample = Tuple[str, Labels, Tuple[str, ...], float]
+
+REGISTRY: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base for in-process metrics rendered in the Prometheus text format."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._children: Dict[Labels, Any] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def labels(self, *values: Any) -> Any:
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self) -> Any:
+        raise NotImplementedError
+
+    def samples(self) -> Iterator[Sample]:
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def samples(self) -> Iterator[Sample]:
+        for key, child in list(self._children.items()):
+            yield f"{self.name}_total", key, (), child.value
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def samples(self) -> Iterator[Sample]:
+        for key, child in list(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", key, (_format_value(bound),), cumulative
+            yield f"{self.name}_sum", key, (), total
+            yield f"{self.name}_count", key, (), cumulative
+
+
+class CallbackGauge(_Metric):
+    """Gauge whose samples are produced by ``collect`` at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Tuple[str, ...],
+        collect: Callable[[], Iterable[Tuple[Labels, float]]],
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        self.collect = collect
+
+    def samples(self) -> Iterator[Sample]:
+        for key, value in self.collect():
+            yield self.name, key, (), value
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        family = metric.name + ("_total" if metric.kind == "counter" else "")
+        lines.append(f"# HELP {family} {metric.help}")
+        lines.append(f"# TYPE {family} {metric.kind}")
+        for name, key, extra, value in metric.samples():
+            names = metric.labelnames + (("le",) if extra else ())
+            labels = _format_labels(names, key + extra)
+            lines.append(f"{name}{labels} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _pool_samples() -> Iterator[Tuple[Labels, float]]:
+    from .Database.db import ENGINE, ENGINE_SECONDARY
+
+    for label, engine in (("primary", ENGINE), ("secondary", ENGINE_SECONDARY)):
+        if engine is None:
+            continue
+        pool = engine.pool
+        for state in ("size", "checkedin", "checkedout", "overflow"):
+            reader: Optional[Callable[[], int]] = getattr(pool, state, None)
+            if reader is not None:
+                yield (label, state), reader()
+
+
+def _stream_samples() -> Iterator[Tuple[Labels, float]]:
+    from .stream import STREAM_HUB
+
+    yield (), len(STREAM_HUB)
+
+
+INGEST_REQUEST_SECONDS = Histogram(
+    "ingest_request_seconds", "Ingest request latency.", ("endpoint",)
+)
+INGEST_STAGE_SECONDS = Histogram(
+    "ingest_stage_seconds", "Latency of individual ingest stages.", ("stage",)
+)
+INGEST_OUTCOMES = Counter(
+    "ingest_outcomes", "Ingested payloads by outcome.", ("endpoint", "outcome")
+)
+INGEST_READINGS = Counter(
+    "ingest_readings",
+    "Readings accepted per kind, city and station.",
+    ("kind", "city", "station_code"),
+)
+INGEST_ANOMALIES = Counter(
+    "ingest_anomalies",
+    "Values flagged by the anomaly detector per kind, field and action.",
+    ("kind", "field", "action"),
+)
+DB_POOL_CONNECTIONS = CallbackGauge(
+    "db_pool_connections",
+    "SQLAlchemy connection pool state per engine.",
+    ("engine", "state"),
+    _pool_samples,
+)
+STREAM_SUBSCRIBERS = CallbackGauge(
+    "stream_subscribers", "Open /stream connections.", (), _stream_samples
+)
+STREAM_DROPPED = Counter(
+    "stream_dropped", "/stream subscribers dropped for falling behind."
+)
+REPLICATION_ENQUEUE_FAILED = Counter(
+    "replication_enqueue_failed_rows",
+    "Committed rows that could not be queued for the secondary.",
+)
+WRITE_BUFFER_DROPPED = Counter(
+    "write_buffer_dropped_rows",
+    "Buffered rows dropped after the database rejected them.",
+)
+
+
+def stage(name: str):
+    """Context manager timing one ingest stage."""
+
+    return INGEST_STAGE_SECONDS.labels(name).time()
+
+
+def observe_request(endpoint: str):
+    """Decorator recording the full latency of an ingest view."""
+
+    histogram = INGEST_REQUEST_SECONDS.labels(endpoint)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            with histogram.time():
+                return view(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@bp.get("/metrics")
+@bp.get("/metrics/<string:path_token>")
+def metrics(path_token: Optional[str] = None):
+    auth_err = require_api_key(path_token)
+    if auth_err:
+        return auth_err
+    return Response(render(), mimetype="text/plain; version=0.0.4")
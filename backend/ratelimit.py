@@ -0,0 +1,206 @@
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .config import Config
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process buckets are available.
+    fcntl = None
+
+# Bucket state is (tokens, last update). Timestamps are time.monotonic(),
+# which on Linux is one clock for every process on the host.
+Bucket = Tuple[float, float]
+
+
+def _take(
+    bucket: Optional[Bucket], now: float, rate: float, burst: float
+) -> Tuple[Bucket, float]:
+    """Refill and try to take one token; returns (new state, seconds to wait)."""
+
+    if bucket is None or bucket[1] > now:
+        tokens = burst
+    else:
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+    if tokens >= 1.0:
+        return (tokens - 1.0, now), 0.0
+    return (tokens, now), (1.0 - tokens) / rate
+
+
+class TokenBuckets:
+    """Token buckets for this process, bounded to the ``max_keys`` most recent keys."""
+
+    def __init__(self, max_keys: int) -> None:
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[str, Bucket]" = OrderedDict()
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        with self._lock:
+            bucket, wait = _take(self._buckets.get(key), time.monotonic(), rate, burst)
+            self._buckets[key] = bucket
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class SharedTokenBuckets:
+    """Token buckets in a memory-mapped file, shared by every worker on the host.
+
+    The file is a fixed open-addressing table of (key hash, tokens, updated)
+    slots guarded by flock. When all probed slots are taken, the least
+    recently used one is reused, which at worst hands that key a fresh burst.
+    """
+
+    SLOT = struct.Struct("<Qdd")
+    PROBES = 8
+
+    def __init__(self, path: str, slots: int) -> None:
+        self.path = path
+        self.slots = slots
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._fd = -1
+        self._map: Optional[mmap.mmap] = None
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        key_hash = int.from_bytes(digest, "little") or 1
+        with self._lock:
+            # A forked worker must not share the master's open file description,
+            # or flock would not exclude the two.
+            if self._pid != os.getpid():
+                self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                offset, bucket = self._find(key_hash)
+                bucket, wait = _take(bucket, time.monotonic(), rate, burst)
+                self.SLOT.pack_into(self._map, offset, key_hash, *bucket)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return wait
+
+    def _find(self, key_hash: int) -> Tuple[int, Optional[Bucket]]:
+        start = key_hash % self.slots
+        oldest_offset, oldest_time = 0, math.inf
+        for probe in range(self.PROBES):
+            offset = (start + probe) % self.slots * self.SLOT.size
+            stored, tokens, updated = self.SLOT.unpack_from(self._map, offset)
+            if stored == key_hash:
+                return offset, (tokens, updated)
+            # Slots are never freed, so an empty one ends the probe sequence.
+            if stored == 0:
+                return offset, None
+            if updated < oldest_time:
+                oldest_offset, oldest_time = offset, updated
+        return oldest_offset, None
+
+    def _open(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            os.close(self._fd)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        size = self.slots * self.SLOT.size
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        self._pid = os.getpid()
+
+
+class RateLimiter:
+    """Per-API-key and per-station token buckets checked before any DB work.
+
+    There is a single INGEST_API_KEY, so the key bucket limits the total
+    request rate of every box together, not one client's; it is off unless
+    RATE_LIMIT_KEY_RATE is set. A batch takes one token from the bucket of
+    each station it carries.
+    """
+
+    def __init__(
+        self,
+        enabled: bool,
+        key_rate: float,
+        key_burst: float,
+        station_rate: float,
+        station_burst: float,
+        shared_path: str = "",
+        max_keys: int = 4096,
+    ) -> None:
+        self.enabled = enabled
+        self.limits: List[Tuple[str, float, float]] = [
+            (prefix, rate, max(1.0, burst))
+            for prefix, rate, burst in (
+                # Station first: a looping box is stopped without draining the
+                # bucket its whole API key shares.
+                ("station", station_rate, station_burst),
+                ("key", key_rate, key_burst),
+            )
+            if rate > 0
+        ]
+        self.buckets = (
+            SharedTokenBuckets(shared_path, max_keys)
+            if shared_path
+            else TokenBuckets(max_keys)
+        )
+        self.rejected: Dict[str, int] = {prefix: 0 for prefix, _, _ in self.limits}
+
+    def retry_after(
+        self, api_key: Optional[str], station: Optional[str] = None
+    ) -> Optional[int]:
+        """Seconds the caller must wait, or None if the request may proceed."""
+
+        if not self.enabled:
+            return None
+        for prefix, rate, burst in self.limits:
+            subject = api_key if prefix == "key" else station
+            if not subject:
+                continue
+            wait = self.buckets.take(f"{prefix}:{subject}", rate, burst)
+            if wait > 0:
+                self.rejected[prefix] += 1
+                return max(1, math.ceil(wait))
+        return None
+
+    def retry_after_batch(
+        self, api_key: Optional[str], stations: Iterable[str]
+    ) -> Optional[int]:
+        """retry_after for a batch: the key bucket, then each station's once.
+
+        Tokens taken before a station is found empty are not returned.
+        """
+
+        if not self.enabled:
+            return None
+        wait = self.retry_after(api_key)
+        for station in sorted(set(stations)):
+            if wait:
+                break
+            wait = self.retry_after(None, station)
+        return wait
+
+
+RATE_LIMITED = {
+    "error": "rate_limited",
+    "message": "Too many requests for this API key or station; retry later.",
+}
+
+RATE_LIMITER = RateLimiter(
+    Config.RATE_LIMIT_ENABLED,
+    Config.RATE_LIMIT_KEY_RATE,
+    Config.RATE_LIMIT_KEY_BURST,
+    Config.RATE_LIMIT_STATION_RATE,
+    Config.RATE_LIMIT_STATION_BURST,
+    Config.RATE_LIMIT_SHARED_PATH,
+    Config.RATE_LIMIT_MAX_KEYS,
+)
@@ -0,0 +1,241 @@
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple, Type
+
+from flask import Blueprint, Response, jsonify, request
+from sqlalchemy import and_, or_, select
+
+from backend.log import log
+
+from .Database.db import SessionLocal
+from .Database.models import GasReading, MeteoReading
+from .helpers import (
+    GAS_FIELDS,
+    METEO_FIELDS,
+    extract_city_from_payload,
+    normalize_station_code,
+    parse_timestamp,
+    require_api_key,
+)
+
+bp = Blueprint("readings", __name__)
+
+READING_TYPES: Dict[str, Tuple[Type[Any], Tuple[str, ...]]] = {
+    "gas": (GasReading, GAS_FIELDS),
+    "meteo": (MeteoReading, METEO_FIELDS),
+}
+
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+STREAM_CHUNK = 500
+
+
+class QueryError(ValueError):
+    """Invalid query parameters; rendered as a 400 response."""
+
+    def __init__(self, error: str, message: str) -> None:
+        super().__init__(message)
+        self.error = error
+        self.message = message
+
+    def response(self):
+        return jsonify({"error": self.error, "message": self.message}), 400
+
+
+def parse_reading_filters(
+    model: Type[Any],
+    include_time: bool = True,
+    args: Optional[Mapping[str, Any]] = None,
+) -> List[Any]:
+    """Build WHERE clauses for station_code/city and from/to query parameters.
+
+    Filtering on station_code plus a time range lets MySQL use the
+    (station_code, time) index; city-only filters fall back to the city index.
+    ``args`` defaults to the current request's query string.
+    """
+
+    if args is None:
+        args = request.args
+    clauses: List[Any] = []
+    station = normalize_station_code(args.get("station_code"))
+    if station:
+        clauses.append(model.station_code == station)
+
+    if any(key in args for key in ("city", "city_name", "city_id")):
+        city = extract_city_from_payload(args)
+        if city is None:
+            raise QueryError(
+                "invalid_city", "Provided city value is not present in CITY_BY_ID."
+            )
+        clauses.append(model.city == city)
+
+    for key, op in (("from", "__ge__"), ("to", "__lt__")):
+        value = args.get(key)
+        if not value or not include_time:
+            continue
+        try:
+            bound = parse_timestamp(value)
+        except (TypeError, ValueError, OverflowError, OSError):
+            raise QueryError(
+                "invalid_time", f"Cannot parse '{key}' as epoch or ISO-8601."
+            )
+        clauses.append(getattr(model.time, op)(bound))
+    return clauses
+
+
+def parse_limit(default: int = DEFAULT_LIMIT, maximum: int = MAX_LIMIT) -> int:
+    raw = request.args.get("limit")
+    if raw is None:
+        return default
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise QueryError("invalid_limit", "limit must be an integer.")
+    if limit < 1:
+        raise QueryError("invalid_limit", "limit must be positive.")
+    return min(limit, maximum)
+
+
+def encode_cursor(time: datetime, row_id: int) -> str:
+    raw = f"{time.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        time_text, row_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return datetime.fromisoformat(time_text), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise QueryError(
+            "invalid_cursor", "cursor is not a value returned by this API."
+        )
+
+
+def after_cursor(
+    model: Type[Any], after_time: datetime, after_id: int, descending: bool = False
+) -> Any:
+    """Keyset predicate for rows strictly after (time, id) in the given order."""
+
+    if descending:
+        return or_(
+            model.time < after_time,
+            and_(model.time == after_time, model.id < after_id),
+        )
+    return or_(
+        model.time > after_time,
+        and_(model.time == after_time, model.id > after_id),
+    )
+
+
+def keyset_chunks(
+    model: Type[Any],
+    columns: List[Any],
+    clauses: List[Any],
+    chunk_size: int,
+    descending: bool = False,
+    limit: Optional[int] = None,
+) -> Iterator[List[Any]]:
+    """Yield rows in (time, id) order, fetching each chunk with its own query.
+
+    ``columns`` must include ``time`` and ``id``. Every chunk is a bounded
+    ``WHERE (time, id) > last ORDER BY time, id LIMIT n`` seek, so memory
+    stays at one chunk even on drivers that buffer whole result sets
+    (mysql-connector has no server-side cursors). Each chunk checks out its
+    own connection, so a slow client does not pin one for the whole stream.
+    """
+
+    order = (
+        (model.time.desc(), model.id.desc()) if descending else (model.time, model.id)
+    )
+    base = select(*columns).where(*clauses).order_by(*order)
+    after: Optional[Tuple[datetime, int]] = None
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = chunk_size if remaining is None else min(chunk_size, remaining)
+        stmt = (
+            base
+            if after is None
+            else base.where(after_cursor(model, *after, descending))
+        )
+        with SessionLocal() as session:
+            rows = session.execute(stmt.limit(size)).all()
+        if rows:
+            yield rows
+        if len(rows) < size:
+            return
+        after = (rows[-1].time, rows[-1].id)
+        if remaining is not None:
+            remaining -= len(rows)
+
+
+def serialize_value(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def reading_columns(model: Type[Any], fields: Tuple[str, ...]) -> List[Any]:
+    """Select list that labels DB columns (e.g. ``COmg/m3``) with API names."""
+
+    return [
+        model.id,
+        model.station_code,
+        model.city,
+        model.time,
+        *(getattr(model, field).label(field) for field in fields),
+    ]
+
+
+@bp.get("/readings/<string:kind>")
+@bp.get("/readings/<string:kind>/<string:path_token>")
+def list_readings(kind: str, path_token: Optional[str] = None):
+    auth_err = require_api_key(path_token)
+    if auth_err:
+        return auth_err
+    if kind not in READING_TYPES:
+        return jsonify({"error": "unknown_reading_type"}), 404
+
+    model, fields = READING_TYPES[kind]
+    descending = request.args.get("order", "asc").lower() == "desc"
+    try:
+        clauses = parse_reading_filters(model)
+        limit = parse_limit()
+        cursor = request.args.get("cursor")
+        if cursor:
+            clauses.append(after_cursor(model, *decode_cursor(cursor), descending))
+    except QueryError as exc:
+        return exc.response()
+
+    log.debug("Readings query kind=%s limit=%s cursor=%s", kind, limit, cursor)
+    chunks = keyset_chunks(
+        model,
+        reading_columns(model, fields),
+        clauses,
+        STREAM_CHUNK,
+        descending,
+        limit=limit + 1,
+    )
+    return Response(_stream_page(chunks, limit), mimetype="application/json")
+
+
+def _stream_page(chunks: Iterator[List[Any]], limit: int) -> Iterator[str]:
+    yield '{"items": ['
+    sent = 0
+    last: Optional[Tuple[datetime, int]] = None
+    has_more = False
+    for chunk in chunks:
+        for row in chunk:
+            if sent == limit:
+                has_more = True
+                break
+            item = {key: serialize_value(value) for key, value in row._mapping.items()}
+            yield ("," if sent else "") + json.dumps(item)
+            sent += 1
+            last = (row.time, row.id)
+    next_cursor = encode_cursor(*last) if has_more and last else None
+    yield '], "count": %d, "next_cursor": %s}' % (sent, json.dumps(next_cursor))
@@ -0,0 +1,253 @@
+import atexit
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from backend.log import log
+
+from .config import Config
+from .Database.db import HAS_SECONDARY, SessionLocalSecondary
+from .Database.models import StationMapping
+from .Database.rows import Row, insert_rows
+from .local_queue import LocalQueue, decode_row, row_entries
+from .metrics import INGEST_STAGE_SECONDS, REPLICATION_ENQUEUE_FAILED, stage
+
+
+class SecondaryWriteError(Exception):
+    """The secondary failed a synchronous write; the primary was not committed.
+
+    Kept apart from the driver's errors so a secondary outage is not taken
+    for a primary one, which would spool readings the primary could take.
+    """
+
+
+def sync_station_mapping(
+    session: Session,
+    station_code: str,
+    city: str,
+    previous_code: Optional[str] = None,
+) -> None:
+    """Apply a station mapping create/update/rename to another database."""
+
+    lookup_code = previous_code or station_code
+    existing = session.execute(
+        select(StationMapping).where(StationMapping.station_code == lookup_code)
+    ).scalar_one_or_none()
+    if existing:
+        existing.city = city
+        existing.station_code = station_code
+    else:
+        session.add(StationMapping(city=city, station_code=station_code))
+
+
+class SecondaryReplicator:
+    """Forwards committed writes to ENGINE_SECONDARY from a durable local queue.
+
+    Operations are appended to a SQLite file so they survive restarts and
+    secondary outages; a background worker replays them in order, in
+    batches, backing off exponentially while the secondary is failing.
+    """
+
+    def __init__(
+        self,
+        enabled: bool,
+        queue_path: str,
+        batch_size: int,
+        max_backoff: float,
+    ) -> None:
+        self.enabled = enabled
+        self.queue = LocalQueue(queue_path)
+        self.batch_size = batch_size
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        # Cleared in preforked workers so only the master drains the queue file.
+        self.drain_locally = True
+        self._failures = 0
+        self.last_error: Optional[str] = None
+        self.last_success_at: Optional[float] = None
+        self.replicated_total = 0
+
+    def enqueue_rows(self, rows: Iterable[Row]) -> None:
+        """Queue rows already committed on the primary for the secondary.
+
+        Failures are logged and counted, not raised: the ingest succeeded,
+        and an error response would make the box send the rows again.
+        """
+
+        rows = list(rows)
+        try:
+            appended = self.queue.append(row_entries(rows))
+        except Exception:
+            log.exception("Could not queue %s rows for the secondary", len(rows))
+            REPLICATION_ENQUEUE_FAILED.inc(len(rows))
+            return
+        if appended:
+            self._ensure_worker()
+            self._wake.set()
+
+    def enqueue_mapping(
+        self, station_code: str, city: str, previous_code: Optional[str] = None
+    ) -> None:
+        payload = {
+            "station_code": station_code,
+            "city": city,
+            "previous_code": previous_code,
+        }
+        self.queue.append([("mapping", "mapping", payload)])
+        self._ensure_worker()
+        self._wake.set()
+
+    def stats(self) -> Dict[str, Any]:
+        if not self.enabled:
+            return {"mode": "sync" if HAS_SECONDARY else "disabled"}
+        pending, oldest = self.queue.stats()
+        return {
+            "mode": "async",
+            "pending": pending,
+            "lag_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+            "replicated_total": self.replicated_total,
+            "consecutive_failures": self._failures,
+            "last_error": self.last_error,
+        }
+
+    def replicate_once(self) -> int:
+        """Replay one batch from the queue; return the number of operations sent."""
+
+        entries = self.queue.peek(self.batch_size)
+        if not entries:
+            return 0
+
+        with SessionLocalSecondary() as session:
+            rows: List[Row] = []
+            for _, op, kind, payload in entries:
+                if op == "rows":
+                    rows.append(decode_row(kind, payload))
+                    continue
+                insert_rows(session, rows)
+                rows = []
+                sync_station_mapping(
+                    session,
+                    payload["station_code"],
+                    payload["city"],
+                    payload["previous_code"],
+                )
+            insert_rows(session, rows)
+            session.commit()
+
+        self.queue.delete_through(entries[-1][0])
+        self.replicated_total += len(entries)
+        self.last_success_at = time.time()
+        return len(entries)
+
+    def start(self) -> None:
+        """Start draining operations left in the queue by a previous run."""
+
+        if self.enabled:
+            self._ensure_worker()
+
+    def close(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            thread.join(timeout=10)
+
+    def _ensure_worker(self) -> None:
+        if not self.drain_locally:
+            return
+        pid = os.getpid()
+        if self._thread is not None and self._thread.is_alive() and self._pid == pid:
+            return
+        with self._lock:
+            if (
+                self._thread is not None
+                and self._thread.is_alive()
+                and self._pid == pid
+            ):
+                return
+            self._stop.clear()
+            self._pid = pid
+            self._thread = threading.Thread(
+                target=self._run, name="secondary-replicator", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                sent = self.replicate_once()
+                self._failures = 0
+                self.last_error = None
+            except Exception as exc:
+                self._failures += 1
+                self.last_error = str(exc)
+                delay = min(self.max_backoff, 2 ** min(self._failures, 16) * 0.5)
+                log.warning(
+                    "Secondary replication failed (attempt %s); retrying in %.1fs",
+                    self._failures,
+                    delay,
+                    exc_info=True,
+                )
+                self._stop.wait(delay)
+                continue
+            if sent < self.batch_size:
+                self._wake.wait(1.0)
+                self._wake.clear()
+
+
+REPLICATOR = SecondaryReplicator(
+    Config.SECONDARY_REPLICATION == "async" and HAS_SECONDARY,
+    Config.REPLICATION_QUEUE_PATH,
+    Config.REPLICATION_BATCH_SIZE,
+    Config.REPLICATION_MAX_BACKOFF,
+)
+atexit.register(REPLICATOR.close)
+
+
+def open_secondary_session() -> Optional[Session]:
+    """Return a session for synchronous secondary writes, if that mode is active."""
+
+    if not HAS_SECONDARY or REPLICATOR.enabled:
+        return None
+    return SessionLocalSecondary()
+
+
+def commit_rows(session: Session, rows: List[Row]) -> None:
+    """Insert rows on the primary and on the secondary, in the configured mode."""
+
+    secondary_session = open_secondary_session()
+    try:
+        started = time.perf_counter()
+        insert_rows(session, rows)
+        primary_seconds = time.perf_counter() - started
+        if secondary_session:
+            with stage("secondary_commit"):
+                try:
+                    insert_rows(secondary_session, rows)
+                    secondary_session.commit()
+                except Exception as exc:
+                    raise SecondaryWriteError(
+                        f"Secondary write of {len(rows)} rows failed: {exc}"
+                    ) from exc
+        started = time.perf_counter()
+        session.commit()
+        primary_seconds += time.perf_counter() - started
+        INGEST_STAGE_SECONDS.labels("primary_commit").observe(primary_seconds)
+    except Exception:
+        session.rollback()
+        if secondary_session:
+            secondary_session.rollback()
+        raise
+    finally:
+        if secondary_session:
+            secondary_session.close()
+    if REPLICATOR.enabled:
+        REPLICATOR.enqueue_rows(rows)
@@ -0,0 +1,292 @@
+import atexit
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from backend.log import log
+
+from .config import Config
+from .Database.db import SessionLocal
+from .Database.models import (
+    GasReading,
+    MeteoReading,
+    ReadingRollup,
+    RollupState,
+    _kyiv_now,
+)
+from .helpers import GAS_FIELDS, METEO_FIELDS
+
+ROLLUP_SOURCES = {
+    "gas": (GasReading, GAS_FIELDS),
+    "meteo": (MeteoReading, METEO_FIELDS),
+}
+PERIODS = ("hour", "day")
+BUCKET_TO_PERIOD = {"1h": "hour", "1d": "day"}
+
+RollupKey = Tuple[str, str, str, datetime]
+
+
+def period_start(time: datetime, period: str) -> datetime:
+    if period == "hour":
+        return time.replace(minute=0, second=0, microsecond=0)
+    return time.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def accumulate(
+    kind: str, fields: Tuple[str, ...], rows: List[Any]
+) -> List[Dict[str, Any]]:
+    """Fold raw reading rows into rollup deltas keyed by period/station/field/bucket."""
+
+    acc: Dict[RollupKey, List[Any]] = {}
+    for row in rows:
+        station, city, time = row[1], row[2], row[3]
+        for period in PERIODS:
+            bucket = period_start(time, period)
+            for field, value in zip(fields, row[4:]):
+                key = (period, station, field, bucket)
+                entry = acc.get(key)
+                if entry is None:
+                    entry = acc[key] = [city, 0, 0, None, None, None]
+                entry[0] = city or entry[0]
+                entry[1] += 1
+                if value is None:
+                    continue
+                value = float(value)
+                entry[2] += 1
+                entry[3] = value if entry[3] is None else entry[3] + value
+                entry[4] = value if entry[4] is None else min(entry[4], value)
+                entry[5] = value if entry[5] is None else max(entry[5], value)
+
+    return [
+        {
+            "kind": kind,
+            "period": period,
+            "station_code": station,
+            "field": field,
+            "time": bucket,
+            "city": city,
+            "samples": samples,
+            "value_count": count,
+            "value_sum": total,
+            "value_min": low,
+            "value_max": high,
+        }
+        for (period, station, field, bucket), (
+            city,
+            samples,
+            count,
+            total,
+            low,
+            high,
+        ) in acc.items()
+    ]
+
+
+def _merge_statement(dialect: str):
+    table = ReadingRollup.__table__
+    if dialect == "mysql":
+        stmt = mysql_insert(table)
+        new, least, greatest = stmt.inserted, func.least, func.greatest
+    elif dialect == "sqlite":
+        stmt = sqlite_insert(table)
+        new, least, greatest = stmt.excluded, func.min, func.max
+    else:
+        raise RuntimeError(f"Rollups are not supported on the {dialect} backend")
+
+    old = table.c
+    updates = {
+        "city": func.coalesce(new.city, old.city),
+        "samples": old.samples + new.samples,
+        "value_count": old.value_count + new.value_count,
+        "value_sum": func.coalesce(
+            old.value_sum + new.value_sum, old.value_sum, new.value_sum
+        ),
+        "value_min": least(
+            func.coalesce(old.value_min, new.value_min),
+            func.coalesce(new.value_min, old.value_min),
+        ),
+        "value_max": greatest(
+            func.coalesce(old.value_max, new.value_max),
+            func.coalesce(new.value_max, old.value_max),
+        ),
+    }
+    if dialect == "mysql":
+        return stmt.on_duplicate_key_update(**updates)
+    return stmt.on_conflict_do_update(
+        index_elements=["kind", "period", "station_code", "field", "time"],
+        set_=updates,
+    )
+
+
+def update_rollups(
+    kind: str, batch_size: int, lag: float = Config.ROLLUP_SAFETY_LAG
+) -> int:
+    """Fold the next batch of rows past the high-water mark; return rows consumed.
+
+    The state row is locked FOR UPDATE so concurrent workers serialize
+    instead of counting the same readings twice.
+
+    Ids are assigned at insert but become visible at commit, so a lower id
+    can appear after a higher one was consumed. Rows are therefore only
+    read up to a horizon: the largest id seen at least ``lag`` seconds
+    ago. Every id below it was handed out before then, so its transaction
+    has committed or rolled back. The horizon is kept in a second state
+    row, "<kind>:horizon", whose updated_at is when it was taken.
+    """
+
+    model, fields = ROLLUP_SOURCES[kind]
+    with SessionLocal() as session:
+        state = session.execute(
+            select(RollupState).where(RollupState.name == kind).with_for_update()
+        ).scalar_one_or_none()
+        if state is None:
+            state = RollupState(name=kind, last_id=0)
+            session.add(state)
+            session.flush()
+        horizon = session.get(RollupState, f"{kind}:horizon")
+        now = _kyiv_now()
+        settled = (
+            horizon is not None and (now - horizon.updated_at).total_seconds() >= lag
+        )
+        if not settled:
+            if horizon is None:
+                _take_horizon(session, model, kind, None, now)
+            session.commit()
+            return 0
+
+        rows = session.execute(
+            select(
+                model.id,
+                model.station_code,
+                model.city,
+                model.time,
+                *(getattr(model, field) for field in fields),
+            )
+            .where(model.id > state.last_id, model.id <= horizon.last_id)
+            .order_by(model.id)
+            .limit(batch_size)
+        ).all()
+        if rows:
+            deltas = accumulate(kind, fields, rows)
+            dialect = session.get_bind().dialect.name
+            session.execute(_merge_statement(dialect), deltas)
+            state.last_id = rows[-1][0]
+        if len(rows) < batch_size:
+            _take_horizon(session, model, kind, horizon, now)
+        session.commit()
+    return len(rows)
+
+
+def _take_horizon(
+    session, model, kind: str, horizon: Optional[RollupState], now: datetime
+) -> None:
+    last_id = session.scalar(select(func.max(model.id))) or 0
+    if horizon is None:
+        session.add(
+            RollupState(name=f"{kind}:horizon", last_id=last_id, updated_at=now)
+        )
+    else:
+        horizon.last_id = last_id
+        horizon.updated_at = now
+
+
+def run_rollups(
+    batch_size: int = Config.ROLLUP_BATCH_SIZE, lag: float = Config.ROLLUP_SAFETY_LAG
+) -> Dict[str, int]:
+    """Catch every rollup up with the raw tables, up to their horizons."""
+
+    consumed: Dict[str, int] = {}
+    for kind in ROLLUP_SOURCES:
+        total = 0
+        while True:
+            count = update_rollups(kind, batch_size, lag)
+            total += count
+            if count < batch_size:
+                break
+        consumed[kind] = total
+    return consumed
+
+
+def catch_up(batch_size: int = Config.ROLLUP_BATCH_SIZE) -> Dict[str, int]:
+    """Run twice, one safety lag apart, so rows inserted until now are folded."""
+
+    consumed = run_rollups(batch_size)
+    time.sleep(Config.ROLLUP_SAFETY_LAG)
+    for kind, count in run_rollups(batch_size).items():
+        consumed[kind] += count
+    return consumed
+
+
+def reset_rollups() -> None:
+    with SessionLocal() as session:
+        session.execute(delete(ReadingRollup))
+        session.execute(delete(RollupState))
+        session.commit()
+
+
+class RollupWorker:
+    """Periodically folds newly inserted readings into the rollup tables."""
+
+    def __init__(self, enabled: bool, interval: float) -> None:
+        self.enabled = enabled
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def start(self) -> None:
+        if not self.enabled:
+            return
+        pid = os.getpid()
+        if self._thread is not None and self._thread.is_alive() and self._pid == pid:
+            return
+        self._stop.clear()
+        self._pid = pid
+        self._thread = threading.Thread(
+            target=self._run, name="rollup-worker", daemon=True
+        )
+        self._thread.start()
+
+    def close(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                consumed = run_rollups()
+            except Exception:
+                log.warning("Rollup update failed; retrying later", exc_info=True)
+                continue
+            if any(consumed.values()):
+                log.debug("Rollups updated %s", consumed)
+
+
+ROLLUP_WORKER = RollupWorker(Config.ROLLUPS_ENABLED, Config.ROLLUP_INTERVAL)
+atexit.register(ROLLUP_WORKER.close)
+
+rollup_cli = AppGroup("rollups", help="Maintain the hourly/daily rollup tables.")
+
+
+@rollup_cli.command("update")
+@click.option("--batch-size", default=Config.ROLLUP_BATCH_SIZE, show_default=True)
+def update_command(batch_size: int) -> None:
+    """Fold readings inserted since the last run into the rollups."""
+
+    click.echo(f"Rollups updated: {catch_up(batch_size)}")
+
+
+@rollup_cli.command("backfill")
+@click.option("--batch-size", default=Config.ROLLUP_BATCH_SIZE, show_default=True)
+def backfill_command(batch_size: int) -> None:
+    """Rebuild the rollups from all existing readings."""
+
+    reset_rollups()
+    click.echo(f"Rollups rebuilt: {catch_up(batch_size)}")
@@ -0,0 +1,105 @@
+import os
+from typing import Any, Dict
+
+from gunicorn.app.base import BaseApplication
+
+from backend.log import log
+
+from .config import Config, restart_log_listener
+
+# /latest store for a multi-worker server when LATEST_SHARED_PATH is unset.
+LATEST_SHARED_DEFAULT = os.path.join("data", "latest.sqlite3")
+
+
+def post_fork(server, worker) -> None:
+    """Give each worker its own connections and leave queue draining to the master."""
+
+    from .anomaly import ANOMALY
+    from .bootstrap import start_warmup
+    from .Database.db import ENGINE, ENGINE_SECONDARY, schema_ready
+    from .replication import REPLICATOR
+    from .spool import SPOOL
+
+    # close=False drops the inherited pool without closing the master's sockets.
+    ENGINE.dispose(close=False)
+    if ENGINE_SECONDARY is not None:
+        ENGINE_SECONDARY.dispose(close=False)
+    REPLICATOR.drain_locally = False
+    SPOOL.drain_locally = False
+    restart_log_listener()
+    # Each worker learns from its own traffic and checkpoints it.
+    ANOMALY.start()
+    # Threads do not survive fork, so a bootstrap the master could not
+    # finish is retried here.
+    if Config.DB_WARMUP and not schema_ready():
+        start_warmup()
+
+
+def server_options() -> Dict[str, Any]:
+    threads = max(1, Config.SERVER_THREADS)
+    return {
+        "bind": Config.SERVER_BIND,
+        "workers": max(1, Config.SERVER_WORKERS),
+        "threads": threads,
+        "worker_class": "gthread" if threads > 1 else "sync",
+        "timeout": Config.SERVER_TIMEOUT,
+        "graceful_timeout": Config.SERVER_TIMEOUT,
+        "keepalive": 5,
+        "max_requests": Config.SERVER_MAX_REQUESTS,
+        "max_requests_jitter": Config.SERVER_MAX_REQUESTS // 10,
+        # Build the app (and create the schema) once in the master, then fork.
+        "preload_app": True,
+        "post_fork": post_fork,
+    }
+
+
+class ProductionServer(BaseApplication):
+    """Preforking gunicorn server for the Flask app, configured from Config."""
+
+    def __init__(self, options: Dict[str, Any]) -> None:
+        self.options = options
+        super().__init__()
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from . import create_app
+        from .bootstrap import bootstrap_database
+        from .latest import LATEST, SharedLatestFile
+
+        if self.options["workers"] > 1 and LATEST.shared is None:
+            # Otherwise /latest would depend on which worker took the request.
+            LATEST.shared = SharedLatestFile(LATEST_SHARED_DEFAULT)
+        # Bootstrap once here in the master; forked workers inherit the result.
+        # If the database is down the server starts anyway: each worker warms
+        # up in the background and ensure_schema bootstraps on first use.
+        try:
+            bootstrap_database()
+        except Exception:
+            log.warning("Database bootstrap failed; workers will retry", exc_info=True)
+        return create_app(warm_up=False)
+
+
+def main() -> None:
+    options = server_options()
+    pool_capacity = Config.DB_POOL_SIZE + Config.DB_MAX_OVERFLOW
+    if pool_capacity < options["threads"]:
+        log.warning(
+            "DB pool (%s connections) is smaller than SERVER_THREADS=%s; "
+            "requests will wait on the pool",
+            pool_capacity,
+            options["threads"],
+        )
+    log.info(
+        "Starting %s workers x %s threads on %s",
+        options["workers"],
+        options["threads"],
+        options["bind"],
+    )
+    ProductionServer(options).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import atexit
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.orm import Session
+
+from backend.log import log
+
+from .config import Config
+from .Database.db import SessionLocal
+from .Database.rows import Row
+from .local_queue import LocalQueue, decode_row, row_entries
+from .replication import commit_rows
+
+
+def is_unavailable_error(exc: BaseException) -> bool:
+    """True for errors meaning the database could not be reached at all."""
+
+    if isinstance(exc, (OperationalError, InterfaceError)):
+        return True
+    return isinstance(exc, DBAPIError) and exc.connection_invalidated
+
+
+class IngestSpool:
+    """On-disk write-ahead spool used while the primary database is unreachable.
+
+    Readings keep the time captured at ingest, so replaying them later does
+    not shift the series. A drain worker probes the primary and replays the
+    spool in batches once it is reachable again.
+    """
+
+    def __init__(
+        self, enabled: bool, path: str, batch_size: int, retry_interval: float
+    ) -> None:
+        self.enabled = enabled
+        self.queue = LocalQueue(path)
+        self.batch_size = batch_size
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        # Cleared in preforked workers so only the master drains the queue file.
+        self.drain_locally = True
+        self._unavailable_until = 0.0
+        self.spooled_total = 0
+        self.drained_total = 0
+        self.last_drain_rate = 0.0
+
+    def primary_available(self) -> bool:
+        return time.monotonic() >= self._unavailable_until
+
+    def mark_unavailable(self) -> None:
+        self._unavailable_until = time.monotonic() + self.retry_interval
+
+    def spool(self, rows: Iterable[Row]) -> int:
+        count = self.queue.append(row_entries(rows))
+        self.spooled_total += count
+        self._ensure_worker()
+        return count
+
+    def commit_or_spool(self, session: Session, rows: List[Row]) -> bool:
+        """Commit rows to the databases, spooling them if the primary is down.
+
+        Returns True when the rows were spooled instead of committed. A
+        failing secondary raises SecondaryWriteError, which never spools.
+        """
+
+        if self.enabled and not self.primary_available():
+            session.rollback()
+            self.spool(rows)
+            return True
+        try:
+            commit_rows(session, rows)
+        except Exception as exc:
+            if not (self.enabled and is_unavailable_error(exc)):
+                raise
+            log.warning("Primary database unavailable; spooling %s rows", len(rows))
+            self.mark_unavailable()
+            self.spool(rows)
+            return True
+        return False
+
+    def drain_once(self) -> int:
+        """Replay one batch from the spool; return the number of rows written."""
+
+        entries = self.queue.peek(self.batch_size)
+        if not entries:
+            return 0
+        started = time.monotonic()
+        rows = [decode_row(kind, payload) for _, _, kind, payload in entries]
+        with SessionLocal() as session:
+            commit_rows(session, rows)
+        self.queue.delete_through(entries[-1][0])
+        elapsed = time.monotonic() - started
+        self.drained_total += len(rows)
+        self.last_drain_rate = round(len(rows) / elapsed, 1) if elapsed > 0 else 0.0
+        return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        pending, oldest = self.queue.stats()
+        return {
+            "pending": pending,
+            "oldest_age_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+            "primary_available": self.primary_available(),
+            "spooled_total": self.spooled_total,
+            "drained_total": self.drained_total,
+            "drain_rows_per_second": self.last_drain_rate,
+        }
+
+    def start(self) -> None:
+        """Start draining readings spooled by a previous run."""
+
+        if self.enabled:
+            self._ensure_worker()
+
+    def close(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            thread.join(timeout=10)
+
+    def _ensure_worker(self) -> None:
+        if not self.drain_locally:
+            return
+        pid = os.getpid()
+        if self._thread is not None and self._thread.is_alive() and self._pid == pid:
+            return
+        with self._lock:
+            if (
+                self._thread is not None
+                and self._thread.is_alive()
+                and self._pid == pid
+            ):
+                return
+            self._stop.clear()
+            self._pid = pid
+            self._thread = threading.Thread(
+                target=self._run, name="ingest-spool", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            if not self.primary_available():
+                self._stop.wait(self._unavailable_until - time.monotonic())
+                continue
+            try:
+                drained = self.drain_once()
+            except Exception as exc:
+                if is_unavailable_error(exc):
+                    self.mark_unavailable()
+                log.warning("Spool drain failed; retrying later", exc_info=True)
+                self._stop.wait(self.retry_interval)
+                continue
+            if drained:
+                log.info("Drained %s spooled rows into the primary database", drained)
+            if drained < self.batch_size:
+                self._wake.wait(self.retry_interval)
+                self._wake.clear()
+
+
+SPOOL = IngestSpool(
+    Config.SPOOL_ENABLED,
+    Config.SPOOL_PATH,
+    Config.SPOOL_BATCH_SIZE,
+    Config.SPOOL_RETRY_INTERVAL,
+)
+atexit.register(SPOOL.close)
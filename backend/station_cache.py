@@ -0,0 +1,110 @@
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from backend.log import log
+
+from .config import Config
+from .Database.db import SessionLocal
+from .Database.models import StationMapping
+
+
+class StationMappingCache:
+    """Process-wide copy of station_mappings indexed by code and by city."""
+
+    def __init__(self, ttl: float, miss_ttl: float) -> None:
+        self.ttl = ttl
+        # A miss may mean another worker process just added the mapping.
+        self.miss_ttl = miss_ttl
+        self._lock = threading.Lock()
+        self._city_by_code: Dict[str, str] = {}
+        self._code_by_city: Dict[str, str] = {}
+        self._loaded_at: Optional[float] = None
+
+    def load(self, session: Optional[Session] = None) -> None:
+        """Reload both indexes from the primary database."""
+
+        if session is None:
+            with SessionLocal() as own_session:
+                rows = self._fetch(own_session)
+        else:
+            rows = self._fetch(session)
+
+        city_by_code: Dict[str, str] = {}
+        code_by_city: Dict[str, str] = {}
+        for code, city in rows:
+            city_by_code[code] = city
+            # Keep the oldest mapping per city, matching lookups by city.
+            code_by_city.setdefault(city, code)
+
+        with self._lock:
+            self._city_by_code = city_by_code
+            self._code_by_city = code_by_city
+            self._loaded_at = time.monotonic()
+        log.debug("Station mapping cache loaded with %s entries", len(city_by_code))
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded_at = None
+
+    def city_for_code(
+        self, station_code: str, session: Optional[Session] = None
+    ) -> Optional[str]:
+        self._ensure_fresh(session)
+        city = self._city_by_code.get(station_code)
+        if city is None and self._refresh_on_miss(session):
+            city = self._city_by_code.get(station_code)
+        return city
+
+    def code_for_city(
+        self, city: str, session: Optional[Session] = None
+    ) -> Optional[str]:
+        self._ensure_fresh(session)
+        code = self._code_by_city.get(city)
+        if code is None and self._refresh_on_miss(session):
+            code = self._code_by_city.get(city)
+        return code
+
+    def _is_stale(self) -> bool:
+        loaded_at = self._loaded_at
+        return loaded_at is None or time.monotonic() - loaded_at >= self.ttl
+
+    def _refresh_on_miss(self, session: Optional[Session]) -> bool:
+        loaded_at = self._loaded_at
+        if loaded_at is not None and time.monotonic() - loaded_at < self.miss_ttl:
+            return False
+        self._loaded_at = None
+        self._ensure_fresh(session)
+        return True
+
+    def _ensure_fresh(self, session: Optional[Session]) -> None:
+        if not self._is_stale():
+            return
+        try:
+            self.load(session)
+        except Exception:
+            if session is not None:
+                session.rollback()
+            if not self._city_by_code:
+                raise
+            # Serve the previous snapshot rather than failing the request, and
+            # wait another TTL before retrying so an outage does not add a
+            # connect timeout to every request.
+            self._loaded_at = time.monotonic()
+            log.warning("Station mapping cache refresh failed", exc_info=True)
+
+    @staticmethod
+    def _fetch(session: Session):
+        return session.execute(
+            select(StationMapping.station_code, StationMapping.city).order_by(
+                StationMapping.id
+            )
+        ).all()
+
+
+STATION_CACHE = StationMappingCache(
+    Config.STATION_CACHE_TTL, Config.STATION_CACHE_MISS_TTL
+)
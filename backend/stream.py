@@ -0,0 +1,152 @@
+import itertools
+import json
+import queue
+import threading
+from typing import Callable, List, Optional, Tuple
+
+from flask import Blueprint, jsonify
+
+from backend.log import log
+
+from .config import Config
+from .helpers import require_api_key
+from .latest import Reading
+from .metrics import STREAM_DROPPED
+
+bp = Blueprint("stream", __name__)
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+KEEPALIVE = b": keepalive\n\n"
+DROPPED = b'event: dropped\ndata: {"error": "slow_consumer"}\n\n'
+
+
+class Subscriber:
+    """One open /stream connection and its bounded queue of encoded events."""
+
+    def __init__(
+        self,
+        city: Optional[str],
+        station: Optional[str],
+        max_queue: int,
+        notify: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.city = city
+        self.station = station
+        self.events: "queue.Queue[bytes]" = queue.Queue(max_queue)
+        # Lets an event-loop consumer wake up without a thread blocked in get().
+        self.notify = notify
+        self.dropped = False
+
+    def wants(self, reading: Reading) -> bool:
+        return (self.city is None or reading["city"] == self.city) and (
+            self.station is None or reading["station_code"] == self.station
+        )
+
+    def offer(self, event: bytes) -> bool:
+        """Queue ``event``; False when the subscriber is too far behind."""
+
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            self.dropped = True
+        if self.notify is not None:
+            self.notify()
+        return not self.dropped
+
+
+class StreamHub:
+    """In-process pub/sub of committed readings for Server-Sent Events.
+
+    Each reading is encoded once and the same bytes are queued for every
+    matching subscriber. Publishing never blocks: a subscriber whose queue
+    is full is dropped and told so, and its client reconnects. Only
+    readings ingested by this process are published, once they are
+    committed (or spooled), so subscribers must connect to the process
+    that ingests: the single-process ASGI app.
+    """
+
+    def __init__(self, max_subscribers: int, max_queue: int) -> None:
+        self.max_subscribers = max_subscribers
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        # Replaced, never mutated, so publish() iterates without the lock.
+        self._subscribers: Tuple[Subscriber, ...] = ()
+        self._ids = itertools.count(1)
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(
+        self,
+        city: Optional[str] = None,
+        station: Optional[str] = None,
+        notify: Optional[Callable[[], None]] = None,
+    ) -> Optional[Subscriber]:
+        """Register a subscriber, or return None when the hub is full."""
+
+        subscriber = Subscriber(city, station, self.max_queue, notify)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            self._subscribers += (subscriber,)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        with self._lock:
+            self._subscribers = tuple(
+                other for other in self._subscribers if other is not subscriber
+            )
+
+    def publish(self, readings: List[Reading]) -> None:
+        subscribers = self._subscribers
+        if not subscribers:
+            return
+        slow: List[Subscriber] = []
+        for reading in readings:
+            event = encode_event(next(self._ids), reading)
+            for subscriber in subscribers:
+                if (
+                    not subscriber.dropped
+                    and subscriber.wants(reading)
+                    and not subscriber.offer(event)
+                ):
+                    slow.append(subscriber)
+        for subscriber in slow:
+            STREAM_DROPPED.inc()
+            log.info("Dropping slow /stream subscriber")
+            self.unsubscribe(subscriber)
+
+
+def encode_event(event_id: int, reading: Reading) -> bytes:
+    data = json.dumps(
+        {key: value for key, value in reading.items() if key != "kind"},
+        separators=(",", ":"),
+    )
+    return f"id: {event_id}\nevent: {reading['kind']}\ndata: {data}\n\n".encode()
+
+
+@bp.get("/stream")
+@bp.get("/stream/<string:path_token>")
+def stream(path_token: Optional[str] = None):
+    """Refuse /stream on the Flask app; the ASGI app serves it.
+
+    A preforked Flask worker would hold a thread per subscriber and only
+    see the readings ingested by that worker.
+    """
+
+    auth_err = require_api_key(path_token)
+    if auth_err:
+        return auth_err
+    return (
+        jsonify(
+            {
+                "error": "not_found",
+                "message": "/stream is served by the ASGI app "
+                "(uvicorn backend.asgi:app).",
+            }
+        ),
+        404,
+    )
+
+
+STREAM_HUB = StreamHub(Config.STREAM_MAX_SUBSCRIBERS, Config.STREAM_QUEUE_SIZE)
@@ -0,0 +1,240 @@
+import atexit
+import os
+import threading
+from collections import deque
+from typing import Callable, Deque, List, Optional, Set, Tuple
+
+from backend.log import log
+
+from .config import Config
+from .Database.db import SessionLocal
+from .Database.rows import Row
+from .dedup import DEDUP
+from .metrics import WRITE_BUFFER_DROPPED
+from .replication import SecondaryWriteError, commit_rows
+from .spool import SPOOL, is_unavailable_error
+
+# One accepted packet: its rows and its idempotency key, if any.
+Packet = Tuple[List[Row], Optional[str]]
+
+
+def _is_unreachable(exc: BaseException) -> bool:
+    """True when the primary or the synchronous secondary could not be reached."""
+
+    if isinstance(exc, SecondaryWriteError) and exc.__cause__ is not None:
+        exc = exc.__cause__
+    return is_unavailable_error(exc)
+
+
+class WriteBuffer:
+    """Bounded in-memory queue of reading rows flushed as multi-row INSERTs.
+
+    A packet's idempotency key travels with its rows and is claimed in the
+    transaction that inserts them, so a crash or a failed flush never
+    leaves a claim without its readings. ``on_commit`` is called with the
+    rows of each batch once they are committed or spooled.
+    """
+
+    def __init__(
+        self,
+        enabled: bool,
+        max_rows: int,
+        batch_size: int,
+        flush_interval: float,
+    ) -> None:
+        self.enabled = enabled
+        self.max_rows = max_rows
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._packets: Deque[Packet] = deque()
+        self._size = 0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._stopping = False
+        self._failed = False
+        self.on_commit: Optional[Callable[[List[Row]], None]] = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def submit(self, rows: List[Row], key: Optional[str] = None) -> bool:
+        """Queue a packet's rows for writing; return False when the buffer is full."""
+
+        with self._cond:
+            if self._size + len(rows) > self.max_rows:
+                return False
+            self._packets.append((rows, key))
+            self._size += len(rows)
+            if self._size >= self.batch_size:
+                self._cond.notify()
+        self._ensure_worker()
+        return True
+
+    def flush(self) -> int:
+        """Write everything queued so far; return the number of rows written.
+
+        A batch the database rejects for its content is split in halves until
+        the offending packet is found, and that packet is dropped, so one bad
+        value cannot block the queue. Batches that fail because a database is
+        unreachable are spooled or put back to retry.
+        """
+
+        written = 0
+        with self._flush_lock:
+            while True:
+                batch = self._take(self.batch_size)
+                if not batch:
+                    break
+                if SPOOL.enabled and not SPOOL.primary_available():
+                    rows = self._rows(batch)
+                    SPOOL.spool(rows)
+                    self._committed(rows)
+                    continue
+                parts = [batch]
+                while parts:
+                    part = parts.pop()
+                    rows = self._rows(part)
+                    try:
+                        with SessionLocal() as session:
+                            rows = self._claim(session, part)
+                            if rows:
+                                commit_rows(session, rows)
+                            else:
+                                session.commit()
+                    except Exception as exc:
+                        if SPOOL.enabled and is_unavailable_error(exc):
+                            log.warning(
+                                "Primary unavailable; spooling %s buffered rows",
+                                len(rows),
+                            )
+                            SPOOL.mark_unavailable()
+                            SPOOL.spool(rows)
+                            self._committed(rows)
+                            continue
+                        if _is_unreachable(exc):
+                            log.exception(
+                                "Buffered write of %s rows failed; will retry",
+                                len(rows),
+                            )
+                            self._requeue(
+                                [
+                                    packet
+                                    for piece in (part, *reversed(parts))
+                                    for packet in piece
+                                ]
+                            )
+                            self._failed = True
+                            return written
+                        if len(part) > 1:
+                            middle = len(part) // 2
+                            parts += [part[middle:], part[:middle]]
+                            continue
+                        log.exception(
+                            "Dropping a buffered packet of %s rows the database "
+                            "rejected",
+                            len(rows),
+                        )
+                        WRITE_BUFFER_DROPPED.inc(len(rows))
+                        continue
+                    self._failed = False
+                    written += len(rows)
+                    self._committed(rows)
+        return written
+
+    def close(self) -> None:
+        """Stop the flusher and write whatever is still queued."""
+
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            thread.join()
+        if self._packets:
+            self.flush()
+
+    def _committed(self, rows: List[Row]) -> None:
+        if self.on_commit is None or not rows:
+            return
+        try:
+            self.on_commit(rows)
+        except Exception:
+            log.exception("Write buffer commit callback failed")
+
+    @staticmethod
+    def _rows(batch: List[Packet]) -> List[Row]:
+        return [row for rows, _ in batch for row in rows]
+
+    @staticmethod
+    def _claim(session, batch: List[Packet]) -> List[Row]:
+        """Stage the batch's key claims; return the rows of packets not seen before."""
+
+        keys = [key for _, key in batch if key]
+        stored = DEDUP.claim(session, list(dict.fromkeys(keys))) if keys else set()
+        rows: List[Row] = []
+        claimed: Set[str] = set()
+        for packet_rows, key in batch:
+            if key:
+                if key in stored or key in claimed:
+                    continue
+                claimed.add(key)
+            rows.extend(packet_rows)
+        return rows
+
+    def _take(self, limit: int) -> List[Packet]:
+        """Pop whole packets until at least ``limit`` rows, or the queue, are taken."""
+
+        batch: List[Packet] = []
+        taken = 0
+        with self._cond:
+            while self._packets and taken < limit:
+                packet = self._packets.popleft()
+                batch.append(packet)
+                taken += len(packet[0])
+            self._size -= taken
+        return batch
+
+    def _requeue(self, batch: List[Packet]) -> None:
+        with self._cond:
+            self._packets.extendleft(reversed(batch))
+            self._size += sum(len(rows) for rows, _ in batch)
+
+    def _ensure_worker(self) -> None:
+        pid = os.getpid()
+        if self._thread is not None and self._thread.is_alive() and self._pid == pid:
+            return
+        with self._cond:
+            if (
+                self._thread is not None
+                and self._thread.is_alive()
+                and self._pid == pid
+            ):
+                return
+            self._stopping = False
+            self._pid = pid
+            self._thread = threading.Thread(
+                target=self._run, name="write-buffer", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                backlog_ready = self._size >= self.batch_size and not self._failed
+                if not self._stopping and not backlog_ready:
+                    self._cond.wait(self.flush_interval)
+                stopping = self._stopping
+            self.flush()
+            if stopping:
+                return
+
+
+WRITE_BUFFER = WriteBuffer(
+    Config.WRITE_BUFFER_ENABLED,
+    Config.WRITE_BUFFER_MAX_ROWS,
+    Config.WRITE_BUFFER_BATCH_SIZE,
+    Config.WRITE_BUFFER_FLUSH_INTERVAL,
+)
+atexit.register(WRITE_BUFFER.close)
@@ -0,0 +1,106 @@
+import argparse
+import json
+import math
+import platform
+import timeit
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from backend.aqi import AQI_FIELDS, MIN_COVERAGE, POLLUTANTS, compute_aqi
+
+
+def legacy_aqi(hourly: Dict[str, List[List[Optional[float]]]]) -> List[List[float]]:
+    """Per-row loop in the style of the external scripts, kept as the baseline."""
+
+    cities = len(hourly[AQI_FIELDS[0]])
+    hours = len(hourly[AQI_FIELDS[0]][0])
+    result = []
+    for city in range(cities):
+        row = []
+        for hour in range(hours):
+            best = math.nan
+            for pollutant in POLLUTANTS:
+                start = max(0, hour - pollutant.window + 1)
+                window = [
+                    value
+                    for value in hourly[pollutant.field][city][start : hour + 1]
+                    if value is not None
+                ]
+                if len(window) < math.ceil(pollutant.window * MIN_COVERAGE):
+                    continue
+                factor = 10**pollutant.decimals
+                value = sum(window) / len(window) * pollutant.scale
+                value = math.floor(value * factor + 1e-6) / factor
+                index = 500.0
+                for c_low, c_high, i_low, i_high in pollutant.bands:
+                    if value <= c_high:
+                        index = math.floor(
+                            (i_high - i_low) / (c_high - c_low) * (value - c_low)
+                            + i_low
+                            + 0.5
+                        )
+                        break
+                if not best >= index:
+                    best = index
+            row.append(best)
+        result.append(row)
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare a per-row AQI loop with the vectorized compute_aqi."
+    )
+    parser.add_argument("--cities", type=int, default=16)
+    parser.add_argument("--hours", type=int, default=24 * 31)
+    parser.add_argument("--missing", type=float, default=0.05)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    shape = (args.cities, args.hours)
+    hourly = {}
+    for pollutant in POLLUTANTS:
+        # Spread concentrations over the whole breakpoint table.
+        top = pollutant.bands[-1][1] / pollutant.scale
+        values = rng.uniform(0, top, shape)
+        values[rng.random(shape) < args.missing] = np.nan
+        hourly[pollutant.field] = values
+    as_lists = {
+        field: [[None if v != v else v for v in row] for row in values.tolist()]
+        for field, values in hourly.items()
+    }
+
+    expected = np.array(legacy_aqi(as_lists))
+    aqi, _, _ = compute_aqi(hourly)
+    mismatches = int(
+        np.sum(~((aqi == expected) | (np.isnan(aqi) & np.isnan(expected))))
+    )
+
+    legacy = min(
+        timeit.repeat(lambda: legacy_aqi(as_lists), number=1, repeat=args.repeat)
+    )
+    current = min(
+        timeit.repeat(lambda: compute_aqi(hourly), number=1, repeat=args.repeat)
+    )
+    print(
+        json.dumps(
+            {
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "cities": args.cities,
+                "hours": args.hours,
+                "mismatches": mismatches,
+                "legacy_ms": round(legacy * 1e3, 3),
+                "compute_aqi_ms": round(current * 1e3, 3),
+                "speedup": round(legacy / current, 1) if current > 0 else None,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
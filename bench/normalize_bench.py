@@ -0,0 +1,109 @@
+import argparse
+import json
+import platform
+import random
+import timeit
+from typing import Any, Callable, Dict, List, Optional
+
+from backend.helpers import normalize_fields, to_float
+
+from .ingest_bench import gas_payload, meteo_payload
+
+
+def legacy_normalize(data: Dict[str, Any]):
+    """The pipeline normalize_fields replaced, kept here as the baseline."""
+
+    for key in data.keys():
+        if key == "tempinf":
+            data[key] = (to_float(data[key]) - 32) * 5 / 9
+            continue
+        data[key] = to_float(data[key])
+    gas = {
+        "CO": data.get("CO"),
+        "SO2": data.get("SO2"),
+        "NO2": data.get("NO2"),
+        "NO": data.get("NO"),
+        "H2S": data.get("H2S"),
+        "O3": data.get("O3"),
+        "NH3": data.get("NH3"),
+        "PM2_5": data.get("PM2.5"),
+        "PM10": data.get("PM10"),
+        "R": data.get("R"),
+    }
+    meteo = {
+        "P": data.get("WD") or data.get("wd_deg"),
+        "TEMP": data.get("tempinf"),
+        "RH": data.get("humidityin"),
+    }
+    return gas, meteo
+
+
+def form_encoded(payload: Dict[str, Any]) -> Dict[str, str]:
+    """Form posts arrive as strings, which is what most boxes send."""
+
+    return {key: str(value) for key, value in payload.items()}
+
+
+def measure(
+    normalize: Callable[[Dict[str, Any]], Any],
+    payloads: List[Dict[str, Any]],
+    repeat: int,
+) -> float:
+    """Best-of-``repeat`` microseconds per payload, copy cost subtracted."""
+
+    def run() -> None:
+        for payload in payloads:
+            normalize(dict(payload))
+
+    def copy_only() -> None:
+        for payload in payloads:
+            dict(payload)
+
+    best = min(timeit.repeat(run, number=1, repeat=repeat))
+    overhead = min(timeit.repeat(copy_only, number=1, repeat=repeat))
+    return (best - overhead) / len(payloads) * 1e6
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare per-request CPU of payload normalization pipelines."
+    )
+    parser.add_argument("--payloads", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    shapes = {
+        "gas_json": [gas_payload(rng, "A4CF12000001") for _ in range(args.payloads)],
+        "meteo_form": [
+            form_encoded(meteo_payload(rng, "A4CF12000001"))
+            for _ in range(args.payloads)
+        ],
+        "mixed_form": [
+            form_encoded(
+                {
+                    **meteo_payload(rng, "A4CF12000001"),
+                    **gas_payload(rng, "A4CF12000001"),
+                }
+            )
+            for _ in range(args.payloads)
+        ],
+    }
+
+    results: Dict[str, Any] = {}
+    for name, payloads in shapes.items():
+        legacy = measure(legacy_normalize, payloads, args.repeat)
+        current = measure(normalize_fields, payloads, args.repeat)
+        results[name] = {
+            "legacy_us": round(legacy, 3),
+            "normalize_fields_us": round(current, 3),
+            "speedup": round(legacy / current, 2) if current > 0 else None,
+        }
+    print(
+        json.dumps({"python": platform.python_version(), "results": results}, indent=2)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import time
+
+import pytest
+
+from backend import aggregation
+
+from conftest import HEADERS
+
+
+@pytest.fixture
+def series(client, station):
+    now = int(time.time())
+    readings = [
+        {"station_code": station, "CO": float(i % 7), "timestamp": now - 600 + i}
+        for i in range(20)
+    ]
+    response = client.post("/ingest/batch", json=readings, headers=HEADERS)
+    assert response.get_json()["accepted"] == 20
+    return station, now - 3600
+
+
+def _lttb(client, **args):
+    query = {"mode": "lttb", "fields": "CO", "points": "5", **args}
+    return client.get("/readings/gas/aggregate", query_string=query, headers=HEADERS)
+
+
+def test_lttb_downsamples_one_station(client, series):
+    station, start = series
+    body = _lttb(client, station_code=station, **{"from": start}).get_json()
+    assert body["source_points"] == 20
+    assert len(body["points"]) == 5
+
+
+def test_lttb_requires_a_station(client, series):
+    _, start = series
+    response = _lttb(client, **{"from": start})
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "missing_station_code"
+
+
+def test_lttb_refuses_oversized_ranges(client, series, monkeypatch):
+    station, start = series
+    monkeypatch.setattr(aggregation, "MAX_LTTB_SOURCE_ROWS", 19)
+    response = _lttb(client, station_code=station, **{"from": start})
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "too_many_points"
+
+    monkeypatch.setattr(aggregation, "MAX_LTTB_SOURCE_ROWS", 20)
+    assert _lttb(client, station_code=station, **{"from": start}).status_code == 200
@@ -0,0 +1,71 @@
+import time
+
+import pytest
+
+from backend.anomaly import ANOMALY, AnomalyDetector
+from backend.dedup import DEDUP
+
+from conftest import HEADERS
+
+
+def _detector(**overrides) -> AnomalyDetector:
+    options = dict(
+        enabled=True,
+        action="quarantine",
+        threshold=6.0,
+        alpha=0.05,
+        warmup=10,
+        min_spread=0.05,
+    )
+    options.update(overrides)
+    return AnomalyDetector(**options)
+
+
+def test_zero_baseline_uses_the_field_floor():
+    detector = _detector()
+    for _ in range(50):
+        assert detector.inspect("gas", "S1", {"CO": 0.0, "NO2": 0.0}) == []
+
+    fields = {"CO": 0.3, "NO2": 0.01}
+    assert detector.inspect("gas", "S1", fields) == []
+    assert fields == {"CO": 0.3, "NO2": 0.01}
+
+    fields = {"CO": 25.0, "NO2": 0.01}
+    assert detector.inspect("gas", "S1", fields) == ["CO"]
+    assert fields == {"CO": None, "NO2": 0.01}
+
+
+def test_zero_baseline_without_a_floor_flags_small_steps():
+    detector = _detector(field_min_spread={})
+    for _ in range(50):
+        detector.inspect("gas", "S1", {"CO": 0.0})
+    assert detector.inspect("gas", "S1", {"CO": 0.3}) == ["CO"]
+
+
+def test_level_shift_is_followed():
+    detector = _detector(action="flag")
+    for _ in range(50):
+        detector.inspect("meteo", "S1", {"TEMP": 20.0})
+    flagged = [detector.inspect("meteo", "S1", {"TEMP": 35.0}) for _ in range(60)]
+    assert flagged[0] == ["TEMP"]
+    assert flagged[-1] == []
+
+
+@pytest.fixture
+def screening(monkeypatch):
+    monkeypatch.setattr(ANOMALY, "enabled", True)
+    monkeypatch.setattr(DEDUP, "enabled", True)
+    return ANOMALY
+
+
+def test_duplicates_do_not_train_the_detector(client, station, screening):
+    payload = {"station_code": station, "CO": 1.5, "timestamp": int(time.time())}
+    headers = dict(HEADERS, **{"Idempotency-Key": f"{station}-1"})
+
+    first = client.post("/ingest", json=payload, headers=headers).get_json()
+    retry = client.post("/ingest", json=payload, headers=headers).get_json()
+
+    assert first["gas_upserted"] == 1
+    assert retry.get("duplicate") is True
+    assert screening._state[(station, "CO")][0] == 1
+
@@ -0,0 +1,27 @@
+import backend
+from backend.Database import db
+from backend.spool import SPOOL
+
+from conftest import HEADERS
+
+
+def test_bootstrap_retries_are_throttled(client, monkeypatch):
+    calls = []
+
+    def unreachable():
+        calls.append(1)
+        raise ConnectionError("database is down")
+
+    monkeypatch.setattr(db, "_schema_ready", False)
+    monkeypatch.setattr(backend, "init_db", unreachable)
+    monkeypatch.setattr(SPOOL, "enabled", False)
+    monkeypatch.setattr(SPOOL, "_unavailable_until", 0.0)
+
+    for _ in range(3):
+        response = client.get("/readings/gas", headers=HEADERS)
+        assert response.status_code == 503
+    assert len(calls) == 1
+
+    monkeypatch.setattr(SPOOL, "_unavailable_until", 0.0)
+    client.get("/readings/gas", headers=HEADERS)
+    assert len(calls) == 2
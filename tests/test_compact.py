@@ -0,0 +1,26 @@
+import math
+
+from backend.compact import decode_single, encode
+from backend.helpers import normalize_fields
+
+
+def test_values_follow_the_json_rules():
+    fields = {"CO": -1.0, "PM10": -5.0, "SO2": math.inf, "NO2": 0.25, "TEMP": -5.0}
+
+    reading = decode_single(encode("S1", fields))
+    gas, _ = normalize_fields({**fields, "SO2": "Infinity"})
+
+    assert reading.gas["CO"] is None
+    assert reading.gas["PM10"] == 0
+    assert reading.gas["SO2"] is None
+    assert reading.gas["NO2"] == 0.25
+    assert {name: reading.gas[name] for name in ("CO", "PM10", "SO2")} == {
+        name: gas[name] for name in ("CO", "PM10", "SO2")
+    }
+
+
+def test_temperature_keeps_negative_celsius():
+    reading = decode_single(encode("S1", {"TEMP": -5.0, "RH": math.nan}))
+
+    assert reading.meteo["TEMP"] == -5.0
+    assert reading.meteo["RH"] is None
@@ -0,0 +1,29 @@
+from datetime import timedelta, timezone
+
+import pytest
+
+from backend.Database.models import _kyiv_now
+from backend.helpers import KYIV_TZ
+from backend.ingestion import IngestRejected, take_reading_time
+
+
+def _dateutc(offset: timedelta) -> str:
+    now = _kyiv_now().replace(tzinfo=KYIV_TZ) + offset
+    return now.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def test_skewed_dateutc_falls_back_to_server_time():
+    assert take_reading_time({"dateutc": _dateutc(timedelta(hours=1))}) is None
+    assert take_reading_time({"dateutc": "not a date"}) is None
+
+
+def test_dateutc_within_the_window_is_kept():
+    assert take_reading_time({"dateutc": _dateutc(timedelta(minutes=-1))})
+
+
+def test_explicit_skewed_time_is_still_rejected():
+    future = _dateutc(timedelta(hours=1)).replace(" ", "T") + "Z"
+
+    with pytest.raises(IngestRejected) as excinfo:
+        take_reading_time({"time": future, "dateutc": future})
+    assert excinfo.value.error == "time_out_of_range"
@@ -0,0 +1,58 @@
+from backend import ingestion
+from backend.config import Config
+from backend.ratelimit import RateLimiter
+
+from conftest import HEADERS
+
+
+def _limiter(**overrides) -> RateLimiter:
+    options = dict(
+        enabled=True,
+        key_rate=Config.RATE_LIMIT_KEY_RATE,
+        key_burst=Config.RATE_LIMIT_KEY_BURST,
+        station_rate=1.0,
+        station_burst=2.0,
+    )
+    options.update(overrides)
+    return RateLimiter(**options)
+
+
+def test_shared_api_key_is_not_a_global_cap_by_default():
+    limiter = _limiter()
+    assert [prefix for prefix, _, _ in limiter.limits] == ["station"]
+    for index in range(500):
+        assert limiter.retry_after("shared-key", f"BOX{index}") is None
+
+
+def test_station_bucket_stops_one_box_only():
+    limiter = _limiter()
+    assert limiter.retry_after("shared-key", "LOOPING") is None
+    assert limiter.retry_after("shared-key", "LOOPING") is None
+    assert limiter.retry_after("shared-key", "LOOPING") == 1
+    assert limiter.retry_after("shared-key", "QUIET") is None
+
+
+def test_key_bucket_is_a_ceiling_when_configured():
+    limiter = _limiter(key_rate=1.0, key_burst=3.0)
+    waits = [limiter.retry_after("shared-key", f"BOX{index}") for index in range(4)]
+    assert waits == [None, None, None, 1]
+
+
+def test_batches_take_a_token_per_station():
+    limiter = _limiter()
+    assert limiter.retry_after_batch("shared-key", ["A", "B", "A"]) is None
+    assert limiter.retry_after_batch("shared-key", ["A"]) is None
+    assert limiter.retry_after_batch("shared-key", ["B", "A"]) == 1
+    assert limiter.retry_after_batch("shared-key", ["C"]) is None
+
+
+def test_batch_ingest_is_limited_per_station(client, station, monkeypatch):
+    monkeypatch.setattr(ingestion, "RATE_LIMITER", _limiter(station_burst=1.0))
+    readings = [{"station_code": station, "CO": 1.0}] * 3
+
+    first = client.post("/ingest/batch", json=readings, headers=HEADERS)
+    second = client.post("/ingest/batch", json=readings, headers=HEADERS)
+
+    assert first.status_code == 200
+    assert second.status_code == 429
+    assert second.headers["Retry-After"] == "1"
@@ -0,0 +1,81 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from backend import replication
+from backend.Database.db import SessionLocal
+from backend.Database.models import GasReading
+from backend.Database.rows import build_row
+from backend.metrics import REPLICATION_ENQUEUE_FAILED
+from backend.replication import SecondaryWriteError
+from backend.spool import SPOOL
+
+from conftest import HEADERS
+
+
+class _Unreachable:
+    """A session whose database went away."""
+
+    def execute(self, *args, **kwargs):
+        raise OperationalError("INSERT", {}, ConnectionError("server has gone away"))
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def spooled(monkeypatch):
+    rows = []
+    monkeypatch.setattr(SPOOL, "enabled", True)
+    monkeypatch.setattr(SPOOL, "_unavailable_until", 0.0)
+    monkeypatch.setattr(SPOOL, "spool", rows.extend)
+    return rows
+
+
+def _rows():
+    return [(GasReading, build_row("REPLICA-1", "Irpin", {"CO": 1.0}))]
+
+
+def test_secondary_outage_is_not_spooled(app, monkeypatch, spooled):
+    monkeypatch.setattr(replication, "open_secondary_session", _Unreachable)
+
+    with SessionLocal() as session, pytest.raises(SecondaryWriteError):
+        SPOOL.commit_or_spool(session, _rows())
+
+    assert spooled == []
+    assert SPOOL.primary_available()
+
+
+def test_primary_outage_is_spooled(app, monkeypatch, spooled):
+    monkeypatch.setattr(replication, "open_secondary_session", lambda: None)
+
+    assert SPOOL.commit_or_spool(_Unreachable(), _rows()) is True
+
+    assert len(spooled) == 1
+    assert not SPOOL.primary_available()
+
+
+class _BrokenQueue:
+    def append(self, entries):
+        raise OSError("disk full")
+
+
+def test_enqueue_failure_after_commit_is_not_an_ingest_error(
+    client, station, monkeypatch
+):
+    monkeypatch.setattr(replication.REPLICATOR, "enabled", True)
+    monkeypatch.setattr(replication.REPLICATOR, "queue", _BrokenQueue())
+    failed = REPLICATION_ENQUEUE_FAILED.labels().value
+
+    response = client.post(
+        "/ingest", json={"station_code": station, "CO": 1.0}, headers=HEADERS
+    )
+
+    assert response.status_code == 200
+    assert response.get_json()["gas_upserted"] == 1
+    assert REPLICATION_ENQUEUE_FAILED.labels().value == failed + 1
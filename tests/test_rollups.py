@@ -0,0 +1,85 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func, insert, select
+
+from backend import rollups
+from backend.Database.db import SessionLocal
+from backend.Database.models import GasReading, ReadingRollup, _kyiv_now
+
+
+@pytest.fixture
+def clock(app, monkeypatch):
+    """Kyiv time as seen by the rollups, moved forward by the test."""
+
+    now = [_kyiv_now()]
+    monkeypatch.setattr(rollups, "_kyiv_now", lambda: now[0])
+    rollups.reset_rollups()
+
+    def advance(seconds: float) -> None:
+        now[0] += timedelta(seconds=seconds)
+
+    return advance
+
+
+def _insert(station: str, value: float, row_id=None) -> None:
+    row = {"station_code": station, "city": "Irpin", "time": _kyiv_now(), "CO": value}
+    if row_id is not None:
+        row["id"] = row_id
+    with SessionLocal() as session:
+        session.execute(insert(GasReading), [row])
+        session.commit()
+
+
+def _next_id() -> int:
+    with SessionLocal() as session:
+        return (session.scalar(select(func.max(GasReading.id))) or 0) + 1
+
+
+def _rolled_up(station: str):
+    with SessionLocal() as session:
+        return session.execute(
+            select(ReadingRollup.samples, ReadingRollup.value_sum).where(
+                ReadingRollup.kind == "gas",
+                ReadingRollup.period == "hour",
+                ReadingRollup.station_code == station,
+                ReadingRollup.field == "CO",
+            )
+        ).one_or_none()
+
+
+def test_rows_committed_late_below_the_high_water_mark_are_counted(clock):
+    # Id n is handed to a transaction that commits after id n + 1 does.
+    late_id = _next_id()
+    _insert("ROLLUP-LATE", 2.0, row_id=late_id + 1)
+
+    assert rollups.run_rollups(batch_size=10, lag=30)["gas"] == 0
+    clock(10)
+    _insert("ROLLUP-LATE", 1.0, row_id=late_id)
+    assert rollups.run_rollups(batch_size=10, lag=30)["gas"] == 0
+
+    clock(30)
+    rollups.run_rollups(batch_size=10, lag=30)
+    samples, total = _rolled_up("ROLLUP-LATE")
+    assert (samples, float(total)) == (2, 3.0)
+
+
+def test_catch_up_folds_a_backlog_in_batches(clock):
+    for value in range(25):
+        _insert("ROLLUP-BACKLOG", float(value))
+
+    rollups.run_rollups(batch_size=7, lag=30)
+    assert _rolled_up("ROLLUP-BACKLOG") is None
+
+    clock(30)
+    rollups.run_rollups(batch_size=7, lag=30)
+    samples, total = _rolled_up("ROLLUP-BACKLOG")
+    assert (samples, float(total)) == (25, 300.0)
+
+    _insert("ROLLUP-BACKLOG", 100.0)
+    clock(30)
+    rollups.run_rollups(batch_size=7, lag=30)
+    clock(30)
+    rollups.run_rollups(batch_size=7, lag=30)
+    samples, total = _rolled_up("ROLLUP-BACKLOG")
+    assert (samples, float(total)) == (26, 400.0)
@@ -0,0 +1,87 @@
+import json
+import time
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+
+from backend import asgi, ingestion
+from backend.Database.db import SessionLocal
+from backend.Database.models import GasReading
+
+from conftest import HEADERS, call_asgi
+
+
+def _asgi_handler(method: str, path: str):
+    for route_method, pattern, handler in asgi.ROUTES:
+        if route_method == method and pattern.fullmatch(path):
+            return handler
+    return None
+
+
+def test_asgi_batch_route_is_not_taken_for_a_path_token():
+    assert _asgi_handler("POST", "/ingest/batch") is asgi.ingest_batch
+    assert _asgi_handler("POST", "/ingest/batch/token") is asgi.ingest_batch
+    assert _asgi_handler("POST", "/ingest/token") is asgi.ingest
+    assert _asgi_handler("POST", "/ingest/token/Irpin") is asgi.ingest
+
+
+def test_flask_routes_batch_to_the_batch_view(app):
+    adapter = app.url_map.bind("")
+    assert adapter.match("/ingest/batch", method="POST")[0] == "ingest.ingest_batch"
+    assert adapter.match("/ingest/token", method="POST")[0] == "ingest.ingest"
+
+
+def test_asgi_batch_ingest_writes_rows(station):
+    now = int(time.time())
+    readings = [
+        {"station_code": station, "CO": 1.5, "timestamp": now - 120},
+        {"station_code": station, "CO": 2.5, "timestamp": now - 60},
+        {"station_code": "UNMAPPED", "CO": 3.5, "timestamp": now},
+    ]
+
+    status, body = call_asgi("POST", "/ingest/batch", readings)
+
+    result = json.loads(body)
+    assert status == 200
+    assert (result["accepted"], result["rejected"]) == (2, 1)
+    with SessionLocal() as session:
+        count = session.scalar(
+            select(func.count())
+            .select_from(GasReading)
+            .where(GasReading.station_code == station)
+        )
+    assert count == 2
+
+
+def test_asgi_batch_requires_api_key():
+    status, _ = call_asgi("POST", "/ingest/batch", [], {"X-API-Key": "wrong"})
+    assert status == 401
+
+
+def test_asgi_serves_metrics():
+    status, body = call_asgi("GET", "/metrics", headers=HEADERS)
+    assert status == 200
+    assert b"ingest_outcomes_total" in body
+
+
+def test_batch_reports_a_failed_lookup_as_json(client, monkeypatch):
+    def unreachable(session, data, station):
+        raise OperationalError("SELECT", {}, ConnectionError("server has gone away"))
+
+    monkeypatch.setattr(ingestion, "resolve_city", unreachable)
+    readings = [{"station_code": "COLDCACHE", "CO": 1.5}]
+
+    response = client.post("/ingest/batch", json=readings, headers=HEADERS)
+    assert response.status_code == 500
+    assert response.get_json() == {"error": "db_write_failed"}
+
+    status, body = call_asgi("POST", "/ingest/batch", readings)
+    assert (status, json.loads(body)) == (500, {"error": "db_write_failed"})
+
+
+def test_asgi_accepts_batches_over_a_mebibyte():
+    body = {"readings": [], "padding": "x" * (3 << 19)}
+
+    status, response = call_asgi("POST", "/ingest/batch", body)
+
+    assert status == 200, response
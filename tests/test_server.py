@@ -0,0 +1,24 @@
+from flask import Flask
+
+from backend import bootstrap, server
+from backend.latest import LATEST
+
+
+def test_load_survives_database_outage(monkeypatch):
+    def unreachable():
+        raise ConnectionError("database is down")
+
+    monkeypatch.setattr(bootstrap, "bootstrap_database", unreachable)
+    options = {**server.server_options(), "workers": 1}
+
+    assert isinstance(server.ProductionServer(options).load(), Flask)
+
+
+def test_several_workers_share_the_latest_store(app, monkeypatch):
+    monkeypatch.setattr(LATEST, "shared", None)
+    options = {**server.server_options(), "workers": 2}
+
+    server.ProductionServer(options).load()
+
+    assert LATEST.shared is not None
+    assert LATEST.shared.path == server.LATEST_SHARED_DEFAULT
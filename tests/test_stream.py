@@ -0,0 +1,55 @@
+import time
+
+import pytest
+
+from backend.stream import STREAM_HUB
+
+from conftest import HEADERS, call_asgi
+
+
+@pytest.fixture
+def subscriber():
+    subscriber = STREAM_HUB.subscribe()
+    yield subscriber
+    STREAM_HUB.unsubscribe(subscriber)
+
+
+def _ingest(client, station: str, value: float) -> None:
+    payload = {"station_code": station, "CO": value, "timestamp": int(time.time())}
+    response = client.post("/ingest", json=payload, headers=HEADERS)
+    assert response.status_code == 200
+
+
+def _events_for(subscriber, station: str):
+    events = []
+    while not subscriber.events.empty():
+        event = subscriber.events.get_nowait()
+        if station.encode() in event:
+            events.append(event)
+    return events
+
+
+def test_buffered_rows_are_published_after_the_flush(
+    client, station, buffer, subscriber
+):
+    _ingest(client, station, 1.0)
+    assert _events_for(subscriber, station) == []
+
+    assert buffer.flush() == 1
+    assert len(_events_for(subscriber, station)) == 1
+
+
+def test_direct_writes_are_published_at_once(client, station, subscriber):
+    _ingest(client, station, 1.0)
+    assert len(_events_for(subscriber, station)) == 1
+
+
+def test_flask_refuses_stream(client):
+    response = client.get("/stream", headers=HEADERS)
+    assert response.status_code == 404
+    assert "ASGI" in response.get_json()["message"]
+
+
+def test_asgi_stream_requires_api_key():
+    status, _ = call_asgi("GET", "/stream", headers={"X-API-Key": "wrong"})
+    assert status == 401
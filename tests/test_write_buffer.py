@@ -0,0 +1,121 @@
+import time
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import DataError, OperationalError
+
+from backend import ingestion, write_buffer
+from backend.Database.db import SessionLocal
+from backend.Database.models import GasReading, IngestKey
+from backend.dedup import DEDUP, RecentKeys
+from backend.metrics import WRITE_BUFFER_DROPPED
+from backend.replication import commit_rows
+from backend.write_buffer import WriteBuffer
+
+from conftest import HEADERS, fresh_buffer
+
+
+@pytest.fixture(autouse=True)
+def dedup(monkeypatch):
+    monkeypatch.setattr(DEDUP, "enabled", True)
+
+
+def _restart_process(monkeypatch) -> WriteBuffer:
+    """Lose the in-memory buffer and recent keys, as a worker crash would."""
+
+    monkeypatch.setattr(DEDUP, "recent", RecentKeys(100, 60.0))
+    return fresh_buffer(monkeypatch)
+
+
+def _post(client, station: str, key: str):
+    payload = {"station_code": station, "CO": 1.5, "timestamp": int(time.time())}
+    headers = dict(HEADERS, **{"Idempotency-Key": key})
+    response = client.post("/ingest", json=payload, headers=headers)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def _stored(station: str):
+    with SessionLocal() as session:
+        rows = session.scalar(
+            select(func.count())
+            .select_from(GasReading)
+            .where(GasReading.station_code == station)
+        )
+        keys = session.scalar(select(func.count()).select_from(IngestKey))
+    return rows, keys
+
+
+def test_key_is_claimed_with_the_flushed_rows(client, station, buffer):
+    _, keys_before = _stored(station)
+
+    assert _post(client, station, "claim-1")["gas_upserted"] == 1
+    assert _stored(station) == (0, keys_before)
+
+    assert buffer.flush() == 1
+    assert _stored(station) == (1, keys_before + 1)
+
+
+def test_retry_after_a_lost_buffer_is_stored(client, station, buffer, monkeypatch):
+    _post(client, station, "lost-1")
+    _restart_process(monkeypatch)
+
+    retry = _post(client, station, "lost-1")
+    assert "duplicate" not in retry
+    assert ingestion.WRITE_BUFFER.flush() == 1
+    assert _stored(station)[0] == 1
+
+
+def test_retry_after_a_failed_flush_is_stored(client, station, buffer, monkeypatch):
+    def fail(session, rows):
+        raise OperationalError("INSERT", {}, ConnectionError("server has gone away"))
+
+    _post(client, station, "failed-1")
+    with monkeypatch.context() as patch:
+        patch.setattr(write_buffer, "commit_rows", fail)
+        assert buffer.flush() == 0
+    assert len(buffer) == 1
+    _restart_process(monkeypatch)
+
+    assert "duplicate" not in _post(client, station, "failed-1")
+    assert ingestion.WRITE_BUFFER.flush() == 1
+    assert _stored(station)[0] == 1
+
+
+def test_retry_after_flush_is_a_duplicate(client, station, buffer, monkeypatch):
+    _post(client, station, "flushed-1")
+    buffer.flush()
+    _restart_process(monkeypatch)
+
+    assert _post(client, station, "flushed-1").get("duplicate") is True
+    assert len(ingestion.WRITE_BUFFER) == 0
+
+
+def test_same_key_buffered_twice_is_written_once(client, station, buffer, monkeypatch):
+    _post(client, station, "twice-1")
+    monkeypatch.setattr(DEDUP, "recent", RecentKeys(100, 60.0))
+    _post(client, station, "twice-1")
+
+    assert len(buffer) == 2
+    assert buffer.flush() == 1
+    assert _stored(station)[0] == 1
+
+
+def test_rejected_packet_is_dropped_and_the_rest_written(
+    client, station, buffer, monkeypatch
+):
+    def reject_bad_value(session, rows):
+        if any(row["CO"] == 9999.0 for _, row in rows):
+            raise DataError("INSERT", {}, ValueError("Out of range value for 'CO'"))
+        commit_rows(session, rows)
+
+    monkeypatch.setattr(write_buffer, "commit_rows", reject_bad_value)
+    for value in (1.0, 2.0, 9999.0, 3.0):
+        payload = {"station_code": station, "CO": value, "timestamp": int(time.time())}
+        assert client.post("/ingest", json=payload, headers=HEADERS).status_code == 200
+    dropped = WRITE_BUFFER_DROPPED.labels().value
+
+    assert buffer.flush() == 3
+    assert len(buffer) == 0
+    assert _stored(station)[0] == 3
+    assert WRITE_BUFFER_DROPPED.labels().value == dropped + 1